@@ -31,17 +31,39 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
-import os, datetime, traceback, requests, json
+import os, datetime, traceback, json, asyncio, contextvars, time, functools, base64, multiprocessing, re, threading
 import discord
 
+from collections                    import Counter, defaultdict
+from concurrent.futures             import ThreadPoolExecutor, ProcessPoolExecutor
+
 from oauth2client.client            import HttpAccessTokenRefreshError
 from googleapiclient.discovery      import build, build_from_document
+from googleapiclient.errors         import HttpError
 from oauth2client.file              import Storage
 from oauth2client                   import client, tools
 from google.oauth2.credentials      import Credentials
+import google.auth.transport.requests
+from google_auth_httplib2           import AuthorizedHttp
 
 from dotenv                         import load_dotenv
 
+from query_cache                    import QueryCache
+from analytics_store                import AnalyticsStore
+from metadata_cache                 import MetadataCache
+from singleflight                   import SingleFlight
+from quota                          import QuotaMeter, QuotaDeferred
+from rate_limit                     import TokenBucket, DeadlineExceeded, error_reason, is_throttled, is_transient, backoff, NETWORK_ERRORS
+from http_pool                      import PooledHttp, create_session, pool_stats
+from metrics                        import REGISTRY
+from channels                       import ChannelRegistry, DEFAULT_TENANT
+from reports                        import REPORTS, ReportResult, RowSet, STATS_METRICS, format_range, truncate, EMBED_FIELDS, FIELD_VALUE_CHARACTERS
+from exports                        import ExportWriter
+from charts                         import render_trend
+from compare                        import Series, compare, ROLLING_DAYS
+from anomalies                      import AnomalyMonitor
+from profiler                       import phase, in_phase, profile_call
+
 # Load the .env file & assign the variables
 load_dotenv()
 
@@ -49,24 +71,160 @@ YOUTUBE_API_KEY = os.environ["YOUTUBE_API_KEY"]
 
 DEV_MODE = (os.environ.get("DEV_MODE", "False").lower() == "true")
 
-if DEV_MODE:
+# Printed by the bot & the command line on startup, not on import (chart workers import this module again)
+def print_dev_mode():
+    if not DEV_MODE: return
     print("- " * 25)
     print("Attention: Developer mode enabled.")
     print("The program will rely on the CLIENT_SECRET JSON Dict assigned to the proper .env variable.")
     print("It will not search for or use a CLIENT_SECRET.json file.")
     print("- " * 25)
 
+if DEV_MODE:
     try:
         CLIENT_SECRETS = json.loads(os.environ.get("CLIENT_SECRET", None))['installed']
     except: raise Exception("CLIENT_SECRET is missing within .env file, please add it and try again.")
 
 else:
     CLIENT_SECRETS = os.environ.get("CLIENT_PATH", "CLIENT_SECRET.json")
-    
+
+# Build the API services from the discovery documents bundled in API_Service/ instead of downloading them
+BUNDLED_DISCOVERY = (os.environ.get("BUNDLED_DISCOVERY", "False").lower() == "true")
+
+# Maximum number of Google API calls allowed to run at the same time
+API_WORKERS = int(os.environ.get("API_WORKERS", 8))
+
+# Other YouTube channels served by this bot (JSON file, see README), live channel clients kept before the least recently used
+# is dropped & API calls each channel may run at the same time
+CHANNELS_CONFIG = os.environ.get("CHANNELS_CONFIG", "channels.json")
+CHANNEL_CLIENTS = int(os.environ.get("CHANNEL_CLIENTS", 32))
+CHANNEL_CONCURRENCY = int(os.environ["CHANNEL_CONCURRENCY"]) if os.environ.get("CHANNEL_CONCURRENCY") else None
+
+# Keep-alive connections kept open per Google host (shared by every worker thread) & seconds before a request times out
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", API_WORKERS))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 60))
+
+# Analytics query cache: memory bound, TTL for ranges including recent days, TTL for finalized ranges & YouTube's finalization lag (days)
+QUERY_CACHE_MB = float(os.environ.get("QUERY_CACHE_MB", 32))
+QUERY_CACHE_TTL = int(os.environ.get("QUERY_CACHE_TTL", 300))
+QUERY_CACHE_FINALIZED_TTL = int(os.environ.get("QUERY_CACHE_FINALIZED_TTL", 86400))
+DATA_FINALIZATION_DAYS = int(os.environ.get("DATA_FINALIZATION_DAYS", 3))
+
+# Local SQLite store of daily channel metrics, used to answer !stats style reports without re-querying finalized days
+USE_ANALYTICS_STORE = (os.environ.get("ANALYTICS_STORE", "True").lower() == "true")
+ANALYTICS_DB = os.environ.get("ANALYTICS_DB", "analytics.db")
+
+# Daily quota budgets (units) per API, share kept for interactive commands & per-method unit costs overrides
+QUOTA_BUDGET = int(os.environ.get("QUOTA_BUDGET", 10000))
+ANALYTICS_QUOTA_BUDGET = int(os.environ.get("ANALYTICS_QUOTA_BUDGET", 10000))
+QUOTA_RESERVE = float(os.environ.get("QUOTA_RESERVE", 0.2))
+try:
+    QUOTA_COSTS = {'youtube.search.list': 100, **json.loads(os.environ.get("QUOTA_COSTS", "{}"))}
+except json.JSONDecodeError:
+    raise Exception("QUOTA_COSTS in .env is not a valid JSON string.")
+
+# Requests per second sent to each API (halved while Google throttles us), retries for transient errors & seconds a command may take
+API_RATE_LIMIT = float(os.environ.get("API_RATE_LIMIT", 10))
+API_MAX_RETRIES = int(os.environ.get("API_MAX_RETRIES", 4))
+COMMAND_DEADLINE = float(os.environ.get("COMMAND_DEADLINE", 60))
+
+# Seconds before the access token expires that it is refreshed in the background
+TOKEN_REFRESH_MARGIN = int(os.environ.get("TOKEN_REFRESH_MARGIN", 300))
+
+# Rows per page of a paginated report (!pages), at most 23 so a page and its total fit in one embed
+REPORT_PAGE_SIZE = min(23, int(os.environ.get("REPORT_PAGE_SIZE", 10)))
+
+# Days of an export (!export) fetched at the same time, and rows per page of each day (the Analytics API allows at most 200)
+EXPORT_CONCURRENCY = int(os.environ.get("EXPORT_CONCURRENCY", 4))
+EXPORT_PAGE_SIZE = min(200, int(os.environ.get("EXPORT_PAGE_SIZE", 200)))
+
+# Processes rendering !trend charts, and the memory limit of the rendered chart cache (MB)
+CHART_WORKERS = int(os.environ.get("CHART_WORKERS", 2))
+CHART_CACHE_MB = float(os.environ.get("CHART_CACHE_MB", 16))
+
+# Daily metrics watched for anomalies, how far (in standard deviations) from their baseline a day has to be to alert,
+# how quickly the baselines follow new days (0-1) & how many days back the newest complete day is (revenue & CPM of more recent days
+# aren't final, their undercounted values would alert as drops)
+ANOMALY_METRICS = os.environ.get("ANOMALY_METRICS", "views,estimatedRevenue,cpm,subscribersGained").split(',')
+ANOMALY_THRESHOLD = float(os.environ.get("ANOMALY_THRESHOLD", 3.0))
+ANOMALY_ALPHA = float(os.environ.get("ANOMALY_ALPHA", 0.1))
+ANOMALY_LAG_DAYS = int(os.environ.get("ANOMALY_LAG_DAYS", DATA_FINALIZATION_DAYS))
+# Days of history the baselines start from, fetched once on the first poll
+ANOMALY_SEED_DAYS = 56
+
+# Seconds before cached video/playlist titles are revalidated (stored in ANALYTICS_DB)
+METADATA_TTL = int(os.environ.get("METADATA_TTL", 24 * 60 * 60))
+
+# Request instrumentation, exposed on the keep alive server's /metrics
+API_SECONDS = REGISTRY.histogram('youtube_api_request_seconds', 'Time to answer an API request by API, method and source (cache or api), including retries', ('api', 'method', 'source'))
+API_ERRORS = REGISTRY.counter('youtube_api_errors_total', 'API requests that failed by API, method and error reason', ('api', 'method', 'reason'))
+API_IN_FLIGHT = REGISTRY.gauge('youtube_api_requests_in_flight', 'API requests (or batches) being sent', ('api',))
+TOKEN_REFRESH_SECONDS = REGISTRY.histogram('youtube_token_refresh_seconds', 'Access token refreshes by HTTP status', ('status',))
+
 # Declare global scope
 SCOPES = ["https://www.googleapis.com/auth/youtube.readonly",
           "https://www.googleapis.com/auth/yt-analytics-monetary.readonly"]
 
+ANALYTICS_API = 'youtubeAnalytics'
+DATA_API = 'youtube'
+
+# First day YouTube analytics can be queried for
+LIFETIME_START = '2005-02-14'
+
+# Maximum ids per Data API list call & requests per batch
+METADATA_CHUNK = 50
+BATCH_LIMIT = 50
+
+# Name of the bot command (or background job) the current task runs for, whether it is background work & the YouTube channel it is for
+CURRENT_COMMAND = contextvars.ContextVar('CURRENT_COMMAND', default='other')
+BACKGROUND = contextvars.ContextVar('BACKGROUND', default=False)
+DEADLINE = contextvars.ContextVar('DEADLINE', default=None)
+TENANT = contextvars.ContextVar('TENANT', default=DEFAULT_TENANT)
+
+API_SERVICE_DIR = os.environ.get("API_SERVICE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'API_Service'))
+DISCOVERY_DOCUMENTS = {ANALYTICS_API: os.path.join(API_SERVICE_DIR, 'Analytics-Service.json'), DATA_API: os.path.join(API_SERVICE_DIR, 'YouTube-Data-API.json')}
+API_VERSIONS = {ANALYTICS_API: 'v2', DATA_API: 'v3'}
+
+# Credentials the default channel's services were built with, the token refresh swaps the access token in place
+SERVICE_CREDENTIALS = {}
+
+# Stand-in that builds its object on first use. Chart workers import this module again (through main.py) without ever using
+# the stores & registry, so they are only opened by the process that does
+class Lazy:
+    def __init__(self, factory):
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.target = None
+
+    def __getattr__(self, name):
+        if self.target is None:
+            with self.lock:
+                if self.target is None: self.target = self.factory()
+        return getattr(self.target, name)
+
+CHANNELS = Lazy(lambda: ChannelRegistry.from_file(CHANNELS_CONFIG, CHANNEL_CLIENTS, CHANNEL_CONCURRENCY, API_WORKERS))
+
+# Every Google endpoint (both APIs, discovery & OAuth token refresh) goes through this pool, so TLS connections are reused
+HTTP_SESSION = create_session(HTTP_POOL_SIZE)
+
+# Credentials patch the transport they authorize, so each service gets its own facade over the shared pool
+def authorized_http(credentials):
+    http = PooledHttp(HTTP_SESSION, HTTP_TIMEOUT)
+    if credentials is None: return http
+    if isinstance(credentials, Credentials): return AuthorizedHttp(credentials, http=http)
+    return credentials.authorize(http)
+
+# Parsed once per process, every service (and worker thread copy) built from a bundled document shares it
+@functools.lru_cache(maxsize=None)
+def load_discovery(API_SERVICE_NAME):
+    with open(DISCOVERY_DOCUMENTS[API_SERVICE_NAME]) as f:
+        return json.load(f)
+
+def build_service(API_SERVICE_NAME, API_VERSION, credentials):
+    if BUNDLED_DISCOVERY:
+        return build_from_document(load_discovery(API_SERVICE_NAME), http=authorized_http(credentials))
+    return build(API_SERVICE_NAME, API_VERSION, http=authorized_http(credentials))
+
 def get_service (API_SERVICE_NAME='youtubeAnalytics', API_VERSION='v2', SCOPES=SCOPES):
     global DEV_MODE, CLIENT_SECRETS
 
@@ -74,7 +232,8 @@ def get_service (API_SERVICE_NAME='youtubeAnalytics', API_VERSION='v2', SCOPES=S
     if DEV_MODE:
         try:
             credentials = Credentials.from_authorized_user_info(CLIENT_SECRETS)
-            return build(API_SERVICE_NAME, API_VERSION, credentials=credentials)
+            SERVICE_CREDENTIALS[API_SERVICE_NAME] = credentials
+            return build_service(API_SERVICE_NAME, API_VERSION, credentials)
         except: print(f'Failed to build service:\n{traceback.format_exc()}')
 
     try:
@@ -84,20 +243,26 @@ def get_service (API_SERVICE_NAME='youtubeAnalytics', API_VERSION='v2', SCOPES=S
         if not credentials or credentials.invalid:
             flow = client.flow_from_clientsecrets(CLIENT_SECRETS, SCOPES)
             credentials = tools.run_flow(flow, store)
-        return build(API_SERVICE_NAME, API_VERSION, credentials=credentials)
+        SERVICE_CREDENTIALS[API_SERVICE_NAME] = credentials
+        return build_service(API_SERVICE_NAME, API_VERSION, credentials)
     except: print(f'Failed to run client flow service: \n{traceback.format_exc()}')
     
     try:
         credentials = Credentials.from_authorized_user_info(CLIENT_SECRETS)
-        json_path = 'API_Service/Analytics-Service.json' if API_SERVICE_NAME == 'youtubeAnalytics' else 'API_Service/YouTube-Data-API.json'
-        print(f'Building failed (This is expected behavior on replit.com), trying to build from document: {json_path}')
-        with open(json_path) as f:
-            service = json.load(f)
-        return build_from_document(service, credentials = credentials)
+        print(f'Building failed (This is expected behavior on replit.com), trying to build from document: {DISCOVERY_DOCUMENTS[API_SERVICE_NAME]}')
+        SERVICE_CREDENTIALS[API_SERVICE_NAME] = credentials
+        return build_from_document(load_discovery(API_SERVICE_NAME), http=authorized_http(credentials))
     except Exception as e:
         print(f'Failed: Exhaused all get_service methods: \n{traceback.format_exc()}')
         raise
 
+# Credentials of another channel, either an oauth2client file (like credentials.json, refreshed tokens are saved back to it)
+# or authorized user info with a refresh token (like CLIENT_SECRET)
+def load_credentials(path):
+    info = read_json(path)
+    if '_module' in info: return Storage(path).get()
+    return Credentials.from_authorized_user_info(info.get('installed', info), SCOPES)
+
 # Swap between dev mode and normal mode
 async def dev_mode():
     global DEV_MODE, CLIENT_SECRETS
@@ -116,475 +281,771 @@ async def dev_mode():
     else:
         CLIENT_SECRETS = os.environ.get("CLIENT_PATH", "CLIENT_SECRET.json")
         
-def refresh_token (token=None):
-    print(f'Refreshing Credentials Access Token...')
-    global DEV_MODE
-    if DEV_MODE:
-        global CLIENT_SECRETS
-        global YOUTUBE_ANALYTICS
-        global YOUTUBE_DATA
+TOKEN_URI = 'https://accounts.google.com/o/oauth2/token'
+EXPIRY_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# Held while the access token is refreshed, API requests wait for it instead of racing the swap
+TOKEN_LOCK = asyncio.Lock()
+# UTC expiry of the current access token, None until the first refresh
+TOKEN_EXPIRY = None
+
+# Write to a temporary file and swap it in, so a concurrent reader never sees a partially written file
+def write_json_atomic(path, data):
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f'{path}.tmp', path)
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+# Hand the new access token to the credentials the services (and their worker thread copies) were built with,
+# so nothing has to be rebuilt
+def swap_credentials(access_token, expiry):
+    for credentials in SERVICE_CREDENTIALS.values():
+        if isinstance(credentials, Credentials):
+            credentials.token = access_token
+            credentials.expiry = expiry.replace(tzinfo=None)
+        else:
+            credentials.access_token = access_token
+            credentials.token_expiry = expiry.replace(tzinfo=None)
+            credentials.invalid = False
 
-        if token is not None:
-            try:
-                refresh_token = {"refresh_token": token}
-                CLIENT_SECRETS.update(refresh_token)
-                return f"Dev Mode: Successfully updated refresh token to {token}\nYou will need to update if the bot is restarted.\n"
-            except Exception as e: return f"Ran into {e.__class__.__name__} Exception: {e}"
+async def refresh_token (token=None):
+    global TOKEN_EXPIRY
+    print(f'Refreshing Credentials Access Token...')
+    async with TOKEN_LOCK:
+        if DEV_MODE:
+            if token is not None:
+                try:
+                    CLIENT_SECRETS.update({"refresh_token": token})
+                    return f"Dev Mode: Successfully updated refresh token to {token}\nYou will need to update if the bot is restarted.\n"
+                except Exception as e: return f"Ran into {e.__class__.__name__} Exception: {e}"
+            cred = CLIENT_SECRETS
+        else:
+            cred = await asyncio.to_thread(read_json, 'credentials.json')
 
         data = {
-            'client_id': CLIENT_SECRETS['client_id'],
-            'client_secret': CLIENT_SECRETS['client_secret'],
-            'refresh_token': CLIENT_SECRETS['refresh_token'],
+            'client_id': cred['client_id'],
+            'client_secret': cred['client_secret'],
+            'refresh_token': cred['refresh_token'],
             'grant_type': 'refresh_token'
         }
-        response = requests.post('https://accounts.google.com/o/oauth2/token', data=data)
-        if response.status_code == 200:
-            response_json = response.json()
+        began = time.perf_counter()
+        try:
+            response = await asyncio.to_thread(HTTP_SESSION.post, TOKEN_URI, data=data, timeout=30)
+        except Exception as e:
+            TOKEN_REFRESH_SECONDS.observe(time.perf_counter() - began, status=e.__class__.__name__)
+            raise
+        TOKEN_REFRESH_SECONDS.observe(time.perf_counter() - began, status=response.status_code)
+        if response.status_code != 200:
+            return f"{response.status_code}:\tFalied to refresh token\t{datetime.datetime.now()}\n{response.text}"
+
+        response_json = response.json()
+        expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=response_json['expires_in'])
+        if DEV_MODE:
             CLIENT_SECRETS['access_token'] = response_json['access_token']
             CLIENT_SECRETS['expires_in'] = response_json['expires_in']
-
-            # Calculate and update token expiry time
-            now = datetime.datetime.now()
-            CLIENT_SECRETS['token_expiry'] = (now + datetime.timedelta(seconds=response_json['expires_in'])).isoformat()
-
-            message = f"{response.status_code}:\tSuccessfully refreshed token\n{datetime.datetime.now()}\n"
-            YOUTUBE_ANALYTICS = get_service()
-            YOUTUBE_DATA = get_service('youtube', 'v3', SCOPES)
+            CLIENT_SECRETS['token_expiry'] = expiry.strftime(EXPIRY_FORMAT)
+            # Read by Credentials.from_authorized_user_info when a service is built later
+            CLIENT_SECRETS['token'], CLIENT_SECRETS['expiry'] = response_json['access_token'], expiry.strftime(EXPIRY_FORMAT)
         else:
-            message = f"{response.status_code}:\tFalied to refresh token\t{datetime.datetime.now()}\n{response.text}"
-    else:
-        message = None
-        with open('credentials.json') as f:
-            cred = json.load(f)
-            data = {
-                'client_id': cred['client_id'],
-                'client_secret': cred['client_secret'],
-                'refresh_token': cred['refresh_token'],
-                'grant_type': 'refresh_token'
-            }
-
-            response = requests.post('https://accounts.google.com/o/oauth2/token', data=data)
-            if response.status_code == 200:
-                response_json = response.json()
-            
-                # Update token_response with new access token and expiry time
-                cred['token_response']['access_token'] = response_json['access_token']
-                cred['token_response']['expires_in'] = response_json['expires_in']
-                
-                # Calculate and update token expiry time
-                now = datetime.datetime.now()
-                cred['token_expiry'] = (now + datetime.timedelta(seconds=response_json['expires_in'])).isoformat()
-                message = f"{response.status_code}:\tSuccessfully refreshed token\n{datetime.datetime.now()}\n"
-                # Save updated credentials to file
-                with open('credentials.json', 'w') as f:
-                    json.dump(cred, f)
-            else:
-                message = f"{response.status_code}:\tFalied to refresh token\t{datetime.datetime.now()}\n{response.text}"
-    return message
-
-
+            # Update the access token oauth2client reads, the token_response copy and expiry time, then save to file
+            cred['access_token'] = response_json['access_token']
+            cred.setdefault('token_response', {}).update(access_token=response_json['access_token'], expires_in=response_json['expires_in'])
+            cred['token_expiry'] = expiry.strftime(EXPIRY_FORMAT)
+            cred['invalid'] = False
+            await asyncio.to_thread(write_json_atomic, 'credentials.json', cred)
+
+        swap_credentials(response_json['access_token'], expiry)
+        TOKEN_EXPIRY = expiry
+        return f"{response.status_code}:\tSuccessfully refreshed token\n{datetime.datetime.now()}\n"
+
+# Refresh the access token `margin` seconds before it expires, so commands never run with an expired token
+async def token_refresh_loop(margin=TOKEN_REFRESH_MARGIN):
+    while True:
+        delay = 0 if TOKEN_EXPIRY is None else (TOKEN_EXPIRY - datetime.datetime.now(datetime.timezone.utc)).total_seconds() - margin
+        if delay > 0:
+            # Re-checked every minute, a manual !refresh moves the expiry
+            await asyncio.sleep(min(delay, 60))
+            continue
+        try:
+            message = await refresh_token()
+            print(message)
+            if TOKEN_EXPIRY is None or 'Successfully' not in message: await asyncio.sleep(60)
+        except Exception:
+            print(f'Background token refresh failed:\n{traceback.format_exc()}')
+            await asyncio.sleep(60)
+
+# Other channels' credentials refresh themselves once expired, this forces it
+async def refresh_tenant_token(tenant):
+    client = CHANNELS.client(tenant)
+    try:
+        credentials = next(iter(client.credentials.values()), None) or await asyncio.to_thread(load_credentials, client.tenant.credentials)
+        if isinstance(credentials, Credentials):
+            await asyncio.to_thread(credentials.refresh, google.auth.transport.requests.Request(HTTP_SESSION))
+        else:
+            await asyncio.to_thread(credentials.refresh, PooledHttp(HTTP_SESSION, HTTP_TIMEOUT))
+    except Exception as e:
+        return f"Failed to refresh token for {tenant}\t{datetime.datetime.now()}\n{e.__class__.__name__}: {e}"
+    for api in API_VERSIONS: client.credentials.setdefault(api, credentials)
+    return f"Successfully refreshed token for {tenant}\n{datetime.datetime.now()}\n"
 
 # Refresh the token
 async def refresh(return_embed=False, token=None):
-    message = refresh_token(token)
+    tenant = TENANT.get()
+    message = await refresh_token(token) if tenant == DEFAULT_TENANT else await refresh_tenant_token(tenant)
     if return_embed:
         embed = discord.Embed(title=f"YouTube Analytics Bot Refresh", color=0x00ff00)
         embed.add_field(name="Status", value=message, inline=False)
         return embed
     else:
         return message
-def execute_api_request(client_library_function, **kwargs):
-    return client_library_function(**kwargs).execute()
 
-# Discord bot command methods.
-async def get_stats (start=datetime.datetime.now().strftime("%Y-%m-01"), end=datetime.datetime.now().strftime("%Y-%m-%d")):
+# Worker pool for the blocking Google API calls, keeps the Discord event loop free while requests are in flight
+API_EXECUTOR = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix='youtube-api')
+
+# Chart rendering is CPU bound, so it runs in worker processes instead of threads (which would hold the GIL & stall the event loop).
+# Workers start from the forkserver (or are spawned where there is none) rather than forking this process, whose other threads could
+# hold a lock the child would inherit forever. The forkserver only preloads charts.py, but each worker still imports main.py again,
+# so its bot only starts under __main__ & the stores it imports are Lazy
+def chart_context():
+    if 'forkserver' not in multiprocessing.get_all_start_methods(): return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['charts'])
+    return context
+
+CHART_POOL = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=chart_context())
+
+# Services are built on first use (from a worker thread), so importing this module never touches the network
+def client_service(client, api):
+    service = client.services.get(api)
+    if service is not None: return service
+
+    with client.lock:
+        service = client.services.get(api)
+        if service is None:
+            began = time.perf_counter()
+            if client.tenant.name == DEFAULT_TENANT:
+                service = get_service(api, API_VERSIONS[api], SCOPES)
+                client.credentials[api] = SERVICE_CREDENTIALS.get(api)
+            else:
+                # Both APIs of a channel share one credentials object, so a refresh by either is seen by both
+                credentials = next(iter(client.credentials.values()), None) or load_credentials(client.tenant.credentials)
+                client.credentials[api] = credentials
+                service = build_service(api, API_VERSIONS[api], credentials)
+            client.services[api] = service
+            print(f'Built {api} service for {client.tenant.name} in {time.perf_counter() - began:.2f}s')
+    return service
+
+def base_service(api, tenant=DEFAULT_TENANT):
+    return client_service(CHANNELS.client(tenant), api)
+
+# Services aren't thread-safe, so every worker thread builds its own from the parsed discovery document (the connections are shared)
+def thread_service(api, tenant=DEFAULT_TENANT):
+    client = CHANNELS.client(tenant)
+    services = client.threads.__dict__.setdefault('services', {})
+    if api not in services:
+        base = client_service(client, api)
+        services[api] = build_from_document(base._rootDesc, http=authorized_http(client.credentials.get(api)))
+    return services[api]
+
+def run_api_request(api, method, kwargs, headers=None, tenant=DEFAULT_TENANT):
+    resource, name = method.split('.')
+    service = thread_service(api, tenant)
+    request = getattr(getattr(service, resource)(), name)(**kwargs)
+    if headers: request.headers.update(headers)
+    return request.execute()
+
+# Meter the current task's requests under `name`. The task is named after it too, so the event loop watchdog can tell what was running
+def set_command(name):
+    CURRENT_COMMAND.set(name)
+    task = asyncio.current_task()
+    if task is not None: task.set_name(name)
+
+# Mark the current task as a background job, so its requests are metered under `name` and yield to interactive commands
+def background_job(name):
+    set_command(name)
+    BACKGROUND.set(True)
+
+# Give the current command `seconds` to finish its API requests, including retries
+def set_deadline(seconds=COMMAND_DEADLINE):
+    DEADLINE.set(time.monotonic() + seconds)
+
+def remaining_time():
+    deadline = DEADLINE.get()
+    if deadline is None: return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0: raise DeadlineExceeded(f'{CURRENT_COMMAND.get()} ran out of time ({COMMAND_DEADLINE:g}s)')
+    return remaining
+
+# Requests are metered even when they fail, Google charges for those too
+def run_metered_request(api, method, kwargs, headers, tenant, command):
+    try: return run_api_request(api, method, kwargs, headers, tenant)
+    finally: QUOTA.record(tenant, api, method, command)
+
+# Send several requests for the same method as one multipart batch (a single round trip), results are returned in order
+def run_batch_request(api, method, requests, tenant=DEFAULT_TENANT):
+    resource, name = method.split('.')
+    service = thread_service(api, tenant)
+    results = [None] * len(requests)
+
+    def callback(request_id, response, exception):
+        results[int(request_id)] = exception if exception is not None else response
+
+    batch = service.new_batch_http_request(callback=callback)
+    for i, (kwargs, headers) in enumerate(requests):
+        request = getattr(getattr(service, resource)(), name)(**kwargs)
+        if headers: request.headers.update(headers)
+        batch.add(request, request_id=str(i))
+    batch.execute()
+    return results
+
+def run_metered_batch(api, method, requests, tenant, command):
+    try: return run_batch_request(api, method, requests, tenant)
+    finally: QUOTA.record(tenant, api, method, command, calls=len(requests))
+
+QUERY_CACHE = QueryCache(int(QUERY_CACHE_MB * 1024 * 1024), QUERY_CACHE_TTL, QUERY_CACHE_FINALIZED_TTL, DATA_FINALIZATION_DAYS)
+IN_FLIGHT = SingleFlight()
+# Rendered charts (base64 PNG) by query & style, kept as long as the query they were drawn from would be
+CHART_CACHE = QueryCache(int(CHART_CACHE_MB * 1024 * 1024), QUERY_CACHE_TTL, QUERY_CACHE_FINALIZED_TTL, DATA_FINALIZATION_DAYS)
+QUOTA = Lazy(lambda: QuotaMeter(ANALYTICS_DB, {DATA_API: QUOTA_BUDGET, ANALYTICS_API: ANALYTICS_QUOTA_BUDGET}, QUOTA_COSTS, QUOTA_RESERVE,
+                                {name: tenant.budgets for name, tenant in CHANNELS.tenants.items() if tenant.budgets}))
+
+# Background jobs only get a share of the workers, so interactive commands never queue behind bulk work
+BACKGROUND_LANE = asyncio.Semaphore(max(1, API_WORKERS // 4))
+
+RETRY_COUNTS = Counter()
+
+# Every channel has its own rate limiters, so one being throttled doesn't slow the others down
+def rate_limiter(api):
+    limiters = CHANNELS.tenant(TENANT.get()).limiters
+    if api not in limiters: limiters[api] = TokenBucket(API_RATE_LIMIT, burst=max(1, API_RATE_LIMIT))
+    return limiters[api]
+
+# Loading a quota day's usage queries SQLite, so the first load & the one at each rollover run off the event loop
+async def refresh_quota():
+    if QUOTA.target is None or QUOTA.stale(): await asyncio.to_thread(lambda: QUOTA.refresh())
+
+async def check_quota(api, method):
+    await refresh_quota()
+    tenant = TENANT.get()
+    if not QUOTA.allow(tenant, api, BACKGROUND.get()):
+        raise QuotaDeferred(f"{api} quota of {tenant} is low ({QUOTA.remaining(tenant, api):,} units left), deferring {CURRENT_COMMAND.get()} ({method})")
+
+# Run on the worker pool, background requests wait for a slot in the background lane first. A channel never holds more than
+# its concurrency limit of workers, so a busy channel can't starve the others
+async def run_in_pool(function, *args):
+    loop = asyncio.get_running_loop()
+    tenant = CHANNELS.tenant(TENANT.get())
+    args = (*args, tenant.name, CURRENT_COMMAND.get())
+    if not BACKGROUND.get():
+        async with tenant.semaphore:
+            return await loop.run_in_executor(API_EXECUTOR, function, *args)
+    async with BACKGROUND_LANE, tenant.semaphore:
+        return await loop.run_in_executor(API_EXECUTOR, function, *args)
+
+# Rate limited send, transient errors (throttling, 5xx, dropped connections) are retried with backoff until the deadline
+async def send_with_retries(api, function, *args):
+    limiter = rate_limiter(api)
+    attempt = 0
+    while True:
+        await limiter.acquire(DEADLINE.get())
+        try:
+            response = await run_in_pool(function, api, *args)
+            limiter.succeeded()
+            return response
+        except Exception as e:
+            if not is_transient(e) or attempt >= API_MAX_RETRIES: raise
+            if is_throttled(e): limiter.throttled()
+            delay = backoff(attempt)
+            remaining = remaining_time()
+            if remaining is not None and delay >= remaining: raise
+            RETRY_COUNTS[f'{api} {error_reason(e)}'] += 1
+            print(f'{api} request failed with {error_reason(e)}, retrying in {delay:.1f}s ({attempt + 1}/{API_MAX_RETRIES})')
+            await asyncio.sleep(delay)
+            attempt += 1
+
+# A 304 answers a conditional request (If-None-Match), it isn't a failure
+def is_not_modified(error):
+    return isinstance(error, HttpError) and error.resp.status == 304
+
+# Explain an API failure to the user without dumping a traceback in the channel
+def describe_api_error(error):
+    print(f'{error.__class__.__name__}: {error}')
+    if isinstance(error, HttpError):
+        return f"YouTube API request failed ({error.resp.status} {error_reason(error)}): {error.reason}"
+    return f"YouTube API request failed: {error}"
+
+# Run a Google API request (e.g. 'reports.query', 'videos.list') on the worker pool and await its response.
+# Identical requests already in flight are awaited instead of being sent again
+@in_phase('api')
+async def execute_api_request(api, method, headers=None, cache=True, **kwargs):
+    began = time.perf_counter()
+    # 'channel==MINE' means a different channel for every tenant
+    key = f'{TENANT.get()}:{QUERY_CACHE.make_key(api, method, kwargs)}'
+    cacheable = cache and api == ANALYTICS_API and method == 'reports.query'
+    if cacheable:
+        response = QUERY_CACHE.get(key)
+        if response is not None:
+            API_SECONDS.observe(time.perf_counter() - began, api=api, method=method, source='cache')
+            return response
+
+    async def fetch():
+        # Wait out a token refresh in progress
+        if TOKEN_LOCK.locked():
+            async with TOKEN_LOCK: pass
+        with API_IN_FLIGHT.track(api=api):
+            response = await send_with_retries(api, run_metered_request, method, kwargs, headers)
+        if cacheable: QUERY_CACHE.set(key, response, QUERY_CACHE.ttl_for(kwargs))
+        return response
+
+    # A command past its deadline stops waiting, the shared request still completes for the other waiters. Commands never join
+    # a background job's request, which waits in the background lane & runs until the job's deadline
     try:
-        # Query the YouTube Analytics API
-        response = execute_api_request(
-            YOUTUBE_ANALYTICS.reports().query,
+        await check_quota(api, method)
+        response = await asyncio.wait_for(IN_FLIGHT.do(key + json.dumps([headers, BACKGROUND.get()]), fetch), remaining_time())
+    except asyncio.TimeoutError:
+        API_ERRORS.inc(api=api, method=method, reason='DeadlineExceeded')
+        raise DeadlineExceeded(f'{CURRENT_COMMAND.get()} ran out of time ({COMMAND_DEADLINE:g}s)')
+    except Exception as e:
+        if is_not_modified(e): API_SECONDS.observe(time.perf_counter() - began, api=api, method=method, source='api')
+        else: API_ERRORS.inc(api=api, method=method, reason=error_reason(e))
+        raise
+    API_SECONDS.observe(time.perf_counter() - began, api=api, method=method, source='api')
+    return response
+
+# Batch (kwargs, headers) requests, results are responses or the HttpError raised for that request
+@in_phase('api')
+async def execute_batch_request(api, method, requests):
+    if len(requests) == 1:
+        try: return [await execute_api_request(api, method, headers=requests[0][1], **requests[0][0])]
+        except HttpError as e: return [e]
+
+    began = time.perf_counter()
+    await check_quota(api, method)
+    if TOKEN_LOCK.locked():
+        async with TOKEN_LOCK: pass
+    results = [None] * len(requests)
+    pending = list(range(len(requests)))
+    # Requests that failed inside the batch with a transient error are sent again in the next batch
+    for attempt in range(API_MAX_RETRIES + 1):
+        for i in range(0, len(pending), BATCH_LIMIT):
+            chunk = pending[i:i + BATCH_LIMIT]
+            try:
+                with API_IN_FLIGHT.track(api=api):
+                    responses = await send_with_retries(api, run_metered_batch, method, [requests[index] for index in chunk])
+            except Exception as e:
+                API_ERRORS.inc(api=api, method=method, reason=error_reason(e))
+                raise
+            for index, response in zip(chunk, responses): results[index] = response
+
+        pending = [index for index in pending if isinstance(results[index], Exception) and is_transient(results[index])]
+        if not pending or attempt == API_MAX_RETRIES: break
+        delay, remaining = backoff(attempt), remaining_time()
+        if remaining is not None and delay >= remaining: break
+        for index in pending: RETRY_COUNTS[f'{api} {error_reason(results[index])}'] += 1
+        await asyncio.sleep(delay)
+    for result in results:
+        if isinstance(result, Exception) and not is_not_modified(result):
+            API_ERRORS.inc(api=api, method=method, reason=error_reason(result))
+    API_SECONDS.observe(time.perf_counter() - began, api=api, method=method, source='batch')
+    return results
+
+ANALYTICS_STORE = Lazy(lambda: AnalyticsStore(ANALYTICS_DB, STATS_METRICS.split(','), DATA_FINALIZATION_DAYS)) if USE_ANALYTICS_STORE else None
+STORE_LOCKS = defaultdict(asyncio.Lock)
+
+# Key of the current channel's rows, the default channel keeps the one it was stored under before other channels were added
+def store_channel():
+    tenant = TENANT.get()
+    return 'MINE' if tenant == DEFAULT_TENANT else tenant
+
+# Fetch the days missing from the analytics store (and the ones not finalized yet), returns the number of queries made.
+# The lock only covers reading & saving the store, so a !stats isn't queued behind a backfill's fetches. Syncs missing the
+# same range share its request through execute_api_request's in-flight coalescing
+async def sync_analytics_store(start=LIFETIME_START, end=None):
+    end = end or datetime.datetime.now().strftime("%Y-%m-%d")
+    channel = store_channel()
+    async with STORE_LOCKS[channel]:
+        ranges = await asyncio.to_thread(ANALYTICS_STORE.missing_ranges, channel, start, end)
+    for range_start, range_end in ranges:
+        response = await execute_api_request(
+            ANALYTICS_API, 'reports.query',
             ids='channel==MINE',
-            startDate=start,
-            endDate=end,
-            metrics='views,estimatedMinutesWatched,subscribersGained,subscribersLost,estimatedRevenue,cpm,monetizedPlaybacks,playbackBasedCpm,adImpressions,likes,dislikes,averageViewDuration,shares,averageViewPercentage,subscribersGained,subscribersLost',
+            startDate=range_start,
+            endDate=range_end,
+            dimensions='day',
+            metrics=','.join(ANALYTICS_STORE.metrics),
+            sort='day',
         )
+        async with STORE_LOCKS[channel]:
+            await asyncio.to_thread(ANALYTICS_STORE.save, channel, range_start, range_end, response)
+    return len(ranges)
 
-        # Retrieve the data from the response
-        views = response['rows'][0][0]
-        minutes = response['rows'][0][1]
-        subscribersGained = response['rows'][0][2] - response['rows'][0][3]
-        revenue = response['rows'][0][4]
-        cpm = response['rows'][0][5]
-        monetizedPlaybacks = response['rows'][0][6]
-        playbackCpm = response['rows'][0][7]
-        adImpressions = response['rows'][0][8]
-        likes = response['rows'][0][9]
-        dislikes = response['rows'][0][10]
-        averageViewDuration = response['rows'][0][11]
-        shares = response['rows'][0][12]
-        averageViewPercentage = response['rows'][0][13]
-        subscribersGained = response['rows'][0][14]
-        subscribersLost = response['rows'][0][15]
-        netSubscribers = subscribersGained - subscribersLost
-
-        # Terminary operator to check if start/end year share a year, and strip/remove if that's the case
-        start, end = (start[5:] if start[:4] == end[:4] else f'{start[5:]}-{start[:4]}').replace('-', '/'), (end[5:] if start[:4] == end[:4] else f'{end[5:]}-{end[:4]}').replace('-', '/')
-
-        # create a Discord Embed object
-        embed = discord.Embed(title=f"YouTube Analytics Report ({start} - {end})", color=0x00ff00)
-
-        # add fields to the embed
-        embed.add_field(name="Views", value=f"{round(views,2):,}", inline=True)
-        embed.add_field(name="Ratings", value=f"{100*round(likes/(likes + dislikes),2):,}%", inline=True)
-        embed.add_field(name="Minutes Watched", value=f"{round(minutes,2):,}", inline=True)
-        embed.add_field(name="Average View Duration", value=f"{round(averageViewDuration,2):,}s ({round(averageViewPercentage,2):,}%)", inline=True)
-        embed.add_field(name="Net Subscribers", value=f"{round(netSubscribers,2):,}", inline=True)
-        embed.add_field(name="Shares", value=f"{round(shares,2):,}", inline=True)
-        
-        embed.add_field(name="\u200b", value="\u200b", inline=False)
+# Channel totals for get_stats, aggregated from the local store when possible
+async def query_stats(start, end):
+    if ANALYTICS_STORE is not None:
+        try:
+            await sync_analytics_store(start, end)
+            totals = await asyncio.to_thread(ANALYTICS_STORE.aggregate, store_channel(), start, end)
+            metrics = STATS_METRICS.split(',')
+            return {'columnHeaders': [{'name': metric} for metric in metrics], 'rows': [[totals[metric] for metric in metrics]]}
+        except HttpAccessTokenRefreshError: raise
+        except Exception: print(f'Analytics store unavailable, querying the API instead:\n{traceback.format_exc()}')
+
+    return await execute_api_request(
+        ANALYTICS_API, 'reports.query',
+        ids='channel==MINE',
+        startDate=start,
+        endDate=end,
+        metrics=STATS_METRICS,
+    )
+
+# Every channel metric once, day by day, for !compare
+COMPARE_METRICS = list(dict.fromkeys(STATS_METRICS.split(',')))
+
+# Metrics shown on their own in the stats card keep its names (e.g. 'CPM'), others are spelled out ('Subscribers gained')
+METRIC_NAMES = {field[1][1:-1]: field[0] for field in REPORTS['stats'].fields if field and re.fullmatch(r'\{\w+\}', field[1])}
+
+def metric_name(metric):
+    return METRIC_NAMES.get(metric) or re.sub('([A-Z])', r' \1', metric).capitalize()
+
+# Day level channel metrics, from the local store when possible (one query per period either way)
+async def query_daily(start, end):
+    if ANALYTICS_STORE is not None:
+        try:
+            await sync_analytics_store(start, end)
+            return await asyncio.to_thread(ANALYTICS_STORE.daily, store_channel(), start, end)
+        except HttpAccessTokenRefreshError: raise
+        except Exception: print(f'Analytics store unavailable, querying the API instead:\n{traceback.format_exc()}')
+
+    return await execute_api_request(
+        ANALYTICS_API, 'reports.query',
+        ids='channel==MINE',
+        startDate=start,
+        endDate=end,
+        dimensions='day',
+        metrics=','.join(COMPARE_METRICS),
+        sort='day',
+    )
+
+METADATA_CACHE = Lazy(lambda: MetadataCache(ANALYTICS_DB, METADATA_TTL))
+
+def chunk_ids(ids):
+    return [ids[i:i + METADATA_CHUNK] for i in range(0, len(ids), METADATA_CHUNK)]
+
+# Fetch snippets for chunks of up to 50 ids (the Data API limit) sent as one batch. Each chunk carries the ETag of the
+# previous response for the same ids, so unchanged chunks cost a 304
+async def refresh_metadata(kind, chunks):
+    if not chunks: return
+    # Concurrent reports asking for the same titles share one batch (commands & background jobs separately, like other requests)
+    key = json.dumps(['metadata', kind, chunks, BACKGROUND.get()])
+    return await IN_FLIGHT.do(key, lambda: fetch_metadata(kind, chunks))
+
+async def fetch_metadata(kind, chunks):
+    requests = []
+    for chunk in chunks:
+        etag = await asyncio.to_thread(METADATA_CACHE.list_etag, kind, chunk)
+        requests.append(({'part': 'snippet', 'id': ','.join(chunk)}, {'If-None-Match': etag} if etag else None))
+
+    results = await execute_batch_request(DATA_API, f'{kind}.list', requests)
+    for chunk, result in zip(chunks, results):
+        if is_not_modified(result):
+            await asyncio.to_thread(METADATA_CACHE.touch, kind, chunk)
+        elif isinstance(result, Exception):
+            raise result
+        else:
+            await asyncio.to_thread(METADATA_CACHE.save, kind, chunk, result)
+
+# Snippets for 'videos' or 'playlists' ids, keyed by id
+async def get_metadata(kind, ids):
+    fresh, stale, missing = METADATA_CACHE.lookup(kind, ids)
+    await refresh_metadata(kind, chunk_ids(missing) + chunk_ids(stale))
+    return METADATA_CACHE.snippets(kind, ids)
+
+# Revalidate every id set that is expired or will expire within `margin` seconds, so titles are warm before a report needs them
+async def refresh_expiring_metadata(margin=0):
+    refreshed = 0
+    for kind in ('videos', 'playlists'):
+        id_sets = await asyncio.to_thread(METADATA_CACHE.expiring_sets, kind, margin)
+        # Each set is revalidated as its own chunk, so it keeps matching its stored ETag
+        await refresh_metadata(kind, [chunk for ids in id_sets for chunk in chunk_ids(ids)])
+        refreshed += len(id_sets)
+    return refreshed
+
+async def get_channel_id():
+    response = await execute_api_request(DATA_API, 'channels.list', part='id', mine=True)
+    return response['items'][0]['id']
+
+async def get_quota_report():
+    tenant = TENANT.get()
+    await refresh_quota()
+    title = f"YouTube API Quota ({QUOTA.today()} PT)" + (f" - {tenant}" if len(CHANNELS.tenants) > 1 else "")
+    embed = discord.Embed(title=title, color=0x00ff00)
+    response_str = f'{title}\n\n'
+    for api, name in ((DATA_API, 'Data API'), (ANALYTICS_API, 'Analytics API')):
+        used, budget = QUOTA.used(tenant, api), QUOTA.budget(tenant, api)
+        embed.add_field(name=name, value=f"{used:,} / {budget:,} units", inline=True)
+        response_str += f'{name}:\t{used:,} / {budget:,} units\n'
+
+    usage = await asyncio.to_thread(QUOTA.usage_by_command, tenant)
+    embed.add_field(name="\u200b", value="\u200b", inline=False)
+    response_str += '\nUsage by command:\n'
+    for command, api, calls, units in usage[:20]:
+        embed.add_field(name=f"{command} ({api})", value=f"{units:,} units / {calls:,} calls", inline=True)
+        response_str += f'{command} ({api}):\t{units:,} units / {calls:,} calls\n'
+    return embed, response_str
+
+async def get_cache_stats():
+    stats = QUERY_CACHE.stats()
+    stats.update({f'metadata_{name}': value for name, value in METADATA_CACHE.stats().items()})
+    stats.update({f'requests_{name}': value for name, value in IN_FLIGHT.stats().items()})
+    # Groups of counters (some growing with the retry reasons, APIs & hosts seen) get one field each, so the embed stays within EMBED_FIELDS
+    stats['charts'] = '\n'.join(f"{name.replace('_', ' ')}: {value:,}" for name, value in CHART_CACHE.stats().items())
+    stats['channels'] = '\n'.join(f'{name}: {value:,}' for name, value in CHANNELS.stats().items())
+    stats['retries'] = '\n'.join(f'{reason}: {count:,}' for reason, count in RETRY_COUNTS.items()) or 'None'
+    stats['rate_limits'] = '\n'.join(f'{api}: {limiter.rate:g}/s' for api, limiter in CHANNELS.tenant(TENANT.get()).limiters.items()) or 'None'
+    # Every connection opened costs a TCP + TLS handshake, the remaining requests reused a kept-alive one
+    stats['connections'] = '\n'.join(f"{host}: {counts['connections']:,} handshakes / {counts['requests'] - counts['connections']:,} reused"
+                                     for host, counts in pool_stats(HTTP_SESSION).items()) or 'None'
+    embed = discord.Embed(title="YouTube Analytics Query Cache", color=0x00ff00)
+    response_str = 'YouTube Analytics Query Cache\n\n'
+    for name, value in stats.items():
+        name = name.replace('_', ' ')
+        name = name[:1].upper() + name[1:]
+        value = f"{value:,}" if isinstance(value, (int, float)) else value
+        if len(embed.fields) < EMBED_FIELDS: embed.add_field(name=name, value=truncate(value, FIELD_VALUE_CHARACTERS), inline=True)
+        response_str += f'{name}:\t{value}\n'
+    return embed, response_str
+
+# Run a report from the registry (see reports.py). The result is rendered into an embed or text only when that is sent,
+# failures are returned as a message instead. With `page` only that page of REPORT_PAGE_SIZE rows is fetched
+async def run_report(name, start, end, results=None, page=None):
+    spec = REPORTS[name]
+    try:
+        if spec.store:
+            # Query the YouTube Analytics API (or the local analytics store)
+            response = await query_stats(start, end)
+        elif page is not None:
+            # One row more than the page shows tells whether there is a next page
+            response = await execute_api_request(ANALYTICS_API, 'reports.query', **spec.query(start, end, REPORT_PAGE_SIZE + 1, page * REPORT_PAGE_SIZE + 1))
+        else:
+            response = await execute_api_request(ANALYTICS_API, 'reports.query', **spec.query(start, end, results))
+        with phase('parse'): rows = RowSet.from_response(response)
+        has_next = page is not None and len(rows.rows) > REPORT_PAGE_SIZE
+        if has_next: rows.rows = rows.rows[:REPORT_PAGE_SIZE]
 
-        embed.add_field(name="Estimated Revenue", value=f"${round(revenue,2):,}", inline=True)
-        embed.add_field(name="CPM", value=f"${round(cpm,2):,}", inline=True)
-        embed.add_field(name="Monetized Playbacks (±2.0%)", value=f"{round(monetizedPlaybacks,2):,}", inline=True)
-        embed.add_field(name="Playback CPM", value=f"${round(playbackCpm,2):,}", inline=True)
-        embed.add_field(name="Ad Impressions", value=f"{round(adImpressions,2):,}", inline=True)
+        # Titles of the videos/playlists from the metadata cache (YouTube Data API)
+        labels = {}
+        if spec.lookup:
+            snippets = await get_metadata(spec.lookup, [row[0] for row in rows.rows])
+            labels = {id: snippet['title'] for id, snippet in snippets.items()}
 
-        # Build the response string
-        response_str = f'YouTube Analytics Report ({start}\t-\t{end})\n\n'
-        response_str += f'Views:\t{round(views,2):,}\nRatings:\t{100*round(likes/(likes + dislikes),2):,}%\nMinutes Watched:\t{round(minutes,2):,}\nAverage View Duration:\t{round(averageViewDuration,2):,}s ({round(averageViewPercentage,2):,}%)\nNet Subscribers:\t{round(netSubscribers,2):,}\nShares:\t{round(shares,2):,}\n\n'
-        response_str += f'Estimated Revenue:\t${round(revenue,2):,}\nCPM:\t${round(cpm,2):,}\nMonetized Playbacks (±2.0%):\t{round(monetizedPlaybacks,2):,}\nPlayback CPM:\t${round(playbackCpm,2):,}\nAd Impressions:\t{round(adImpressions,2):,}'
-        print(response_str + '\nSending to Discord...')
+        print(f'{name} report generated ({len(rows.rows)} rows, {start} - {end})')
+        return ReportResult(spec, rows, start, end, results, labels, None if page is None else page * REPORT_PAGE_SIZE, has_next)
 
-        return embed, response_str
-    
     except HttpAccessTokenRefreshError:     return "The credentials have been revoked or expired, please re-run the application to re-authorize."
+    except (HttpError, DeadlineExceeded, *NETWORK_ERRORS) as e:  return describe_api_error(e)
     except Exception as e:
         print(traceback.format_exc())
         return f"Ran into {e.__class__.__name__} exception, {traceback.format_exc()}"
 
+# Discord bot command methods.
+async def get_stats (start=datetime.datetime.now().strftime("%Y-%m-01"), end=datetime.datetime.now().strftime("%Y-%m-%d")):
+    return await run_report('stats', start, end)
 
 async def top_revenue (results=10, start=datetime.datetime.now().strftime("%Y-%m-01"), end=datetime.datetime.now().strftime("%Y-%m-%d")):
-    try:
-        # Query the YouTube Analytics API
-        response = execute_api_request(
-            YOUTUBE_ANALYTICS.reports().query,
-            ids='channel==MINE',
-            startDate=start,
-            endDate=end,
-            dimensions='video',
-            metrics='estimatedRevenue',
-            sort='-estimatedRevenue',
-            maxResults=results,
-        )
-
-        # Retrieve video IDs and earnings from the response
-        video_ids = []
-        earnings = []
-        for data in response['rows']:
-            video_ids.append(data[0])
-            earnings.append(data[1])
-
-        # Query the YouTube Data API
-        request = YOUTUBE_DATA.videos().list(
-            part="snippet",
-            id=','.join(video_ids)
-        )
-        response = request.execute()
-
-        # Format the start and end dates
-        start, end = (start[5:] if start[:4] == end[:4] else f'{start[5:]}-{start[:4]}').replace('-', '/'), (end[5:] if start[:4] == end[:4] else f'{end[5:]}-{end[:4]}').replace('-', '/')
-
-        # create a Discord Embed object
-        embed = discord.Embed(title=f"Top {results} Earning Videos ({start} - {end})", color=0x00ff00)
-
-        total = 0
-        for i in range(len(response['items'])):
-            embed.add_field(name=f"{i + 1}) {response['items'][i]['snippet']['title']}:\t${round(earnings[i], 2):,}", value=f"------------------------------------------------------------------------------------", inline=False)
-            total += earnings[i]
-        embed.add_field(name="\u200b", value="\u200b", inline=False)
-        embed.add_field(name=f"Top {results} Total Earnings", value=f"${round(total, 2):,}", inline=False)
-
-        # Build the response string
-        response_str = f'Top {results} Earning Videos ({start}\t-\t{end}):\n\n'
-        total = 0
-        for i in range(len(response['items'])):
-            response_str += f'{i + 1}) {response["items"][i]["snippet"]["title"]} - ${round(earnings[i], 2):,}\n'
-            total += earnings[i]
-        response_str += f'\n\nTop {results} Total Earnings: ${round(total, 2):,}'
-        print(response_str)
-
-        return embed, response_str
-    
-    except HttpAccessTokenRefreshError:     return "The credentials have been revoked or expired, please re-run the application to re-authorize."
-    except Exception as e:
-        print(traceback.format_exc())
-        return f"Ran into {e.__class__.__name__} exception, {traceback.format_exc()}"
-
+    return await run_report('top_revenue', start, end, results)
 
 async def top_countries_by_revenue (results=10, startDate=datetime.datetime.now().strftime("%m/01/%y"), endDate=datetime.datetime.now().strftime("%m/%d/%y")):
-    try:
-        # Query the YouTube Analytics API
-        response = execute_api_request(
-            YOUTUBE_ANALYTICS.reports().query,
-            ids='channel==MINE',
-            startDate=startDate,
-            endDate=endDate,
-            dimensions='country',
-            metrics='estimatedRevenue',
-            sort='-estimatedRevenue',
-            maxResults=results,
-        )
-
-        # Format the start and end dates
-        startDate, endDate = (startDate[5:] if startDate[:4] == endDate[:4] else f'{startDate[5:]}-{startDate[:4]}').replace(
-            '-', '/'), (endDate[5:] if startDate[:4] == endDate[:4] else f'{endDate[5:]}-{endDate[:4]}').replace('-', '/')
-
-        # Build the response string
-        return_str = f'Top {results} Countries by Revenue: ({startDate}\t-\t{endDate})\n'
-
-        embed = discord.Embed(title=f"Top {results} Countries by Revenue: ({startDate} - {endDate})", color=0x00ff00)
-        for row in response['rows']:
-            embed.add_field(name=f"{row[0]}:\t\t${round(row[1],2):,}", value=f"${round(row[1],2):,}", inline=False)
-            return_str += f'{row[0]}:\t\t${round(row[1],2):,}\n'
-            print(row[0], row[1])
-        
-        embed.add_field(name="\u200b", value="\u200b", inline=False)
-
-        return embed, return_str
-    
-    except HttpAccessTokenRefreshError:     return "The credentials have been revoked or expired, please re-run the application to re-authorize."
-    except Exception as e:
-        print(traceback.format_exc())
-        return f"Ran into {e.__class__.__name__} exception, {traceback.format_exc()}"
-
+    return await run_report('geo_revenue', startDate, endDate, results)
 
 async def get_ad_preformance (start=datetime.datetime.now().strftime("%Y-%m-01"), end=datetime.datetime.now().strftime("%Y-%m-%d")):
-    try:
-        response = execute_api_request(
-            YOUTUBE_ANALYTICS.reports().query,
-            ids='channel==MINE',
-            startDate=start,
-            endDate=end,
-            dimensions='adType',
-            metrics='grossRevenue,adImpressions,cpm',
-            sort='-grossRevenue'
-        )
-
-        # Terminary operator to check if start/end year share a year, and strip/remove if that's the case
-        start_str = (start[5:] if start[:4] == end[:4] else f'{start[5:]}-{start[:4]}').replace('-', '/')
-        end_str = (end[5:] if start[:4] == end[:4] else f'{end[5:]}-{end[:4]}').replace('-', '/')
-
-        response_str = f'Ad Preformance ({start_str}\t-\t{end_str})\n\n'
-        embed = discord.Embed(title=f"Ad Preformance ({start_str} - {end_str})", color=0x00ff00)
-        # Parse the response into nice formatted string
-        for row in response['rows']:
-            embed.add_field(name=f"{row[0]}:\t\t${round(row[1],2):,}", value=f"Gross Revenue:\t${round(row[1],2):,}\tCPM:\t${round(row[3],2):,}\tImpressions:\t{round(row[2],2):,}", inline=False)
-            response_str += f'Ad Type:\t{row[0]}\n\tGross Revenue:\t${round(row[1],2):,}\tCPM:\t${round(row[3],2):,}\tImpressions:\t{round(row[2],2):,}\n\n\n'
-
-        return embed, response_str
-    
-    except HttpAccessTokenRefreshError:     return "The credentials have been revoked or expired, please re-run the application to re-authorize."
-    except Exception as e:
-        print(traceback.format_exc())
-        return f"Ran into {e.__class__.__name__} exception, {traceback.format_exc()}"
+    return await run_report('adtype', start, end)
 
 # More detailed geo data/report
 async def get_detailed_georeport (results=5, startDate=datetime.datetime.now().strftime("%m/01/%y"), endDate=datetime.datetime.now().strftime("%m/%d/%y")):
-    try:
-        # Get top preforming countries by revenue
-        response = execute_api_request(
-            YOUTUBE_ANALYTICS.reports().query,
-            ids='channel==MINE',
-            startDate=startDate,
-            endDate=endDate,
-            dimensions='country',
-            metrics='views,estimatedRevenue,estimatedAdRevenue,estimatedRedPartnerRevenue,grossRevenue,adImpressions,cpm,playbackBasedCpm,monetizedPlaybacks',
-            sort='-estimatedRevenue',
-            maxResults=results,
-        )
-
-        # Parse the response using rows and columnHeaders
-        response_str = f'Top {results} Countries by Revenue: ({startDate} - {endDate})\n\n'
-        embed = discord.Embed(title=f"Top {results} Countries by Revenue: ({startDate} - {endDate})", color=0x00ff00)
-        for row in response['rows']:
-            response_str += f'{row[0]}:\n'
-            for i in range(len(row)):
-                if "country" in response["columnHeaders"][i]["name"]:
-                    continue
-                response_str += f'\t{response["columnHeaders"][i]["name"]}:\t{round(row[i],2):,}\n'
-                embed.add_field(name=f"{response['columnHeaders'][i]['name']}:", value=f"{round(row[i],2):,}", inline=False)
-            response_str += '\n'
-
-        print(f'Data received:\t{response}\n\nReport Generated:\n{response_str}')
-        return embed, response_str
-    
-    except HttpAccessTokenRefreshError:     return "The credentials have been revoked or expired, please re-run the application to re-authorize."
-    except Exception as e:
-        print(traceback.format_exc())
-        return f"Ran into {e.__class__.__name__} exception, {traceback.format_exc()}"
+    return await run_report('geo_report', startDate, endDate, results)
 
 async def get_demographics (startDate=datetime.datetime.now().strftime("%m/01/%y"), endDate=datetime.datetime.now().strftime("%m/%d/%y")):
-    try:
-        # Get top preforming countries by revenue
-        response = execute_api_request(
-            YOUTUBE_ANALYTICS.reports().query,
-            dimensions="ageGroup,gender",
-            ids='channel==MINE',
-            startDate=startDate,
-            endDate=endDate,
-            metrics="viewerPercentage",
-            sort="-viewerPercentage",
-        )
-        startDate, endDate = (startDate[5:] if startDate[:4] == endDate[:4] else f'{startDate[5:]}-{startDate[:4]}').replace('-', '/'), (endDate[5:] if startDate[:4] == endDate[:4] else f'{endDate[5:]}-{endDate[:4]}').replace('-', '/')
-        response_str = f'Gender Viewership Demographics ({startDate}\t-\t{endDate})\n\n'
-        embed = discord.Embed(title=f"Gender Viewership Demographics ({startDate}\t-\t{endDate})", color=0x00ff00)
-
-        # Parse the response into nice formatted string
-        for row in response['rows']:
-            if round(row[2],2) < 1: break
-            row[0] = row[0].split('e')
-
-            response_str += f'{round(row[2],2)}% Views come from {row[1]} with age of {row[0][1]}\n'
-            embed.add_field(name=f"{round(row[2],2)}% Views come from {row[1]} with age of {row[0][1]}", value=f"{round(row[2],2)}%", inline=False)
-        print(f'Demographics Report Generated & Sent:\n{response_str}')
-        return embed, response_str
-    
-    except HttpAccessTokenRefreshError:     return "The credentials have been revoked or expired, please re-run the application to re-authorize."
-    except Exception as e:
-        print(traceback.format_exc())
-        return f"Ran into {e.__class__.__name__} exception, {traceback.format_exc()}"
+    return await run_report('demographics', startDate, endDate)
 
 async def get_shares (results = 5, start=datetime.datetime.now().strftime("%Y-%m-01"), end=datetime.datetime.now().strftime("%Y-%m-%d")):
-    try:
-        request = YOUTUBE_ANALYTICS.reports().query(
-            dimensions="sharingService",
-            startDate=start,
-            endDate=end,
-            ids="channel==MINE",
-            maxResults=results,
-            metrics="shares",
-            sort="-shares"
-        ).execute()
-
-        # Terminary operator to check if start/end year share a year, and strip/remove if that's the case
-        start_str, end_str = (start[5:] if start[:4] == end[:4] else f'{start[5:]}-{start[:4]}').replace('-', '/'), (end[5:] if start[:4] == end[:4] else f'{end[5:]}-{end[:4]}').replace('-', '/')
-
-        response_str = f'Top Sharing Services ({start_str}\t-\t{end_str})\n\n'
-        embed = discord.Embed(title=f"Top Sharing Services ({start_str}\t-\t{end_str})", color=0x00ff00)
-        # Parse the response into nice formatted string
-        for row in request['rows']:
-            response_str += f'{row[0].replace("_", " ")}:\t{row[1]:,}\n'
-            embed.add_field(name=f'{row[0].replace("_", " ")}:', value=f"{row[1]:,}", inline=False)
-        print(f'Shares Report Generated & Sent:\n{response_str}')
-        return embed, response_str
-    
-    except HttpAccessTokenRefreshError:     return "The credentials have been revoked or expired, please re-run the application to re-authorize."
-    except Exception as e:
-        print(traceback.format_exc())
-        return f"Ran into {e.__class__.__name__} exception, {traceback.format_exc()}"
+    return await run_report('shares', start, end, results)
 
 async def get_traffic_source (results=10, start=datetime.datetime.now().strftime("%Y-%m-01"), end=datetime.datetime.now().strftime("%Y-%m-%d")):
-    try:
-        request = YOUTUBE_ANALYTICS.reports().query(
-            dimensions="insightTrafficSourceDetail",
-            endDate=end,
-            filters="insightTrafficSourceType==YT_SEARCH",
-            ids="channel==MINE",
-            maxResults=results,
-            metrics="views",
-            sort="-views",
-            startDate=start
-        ).execute()
-
-        # Terminary operator to check if start/end year share a year, and strip/remove if that's the case
-        start_str, end_str = (start[5:] if start[:4] == end[:4] else f'{start[5:]}-{start[:4]}').replace('-', '/'), (end[5:] if start[:4] == end[:4] else f'{end[5:]}-{end[:4]}').replace('-', '/')
-
-        response_str = f'Top Search Traffic Terms ({start_str}\t-\t{end_str})\n\n'
-        embed = discord.Embed(title=f"Top Search Traffic Terms ({start_str}\t-\t{end_str})", color=0x00ff00)
-        # Parse the response into nice formatted string
-        for row in request['rows']:
-            response_str += f'{row[0].replace("_", " ")}:\t{row[1]:,}\n'
-            embed.add_field(name=f'{row[0].replace("_", " ")}:', value=f"{row[1]:,}", inline=False)
-        print(f'Traffic Report Generated:\n{response_str}')
-
-        return embed, response_str
-    
-    except HttpAccessTokenRefreshError:     return "The credentials have been revoked or expired, please re-run the application to re-authorize."
-    except Exception as e:
-        print(traceback.format_exc())
-        return f"Ran into {e.__class__.__name__} exception, {traceback.format_exc()}"
-
+    return await run_report('search', start, end, results)
 
 async def get_operating_stats (results = 10, start=datetime.datetime.now().strftime("%Y-%m-01"), end=datetime.datetime.now().strftime("%Y-%m-%d")):
-    try:
-        request = YOUTUBE_ANALYTICS.reports().query(
-            dimensions="operatingSystem",
-            endDate=end,
-            maxResults=results,
-            ids="channel==MINE",
-            metrics="views,estimatedMinutesWatched",
-            sort="-views,estimatedMinutesWatched",
-            startDate=start
-        ).execute()
-        start_str, end_str = (start[5:] if start[:4] == end[:4] else f'{start[5:]}-{start[:4]}').replace('-', '/'), (end[5:] if start[:4] == end[:4] else f'{end[5:]}-{end[:4]}').replace('-', '/')
-        response_str = f'Top Operating System ({start_str}\t-\t{end_str})\n'
-        embed = discord.Embed(title=f"Top Operating System ({start_str}\t-\t{end_str})", color=0x00ff00)
-        for row in request['rows']:
-            response_str += f'\t{row[0]}:\n\t\tViews:\t\t{round(row[1], 2):,}\n\t\tEstimated Watchtime:\t\t{round(row[2],2):,}\n'
-            embed.add_field(name=f'{row[0]}:', value=f"Views:\t\t{round(row[1], 2):,}\nEstimated Watchtime:\t\t{round(row[2],2):,}", inline=False)
-        print(response_str)
-        return embed, response_str
-    
-    except HttpAccessTokenRefreshError:     return "The credentials have been revoked or expired, please re-run the application to re-authorize."
-    except Exception as e:
-        print(traceback.format_exc())
-        return f"Ran into {e.__class__.__name__} exception, {traceback.format_exc()}"
-    
+    return await run_report('os', start, end, results)
+
 async def get_playlist_stats (results = 5, start=datetime.datetime.now().strftime("%Y-%m-01"), end=datetime.datetime.now().strftime("%Y-%m-%d")):
+    return await run_report('playlist', start, end, results)
+
+# Every report of !everything in the order it is sent: (function, arguments)
+def all_reports(start, end, results=10):
+    return [
+        (get_stats, (start, end)),
+        (top_revenue, (results, start, end)),
+        (top_countries_by_revenue, (results, start, end)),
+        (get_ad_preformance, (start, end)),
+        (get_detailed_georeport, (results, start, end)),
+        (get_demographics, (start, end)),
+        (get_shares, (results, start, end)),
+        (get_traffic_source, (results, start, end)),
+        (get_operating_stats, (results, start, end)),
+        (get_playlist_stats, (results, start, end)),
+    ]
+
+# One call of a report function under the profiler (see profiler.py), formatted & rendered like a command would: (result, Profile)
+async def profile_report(function, args):
+    async def invocation():
+        result = await function(*args)
+        if isinstance(result, ReportResult):
+            with phase('parse'): result.values
+            with phase('render'): result.embed, result.text
+        return result
+    return await profile_call(invocation(), f"{function.__name__}({', '.join(map(repr, args))}) for {TENANT.get()}, {datetime.datetime.now():%Y-%m-%d %H:%M:%S}")
+
+# Daily views, revenue & CPM of a date range as a chart: (embed, PNG bytes), or a message when it couldn't be made.
+# Rendered in the chart worker processes, a chart already drawn for the same query & style is served from CHART_CACHE
+async def get_trend(start, end, style='line'):
+    query = REPORTS['trend'].query(start, end)
+    key = f'{TENANT.get()}:{QUERY_CACHE.make_key(ANALYTICS_API, "reports.query", query)}:{style}'
+
+    async def render():
+        result = await run_report('trend', start, end)
+        if not isinstance(result, ReportResult): return result
+        records = result.rows.records()
+        if not records: return f'No analytics data for {result.start} - {result.end}'
+        series = {metric: [record[metric] for record in records] for metric in ('views', 'estimatedRevenue', 'cpm')}
+        try:
+            png = await asyncio.get_running_loop().run_in_executor(CHART_POOL, render_trend, result.title(' - '), [record['day'] for record in records], series, style)
+        except ImportError:
+            return 'Trend charts need matplotlib, install it with: pip install matplotlib'
+        cpms = [cpm for cpm in series['cpm'] if cpm]
+        chart = {'title': result.title(' - '), 'png': base64.b64encode(png).decode(),
+                 'totals': {'Views': f"{sum(series['views']):,.0f}", 'Revenue': f"${sum(series['estimatedRevenue']):,.2f}",
+                            'Average CPM': f"${sum(cpms) / len(cpms):,.2f}" if cpms else '$0.00'}}
+        CHART_CACHE.set(key, chart, CHART_CACHE.ttl_for(query))
+        return chart
+
+    chart = CHART_CACHE.get(key)
+    if chart is None:
+        chart = await IN_FLIGHT.do(key, render)
+        if isinstance(chart, str): return chart
+    embed = discord.Embed(title=chart['title'], color=0x00ff00)
+    for name, value in chart['totals'].items(): embed.add_field(name=name, value=value, inline=True)
+    embed.set_image(url='attachment://trend.png')
+    return embed, base64.b64decode(chart['png'])
+
+# Period over period comparison of every channel metric: totals, per day rates & rolling averages of (start, end) `current` vs `previous`
+async def get_comparison(current, previous):
     try:
-        request = YOUTUBE_ANALYTICS.reports().query(
-            dimensions="playlist",
-            endDate=end,
-            filters="isCurated==1",
-            ids="channel==MINE",
-            maxResults=results,
-            metrics="estimatedMinutesWatched,views,playlistStarts,averageTimeInPlaylist",
-            sort="-views",
-            startDate=start
-        )
-        response = request.execute()
-
-        playlist_ids = ','.join([row[0] for row in response['rows']])
-        playlist_ids = []
-        views = []
-        playlist_starts = []
-        average_time_in_playlist = []
-        estimated_minutes_watched = []
-        for row in response['rows']:
-            playlist_ids.append(row[0])
-            views.append(row[1])
-            playlist_starts.append(row[2])
-            average_time_in_playlist.append(row[3])
-            estimated_minutes_watched.append(row[4])
-
-        request = YOUTUBE_DATA.playlists().list(
-            part="snippet",
-            id=playlist_ids
-        )
-        response = request.execute()
-        start, end = (start[5:] if start[:4] == end[:4] else f'{start[5:]}-{start[:4]}').replace('-', '/'), (end[5:] if start[:4] == end[:4] else f'{end[5:]}-{end[:4]}').replace('-', '/')
-        response_str = f'```YouTube Analytics Report ({start}\t-\t{end})\n\n'
-        embed = discord.Embed(title=f"Top Operating System ({start}\t-\t{end})", color=0x00ff00)
-        for row in response['items']:
-            response_str += f"{row['snippet']['title']}:\nViews: {views[playlist_ids.index(row['id'])]}\nPlaylist Starts: {playlist_starts[playlist_ids.index(row['id'])]}\nAverage Time Spent in Playlist: {average_time_in_playlist[playlist_ids.index(row['id'])]}\nEstimated Minutes Watched: {estimated_minutes_watched[playlist_ids.index(row['id'])]}\n\n"
-            embed.add_field(name=f'{row["snippet"]["title"]}:', value=f"Views: {views[playlist_ids.index(row['id'])]}\nPlaylist Starts: {playlist_starts[playlist_ids.index(row['id'])]}\nAverage Time Spent in Playlist: {average_time_in_playlist[playlist_ids.index(row['id'])]}\nEstimated Minutes Watched: {estimated_minutes_watched[playlist_ids.index(row['id'])]}", inline=False)
-        response_str += '```'
-        print('Playlist Report Generated:\n', response_str)
+        responses = await asyncio.gather(query_daily(*current), query_daily(*previous))
+        now, before = (Series(COMPARE_METRICS, *period, response) for period, response in zip((current, previous), responses))
+        result = compare(now, before)
+
+        spec = REPORTS['stats']
+        title = 'Comparison ({} - {} vs {} - {})'.format(*format_range(*current), *format_range(*previous))
+        embed = discord.Embed(title=title, color=0x00ff00)
+        response_str = f'{title}\n\n'
+        for index, metric in enumerate(COMPARE_METRICS):
+            show = lambda name: ' vs '.join(spec.format(metric, float(value[index])) for value in result[name])
+            change = result['change'][index]
+            change = 'n/a' if change != change else f"{'▲' if change >= 0 else '▼'} {change:+,.1f}%"
+            name = metric_name(metric)
+            value = f"{show('total')} ({change})\nPer day: {show('per_day')}\n{ROLLING_DAYS}-day average: {show('rolling')}"
+            embed.add_field(name=name, value=value, inline=True)
+            response_str += f'{name}:\t{value}\n'
+        print(f'Comparison generated ({current[0]} - {current[1]} vs {previous[0]} - {previous[1]})')
         return embed, response_str
-    
+
     except HttpAccessTokenRefreshError:     return "The credentials have been revoked or expired, please re-run the application to re-authorize."
+    except (HttpError, DeadlineExceeded, *NETWORK_ERRORS) as e:  return describe_api_error(e)
     except Exception as e:
         print(traceback.format_exc())
         return f"Ran into {e.__class__.__name__} exception, {traceback.format_exc()}"
-    
-YOUTUBE_ANALYTICS = get_service()
-YOUTUBE_DATA = get_service("youtube", "v3", YOUTUBE_API_KEY)
\ No newline at end of file
+
+ANOMALY_MONITOR = Lazy(lambda: AnomalyMonitor(ANALYTICS_DB, ANOMALY_METRICS, ANOMALY_THRESHOLD, ANOMALY_ALPHA))
+
+# Fold the days completed since the last poll into the running statistics, returns the anomalies among them.
+# Only those new days are queried (nothing at all when there are none), the first poll seeds the baselines without alerting
+async def poll_anomalies():
+    channel = store_channel()
+    last_day = await asyncio.to_thread(ANOMALY_MONITOR.last_day, channel)
+    today = datetime.date.today()
+    end = today - datetime.timedelta(days=ANOMALY_LAG_DAYS)
+    start = end - datetime.timedelta(days=ANOMALY_SEED_DAYS - 1) if last_day is None else datetime.date.fromisoformat(last_day) + datetime.timedelta(days=1)
+    if start > end: return []
+
+    response = await execute_api_request(ANALYTICS_API, 'reports.query', cache=False, ids='channel==MINE', startDate=start.isoformat(), endDate=end.isoformat(),
+                                          dimensions='day', metrics=','.join(ANOMALY_METRICS), sort='day')
+    anomalies = []
+    for record in RowSet.from_response(response).records():
+        anomalies += ANOMALY_MONITOR.observe(channel, record['day'], record)
+    await asyncio.to_thread(ANOMALY_MONITOR.save, channel)
+    return [] if last_day is None else anomalies
+
+# Alert embed for the anomalies of one day
+def anomaly_embed(day, anomalies):
+    tenant = TENANT.get()
+    title = f"⚠️ Unusual day on {datetime.date.fromisoformat(day).strftime('%m/%d/%Y')}" + (f" - {tenant}" if len(CHANNELS.tenants) > 1 else "")
+    embed = discord.Embed(title=title, color=0xff0000)
+    spec = REPORTS['stats']
+    for anomaly in anomalies:
+        change = f' {abs(anomaly.change):,.1f}%' if anomaly.change is not None else ''
+        name = f"{metric_name(anomaly.metric)} {'spiked' if anomaly.score > 0 else 'dropped'}{change}"
+        embed.add_field(name=name, value=f"{spec.format(anomaly.metric, anomaly.value)} vs {spec.format(anomaly.metric, anomaly.expected)} expected ({anomaly.score:+.1f}σ)", inline=False)
+    return embed
+
+# Metrics exported for every day & video / country
+EXPORT_METRICS = {
+    'video':   'views,estimatedMinutesWatched,averageViewDuration,likes,shares,subscribersGained,subscribersLost,estimatedRevenue',
+    'country': 'views,estimatedMinutesWatched,averageViewDuration,subscribersGained,subscribersLost,estimatedRevenue,grossRevenue,adImpressions,cpm',
+}
+
+def export_columns(by):
+    return ['day', by] + EXPORT_METRICS[by].split(',')
+
+# Every row of one day, a page of EXPORT_PAGE_SIZE at a time. Each page gets its own deadline, and isn't kept in the query cache
+async def export_day(by, day):
+    rows, start_index = [], 1
+    while True:
+        set_deadline()
+        response = await execute_api_request(ANALYTICS_API, 'reports.query', cache=False, ids='channel==MINE', startDate=day, endDate=day, metrics=EXPORT_METRICS[by],
+                                              dimensions=by, sort='-views', maxResults=EXPORT_PAGE_SIZE, startIndex=start_index)
+        page = response.get('rows', [])
+        rows.extend([day] + row for row in page)
+        if len(page) < EXPORT_PAGE_SIZE: return rows
+        start_index += EXPORT_PAGE_SIZE
+
+# Rows of every day from start to end, a day at a time & in order. Up to EXPORT_CONCURRENCY days are fetched ahead,
+# so memory stays at a few days of rows however long the range is
+async def stream_export(by, start, end):
+    start, end = datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)
+    days = ((start + datetime.timedelta(days=offset)).isoformat() for offset in range((end - start).days + 1))
+    pending = []
+    try:
+        for day in days:
+            pending.append(asyncio.ensure_future(export_day(by, day)))
+            if len(pending) >= EXPORT_CONCURRENCY: yield await pending.pop(0)
+        while pending: yield await pending.pop(0)
+    finally:
+        for task in pending: task.cancel()
+
+# Write a day x video (or day x country) export to `path`, returns the number of rows.
+# Bulk work, so it runs in the background lane and stops when the channel's quota is running low
+async def export_analytics(by, start, end, format, path):
+    background_job(f'export:{by}')
+    columns = export_columns(by)
+    writer = await asyncio.to_thread(ExportWriter, path, format, columns, columns[2:])
+    try:
+        async for rows in stream_export(by, start, end):
+            await asyncio.to_thread(writer.write, rows)
+    finally:
+        await asyncio.to_thread(writer.close)
+    print(f'{by} export written ({writer.rows} rows, {start} - {end})')
+    return writer.rows
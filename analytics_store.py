@@ -0,0 +1,103 @@
+import sqlite3, threading, datetime
+
+# Ratio metrics can't be summed, they are recomputed as averages weighted by the metric they are a rate of
+WEIGHTED_METRICS = {
+    'cpm': 'adImpressions',
+    'playbackBasedCpm': 'monetizedPlaybacks',
+    'averageViewDuration': 'views',
+    'averageViewPercentage': 'views',
+}
+
+def date_range(start, end):
+    day = datetime.date.fromisoformat(start)
+    end = datetime.date.fromisoformat(end)
+    while day <= end:
+        yield day.isoformat()
+        day += datetime.timedelta(days=1)
+
+# SQLite store of per-day channel metrics, days older than the finalization lag are never fetched twice
+class AnalyticsStore:
+    def __init__(self, path, metrics, finalization_lag):
+        self.metrics = list(dict.fromkeys(metrics))
+        self.finalization_lag = finalization_lag
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+
+        columns = ', '.join(f'"{metric}" REAL DEFAULT 0' for metric in self.metrics)
+        with self.lock, self.db:
+            self.db.execute(f'CREATE TABLE IF NOT EXISTS daily_metrics (channel TEXT, day TEXT, {columns}, finalized INTEGER DEFAULT 0, PRIMARY KEY (channel, day))')
+
+            # Metrics added since the table was created have to be backfilled, so every stored day is marked unfinalized
+            existing = {row[1] for row in self.db.execute('PRAGMA table_info(daily_metrics)')}
+            added = [metric for metric in self.metrics if metric not in existing]
+            for metric in added:
+                self.db.execute(f'ALTER TABLE daily_metrics ADD COLUMN "{metric}" REAL DEFAULT 0')
+            if added: self.db.execute('UPDATE daily_metrics SET finalized = 0')
+
+    def finalized_before(self):
+        return (datetime.date.today() - datetime.timedelta(days=self.finalization_lag)).isoformat()
+
+    # Contiguous (start, end) ranges of days that are missing or not finalized yet, split into chunks of at most max_days
+    def missing_ranges(self, channel, start, end, max_days=365):
+        end = min(end, datetime.date.today().isoformat())
+        with self.lock:
+            stored = {row[0] for row in self.db.execute(
+                'SELECT day FROM daily_metrics WHERE channel = ? AND day BETWEEN ? AND ? AND finalized = 1', (channel, start, end))}
+
+        ranges, current = [], None
+        for day in date_range(start, end):
+            if day in stored:
+                current = None
+                continue
+            if current is None or len(current) == max_days:
+                current = []
+                ranges.append(current)
+            current.append(day)
+        return [(days[0], days[-1]) for days in ranges]
+
+    # Save a `day` dimension report, days without rows are stored as zeros so they are not requested again
+    def save(self, channel, start, end, response):
+        columns = [header['name'] for header in response.get('columnHeaders', [])]
+        rows = {row[columns.index('day')]: row for row in response.get('rows', [])} if 'day' in columns else {}
+        finalized_before = self.finalized_before()
+
+        records = []
+        for day in date_range(start, end):
+            row = rows.get(day)
+            values = [row[columns.index(metric)] if row and metric in columns else 0 for metric in self.metrics]
+            records.append((channel, day, *values, int(day < finalized_before)))
+
+        names = ', '.join(f'"{metric}"' for metric in self.metrics)
+        placeholders = ', '.join('?' * (len(self.metrics) + 3))
+        with self.lock, self.db:
+            self.db.executemany(f'INSERT OR REPLACE INTO daily_metrics (channel, day, {names}, finalized) VALUES ({placeholders})', records)
+
+    # Totals for a date range, summable metrics are summed & ratio metrics recomputed from their components
+    def aggregate(self, channel, start, end):
+        expressions = []
+        for metric in self.metrics:
+            weight = WEIGHTED_METRICS.get(metric)
+            if weight in self.metrics:
+                expressions.append(f'SUM("{metric}" * "{weight}") / NULLIF(SUM("{weight}"), 0)')
+            else:
+                expressions.append(f'SUM("{metric}")')
+
+        with self.lock:
+            row = self.db.execute(
+                f'SELECT {", ".join(expressions)} FROM daily_metrics WHERE channel = ? AND day BETWEEN ? AND ?', (channel, start, end)).fetchone()
+
+        totals = {}
+        for metric, value in zip(self.metrics, row):
+            value = value or 0
+            totals[metric] = int(value) if metric not in WEIGHTED_METRICS and float(value).is_integer() else value
+        return totals
+
+    # Stored days of a date range as a 'day' dimension report response
+    def daily(self, channel, start, end):
+        names = ', '.join(f'"{metric}"' for metric in self.metrics)
+        with self.lock:
+            rows = self.db.execute(f'SELECT day, {names} FROM daily_metrics WHERE channel = ? AND day BETWEEN ? AND ? ORDER BY day', (channel, start, end)).fetchall()
+        return {'columnHeaders': [{'name': name} for name in ['day'] + self.metrics], 'rows': [list(row) for row in rows]}
+
+    def close(self):
+        with self.lock: self.db.close()
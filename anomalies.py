@@ -0,0 +1,94 @@
+import sqlite3, threading, datetime, math
+
+# Baselines: every day, and only the same weekday (a weekly seasonal baseline, weekends often differ from weekdays)
+ALL_DAYS = 7
+
+# Exponentially weighted mean & variance, updated in constant time per value. Recent days weigh more, so the
+# baseline follows a growing channel instead of averaging in its whole history
+class RunningStats:
+    __slots__ = ('count', 'mean', 'variance')
+
+    def __init__(self, count=0, mean=0.0, variance=0.0):
+        self.count, self.mean, self.variance = count, mean, variance
+
+    def update(self, value, alpha):
+        # The first values are averaged evenly, until they weigh less than alpha
+        weight = max(alpha, 1 / (self.count + 1))
+        delta = value - self.mean
+        self.mean += weight * delta
+        self.variance = (1 - weight) * (self.variance + weight * delta * delta)
+        self.count += 1
+
+    # Standard deviation, at least `floor` of the mean so a very steady metric doesn't alert on every small change
+    def deviation(self, floor):
+        return max(math.sqrt(self.variance), floor * abs(self.mean), 1e-9)
+
+# A day's metric far from its baseline
+class Anomaly:
+    def __init__(self, metric, day, value, expected, score):
+        self.metric, self.day, self.value, self.expected, self.score = metric, day, value, expected, score
+
+    @property
+    def change(self):
+        return 100 * (self.value - self.expected) / abs(self.expected) if self.expected else None
+
+# Running statistics of each channel's daily metrics (kept in SQLite, so a restart resumes instead of rescanning history).
+# A day is scored against its weekday's baseline once that has `warmup` days, otherwise against every day's
+class AnomalyMonitor:
+    def __init__(self, path, metrics, threshold=3.0, alpha=0.1, warmup=8, floor=0.05):
+        self.metrics = list(metrics)
+        self.threshold, self.alpha, self.warmup, self.floor = threshold, alpha, warmup, floor
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS anomaly_stats (channel TEXT, metric TEXT, bucket INTEGER, count INTEGER, mean REAL, variance REAL, PRIMARY KEY (channel, metric, bucket))')
+            self.db.execute('CREATE TABLE IF NOT EXISTS anomaly_days (channel TEXT PRIMARY KEY, last_day TEXT)')
+        self.stats = {}
+        self.last_days = {}
+
+    def load(self, channel):
+        if channel in self.last_days: return
+        with self.lock:
+            rows = self.db.execute('SELECT metric, bucket, count, mean, variance FROM anomaly_stats WHERE channel = ?', (channel,)).fetchall()
+            last_day = self.db.execute('SELECT last_day FROM anomaly_days WHERE channel = ?', (channel,)).fetchone()
+        for metric, bucket, count, mean, variance in rows:
+            self.stats[channel, metric, bucket] = RunningStats(count, mean, variance)
+        self.last_days[channel] = last_day[0] if last_day else None
+
+    # Last day folded into the statistics, None before the first poll
+    def last_day(self, channel):
+        self.load(channel)
+        return self.last_days[channel]
+
+    def baseline(self, channel, metric, weekday):
+        seasonal = self.stats.get((channel, metric, weekday))
+        if seasonal is not None and seasonal.count >= self.warmup: return seasonal
+        return self.stats.get((channel, metric, ALL_DAYS))
+
+    # Score a new day against the baselines, then fold it into them. Days already seen are skipped,
+    # anomalies are only reported once every-day baseline has `warmup` days
+    def observe(self, channel, day, values):
+        self.load(channel)
+        if self.last_days[channel] is not None and day <= self.last_days[channel]: return []
+        weekday = datetime.date.fromisoformat(day).weekday()
+        anomalies = []
+        for metric in self.metrics:
+            value = float(values.get(metric) or 0)
+            baseline = self.baseline(channel, metric, weekday)
+            if baseline is not None and self.stats[channel, metric, ALL_DAYS].count >= self.warmup:
+                score = (value - baseline.mean) / baseline.deviation(self.floor)
+                if abs(score) >= self.threshold: anomalies.append(Anomaly(metric, day, value, baseline.mean, score))
+            for bucket in (weekday, ALL_DAYS):
+                self.stats.setdefault((channel, metric, bucket), RunningStats()).update(value, self.alpha)
+        self.last_days[channel] = day
+        return anomalies
+
+    # Persist what observe() changed, once per poll
+    def save(self, channel):
+        rows = [(channel, metric, bucket, stats.count, stats.mean, stats.variance) for (name, metric, bucket), stats in self.stats.items() if name == channel]
+        with self.lock, self.db:
+            self.db.executemany('INSERT OR REPLACE INTO anomaly_stats VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self.db.execute('INSERT OR REPLACE INTO anomaly_days VALUES (?, ?)', (channel, self.last_days[channel]))
+
+    def close(self):
+        with self.lock: self.db.close()
@@ -0,0 +1,180 @@
+import argparse, asyncio, contextlib, datetime, itertools, json, multiprocessing, os, platform, subprocess, sys, tempfile, time, tracemalloc
+import urllib.request
+
+import fake_api
+
+# Peak memory of the process comes from getrusage, which Windows doesn't have
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Last day of the first benchmarked range, later invocations step back a day each so they miss the caches (unless --warm)
+BASE_END = datetime.date(2024, 12, 31)
+RANGE_DAYS = 28
+
+RESULTS_DIR = 'benchmark_results'
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+def peak_rss_mb():
+    if resource is None: return None
+    # KB on Linux, bytes on macOS
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def git_commit():
+    try: return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError: return None
+
+def fake_request(root, path, method='GET'):
+    with urllib.request.urlopen(urllib.request.Request(root + path, method=method, data=b'' if method == 'POST' else None)) as response:
+        return json.load(response)
+
+# Point the bot at the fake API: credentials that never need a refresh, services built from discovery documents rewritten to the
+# fake server & a throwaway database. Quota & rate limits are lifted unless the environment sets them, the fake API has neither
+def configure(root, directory):
+    discovery = os.path.join(directory, 'API_Service')
+    fake_api.write_discovery(discovery, root)
+    secret = {'client_id': 'benchmark', 'client_secret': 'benchmark', 'refresh_token': 'benchmark', 'token': 'benchmark', 'expiry': '2999-01-01T00:00:00Z'}
+    os.environ.update({'YOUTUBE_API_KEY': 'benchmark', 'DEV_MODE': 'true', 'CLIENT_SECRET': json.dumps({'installed': secret}),
+                       'BUNDLED_DISCOVERY': 'true', 'API_SERVICE_DIR': discovery,
+                       'ANALYTICS_DB': os.path.join(directory, 'analytics.db'), 'CHANNELS_CONFIG': os.path.join(directory, 'channels.json')})
+    for name, value in {'QUOTA_BUDGET': 10 ** 9, 'ANALYTICS_QUOTA_BUDGET': 10 ** 9, 'API_RATE_LIMIT': 10 ** 6}.items():
+        os.environ.setdefault(name, str(value))
+
+# One invocation of a report function (or of every report, fanned out like !everything), rendered into the embed the bot would
+# send. Returns the number of reports that failed
+async def invoke(bot, scenario, start, end, results, concurrency):
+    reports = bot.all_reports(start, end, results)
+    if scenario != 'all':
+        reports = [report for report in reports if report[0].__name__ == scenario]
+
+    semaphore = asyncio.Semaphore(concurrency)
+    async def run(function, args):
+        async with semaphore:
+            return await function(*args)
+
+    errors = 0
+    for outcome in await asyncio.gather(*(run(function, args) for function, args in reports), return_exceptions=True):
+        if isinstance(outcome, bot.ReportResult): outcome.embed
+        else: errors += 1
+    return errors
+
+# `users` simulated users each invoking the scenario `iterations` times back to back
+async def run_scenario(bot, scenario, args, ranges):
+    latencies, errors = [], 0
+
+    async def user(number):
+        nonlocal errors
+        bot.set_command(f'benchmark:{scenario}:{number}')
+        for _ in range(args.iterations):
+            end = BASE_END - datetime.timedelta(days=0 if args.warm else next(ranges))
+            start = end - datetime.timedelta(days=RANGE_DAYS - 1)
+            bot.set_deadline()
+            began = time.perf_counter()
+            try: errors += await invoke(bot, scenario, start.isoformat(), end.isoformat(), args.results, args.concurrency)
+            except Exception: errors += 1
+            latencies.append(time.perf_counter() - began)
+
+    began = time.perf_counter()
+    await asyncio.gather(*(user(number) for number in range(args.users)))
+    seconds = time.perf_counter() - began
+    return {'invocations': len(latencies), 'errors': errors, 'seconds': round(seconds, 3), 'throughput': round(len(latencies) / seconds, 2),
+            **{f'{name}_ms': round(1000 * percentile(latencies, q), 1) for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))},
+            'max_ms': round(1000 * max(latencies), 1)}
+
+async def run_benchmark(bot, root, scenarios, args):
+    ranges = itertools.count()
+    results = {}
+    for scenario in scenarios:
+        await asyncio.to_thread(fake_request, root, '_fake/reset', 'POST')
+        if args.heap: tracemalloc.reset_peak()
+        # Reports print a line each, which would drown the results
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else open(os.devnull, 'w')):
+            result = await run_scenario(bot, scenario, args, ranges)
+        calls = await asyncio.to_thread(fake_request, root, '_fake/stats')
+        result.update({'api_calls': calls['calls'], 'api_call_total': sum(calls['calls'].values()), 'round_trips': calls['round_trips'], 'peak_rss_mb': peak_rss_mb()})
+        if args.heap: result['peak_heap_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        results[scenario] = result
+        print_row(scenario, result)
+    return results
+
+COLUMNS = ('p50_ms', 'p95_ms', 'p99_ms', 'throughput', 'api_call_total', 'round_trips', 'errors', 'peak_rss_mb', 'peak_heap_mb')
+
+def print_header():
+    print(f"{'scenario':<26}" + ''.join(f'{column:>15}' for column in COLUMNS))
+
+def print_row(scenario, result):
+    print(f'{scenario:<26}' + ''.join(f"{'-' if result.get(column) is None else result[column]:>15}" for column in COLUMNS))
+
+# Changes of each scenario's latencies & throughput from a saved run, negative latency changes are improvements
+def print_comparison(baseline, results):
+    print(f"\nCompared to {baseline.get('commit') or 'baseline'} ({baseline['started']}):")
+    print(f"{'scenario':<26}" + ''.join(f'{column:>22}' for column in COLUMNS[:4]))
+    for scenario, result in results['scenarios'].items():
+        before = baseline['scenarios'].get(scenario)
+        if before is None: continue
+        cells = []
+        for column in COLUMNS[:4]:
+            change = (result[column] - before[column]) * 100 / before[column] if before[column] else 0
+            cells.append(f'{before[column]:g} > {result[column]:g} ({change:+.0f}%)')
+        print(f'{scenario:<26}' + ''.join(f'{cell:>22}' for cell in cells))
+
+# python benchmark.py --users 16 --iterations 10 --latency 0.15 --compare benchmark_results/<earlier run>.json
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every report (and !everything) against a local fake YouTube API, no Google credentials needed')
+    parser.add_argument('scenarios', nargs='*', help='report functions to run (e.g. get_stats top_revenue) and/or all, defaults to every one')
+    parser.add_argument('--users', type=int, default=8, help='simulated users running each scenario at the same time')
+    parser.add_argument('--iterations', type=int, default=5, help='invocations per user')
+    parser.add_argument('--results', type=int, default=10, help='rows asked of the top N reports')
+    parser.add_argument('--rows', type=int, default=50, help='rows the fake API has for each report with dimensions')
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds the fake API takes per request (or batch)')
+    parser.add_argument('--jitter', type=float, default=0.02, help='random seconds added to or taken from the latency')
+    parser.add_argument('--concurrency', type=int, default=int(os.environ.get('REPORT_CONCURRENCY', 4)), help='reports of `all` fetched at the same time (REPORT_CONCURRENCY)')
+    parser.add_argument('--warm', action='store_true', help='every invocation queries the same range, measuring the caches instead of the API path')
+    parser.add_argument('--heap', action='store_true', help='also trace the peak Python heap of each scenario (slows everything down)')
+    parser.add_argument('--output', help=f'file the results are saved to, defaults to {RESULTS_DIR}/<timestamp>.json')
+    parser.add_argument('--compare', help='results of an earlier run to compare against')
+    parser.add_argument('--verbose', action='store_true', help="show the bot's own output")
+    args = parser.parse_args()
+
+    # The fake API runs in its own process, so its work doesn't count towards the bot's CPU, event loop or memory
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    server = multiprocessing.Process(target=fake_api.serve, kwargs={'rows': args.rows, 'latency': args.latency, 'jitter': args.jitter, 'ready': sender}, daemon=True)
+    server.start()
+    root = f'http://127.0.0.1:{receiver.recv()}/'
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(root, directory)
+        # Imported here, once the environment points it at the fake API
+        import YouTube_API as bot
+        names = [function.__name__ for function, _ in bot.all_reports(None, None)] + ['all']
+        scenarios = args.scenarios or names
+        unknown = set(scenarios) - set(names)
+        if unknown: parser.error(f"unknown scenarios {', '.join(sorted(unknown))}, expected some of {', '.join(names)}")
+
+        if args.heap: tracemalloc.start()
+        started = datetime.datetime.now()
+        print(f'{args.users} users x {args.iterations} iterations, {args.rows} rows, {args.latency * 1000:g}±{args.jitter * 1000:g} ms API latency{", warm caches" if args.warm else ""}\n')
+        print_header()
+        try: scenario_results = asyncio.run(run_benchmark(bot, root, scenarios, args))
+        finally: server.terminate()
+
+    results = {'started': started.isoformat(timespec='seconds'), 'commit': git_commit(), 'python': platform.python_version(),
+               'config': {**{name: getattr(args, name) for name in ('users', 'iterations', 'results', 'rows', 'latency', 'jitter', 'concurrency', 'warm')},
+                          **{name: getattr(bot, name) for name in ('API_WORKERS', 'HTTP_POOL_SIZE', 'API_RATE_LIMIT', 'QUERY_CACHE_MB', 'USE_ANALYTICS_STORE')}},
+               'scenarios': scenario_results}
+    path = args.output or os.path.join(RESULTS_DIR, f"{started.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nResults saved to {path}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import asyncio, json, os, threading
+from collections                    import OrderedDict
+
+# The channel configured through .env (CLIENT_SECRET / credentials.json), used by every Discord server & channel not mapped to another one
+DEFAULT_TENANT = 'default'
+
+# A YouTube channel served by the bot: where its credentials are, the Discord server/channel ids mapped to it,
+# its daily quota budgets per API and how many of its API calls may run at the same time
+class Tenant:
+    def __init__(self, name, credentials=None, discord=(), budgets=None, concurrency=4):
+        self.name = name
+        self.credentials = credentials
+        self.discord = [int(id) for id in discord]
+        self.budgets = budgets or {}
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiters = {}
+
+# Services & credentials of a tenant, rebuilt on demand after being evicted. Worker thread copies of the services
+# live in `threads`, so they are released together with the client
+class ChannelClient:
+    def __init__(self, tenant):
+        self.tenant = tenant
+        self.services = {}
+        self.credentials = {}
+        self.threads = threading.local()
+        self.lock = threading.Lock()
+
+# Tenants by name and Discord id, with an LRU of at most `max_clients` live clients
+class ChannelRegistry:
+    def __init__(self, tenants, max_clients):
+        self.tenants = {tenant.name: tenant for tenant in tenants}
+        self.max_clients = max_clients
+        # Discord channel ids take precedence over server ids, they are more specific
+        self.routes = {id: tenant.name for tenant in self.tenants.values() for id in tenant.discord}
+        self.clients = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    # {"name": {"credentials": "path.json", "discord": [server or channel ids], "quota": {"youtube": units}, "concurrency": 4}, ...}
+    # Without a `concurrency`, a lone channel may use all `workers` and channels sharing them half each
+    @classmethod
+    def from_file(cls, path, max_clients, concurrency, workers):
+        configs = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                configs = json.load(f)
+        if concurrency is None:
+            concurrency = workers if not set(configs) - {DEFAULT_TENANT} else max(1, workers // 2)
+
+        tenants = {DEFAULT_TENANT: Tenant(DEFAULT_TENANT, concurrency=concurrency)}
+        for name, config in configs.items():
+            if name != DEFAULT_TENANT and not config.get('credentials'):
+                raise Exception(f"Channel '{name}' in {path} is missing its credentials file.")
+            tenants[name] = Tenant(name, config.get('credentials'), config.get('discord', ()), config.get('quota'), config.get('concurrency', concurrency))
+        return cls(tenants.values(), max_clients)
+
+    def resolve(self, guild_id=None, channel_id=None):
+        return self.routes.get(channel_id) or self.routes.get(guild_id) or DEFAULT_TENANT
+
+    def tenant(self, name):
+        return self.tenants[name]
+
+    # The live client for `name`, the least recently used one is dropped once there are more than max_clients.
+    # Requests already running keep their (evicted) client's services alive until they finish
+    def client(self, name):
+        with self.lock:
+            client = self.clients.get(name)
+            if client is None:
+                client = self.clients[name] = ChannelClient(self.tenants[name])
+            self.clients.move_to_end(name)
+            while len(self.clients) > self.max_clients:
+                self.clients.popitem(last=False)
+                self.evictions += 1
+        return client
+
+    def stats(self):
+        return {'configured': len(self.tenants), 'live': len(self.clients), 'evicted': self.evictions}
@@ -0,0 +1,32 @@
+import datetime, io
+
+CHART_STYLES = ('line', 'bar', 'area')
+
+# Panels of a trend chart, top to bottom: (title, metric, colour)
+TREND_PANELS = (('Views', 'views', '#5865F2'), ('Revenue ($)', 'estimatedRevenue', '#57F287'), ('CPM ($)', 'cpm', '#FEE75C'))
+
+# PNG of one panel per metric over `days`, `series` maps each metric to its daily values.
+# Runs in a chart worker process, so matplotlib is only ever imported (and its rendering only ever run) there
+def render_trend(title, days, series, style='line'):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt, matplotlib.dates as mdates
+
+    dates = [datetime.date.fromisoformat(day) for day in days]
+    with plt.style.context('dark_background'):
+        figure, axes = plt.subplots(len(TREND_PANELS), 1, figsize=(10, 8), sharex=True)
+        for axis, (name, metric, colour) in zip(axes, TREND_PANELS):
+            values = series[metric]
+            if style == 'bar': axis.bar(dates, values, color=colour, width=0.8)
+            else:
+                axis.plot(dates, values, color=colour, linewidth=1.5)
+                if style == 'area': axis.fill_between(dates, values, color=colour, alpha=0.3)
+            axis.set_title(name, loc='left', fontsize=10)
+            axis.grid(alpha=0.2)
+        axes[-1].xaxis.set_major_formatter(mdates.ConciseDateFormatter(mdates.AutoDateLocator()))
+        figure.suptitle(title)
+        figure.tight_layout()
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format='png', dpi=100)
+        plt.close(figure)
+    return buffer.getvalue()
@@ -0,0 +1,90 @@
+import datetime
+import numpy as np
+
+from analytics_store                import WEIGHTED_METRICS
+
+# Days of the rolling average shown for the end of each period
+ROLLING_DAYS = 7
+
+# Named comparisons: the period to date vs the one before it (or the same one a year earlier)
+COMPARE_PRESETS = ('week', 'month', 'year', 'week_yoy', 'month_yoy')
+
+# ((start, end), (previous start, previous end)) dates of a preset on `today`, the previous period covers the same days where it can
+def preset_periods(name, today):
+    if name == 'week':
+        start = today - datetime.timedelta(days=today.weekday())
+        previous = start - datetime.timedelta(days=7)
+    elif name == 'week_yoy':
+        # 52 weeks back, so weekdays line up
+        start = today - datetime.timedelta(days=today.weekday())
+        previous = start - datetime.timedelta(weeks=52)
+    elif name == 'month':
+        start = today.replace(day=1)
+        previous = (start - datetime.timedelta(days=1)).replace(day=1)
+    elif name == 'month_yoy':
+        start = today.replace(day=1)
+        previous = start.replace(year=start.year - 1)
+    elif name == 'year':
+        start = today.replace(month=1, day=1)
+        previous = start.replace(year=start.year - 1)
+    else:
+        raise ValueError(f"Unknown comparison '{name}', expected one of {', '.join(COMPARE_PRESETS)}")
+    # A month shorter than the days so far ends where the current period starts, per day rates still compare
+    return (start, today), (previous, min(previous + (today - start), start - datetime.timedelta(days=1)))
+
+# The period of the same length right before start - end
+def preceding_period(start, end):
+    days = end - start + datetime.timedelta(days=1)
+    return start - days, end - days
+
+# Day level series of one period as a metrics x days array, days without rows are zeros
+class Series:
+    def __init__(self, metrics, start, end, response):
+        self.metrics = list(metrics)
+        self.days = np.arange(np.datetime64(start), np.datetime64(end) + 1)
+        self.values = np.zeros((len(self.metrics), len(self.days)))
+        columns = [header['name'] for header in response.get('columnHeaders', [])]
+        rows = response.get('rows') or []
+        if rows:
+            table = np.array(rows, dtype=object)
+            index = (table[:, columns.index('day')].astype('datetime64[D]') - self.days[0]).astype(np.int64)
+            self.values[:, index] = table[:, [columns.index(metric) for metric in self.metrics]].astype(np.float64).T
+
+    # Weights of the ratio metrics (e.g. cpm by adImpressions), 1 for the summable ones
+    def weights(self):
+        weights = np.ones_like(self.values)
+        for row, metric in enumerate(self.metrics):
+            weight = WEIGHTED_METRICS.get(metric)
+            if weight in self.metrics: weights[row] = self.values[self.metrics.index(weight)]
+        return weights
+
+    # Summable metrics are summed, ratio metrics averaged weighted by the metric they are a rate of
+    def totals(self):
+        weights = self.weights()
+        weighted = (self.values * weights).sum(axis=1)
+        totals = np.divide(weighted, weights.sum(axis=1), out=np.zeros(len(self.metrics)), where=weights.sum(axis=1) != 0)
+        return np.where(self.ratios(), totals, self.values.sum(axis=1))
+
+    def ratios(self):
+        return np.array([WEIGHTED_METRICS.get(metric) in self.metrics for metric in self.metrics])
+
+    # Totals per day, ratio metrics are already rates
+    def per_day(self):
+        return np.where(self.ratios(), self.totals(), self.values.sum(axis=1) / len(self.days))
+
+    # Mean of the last `days` days (fewer when the period is shorter), ratio metrics weighted like the totals
+    def rolling(self, days=ROLLING_DAYS):
+        weights = self.weights()[:, -days:]
+        sums, counts = (self.values[:, -days:] * weights).sum(axis=1), weights.sum(axis=1)
+        return np.divide(sums, counts, out=np.zeros(len(self.metrics)), where=counts != 0)
+
+# Current vs previous totals, per day rates & rolling averages, with the changes between them. Every value is an array over the metrics
+def compare(current, previous):
+    result = {}
+    for name, measure in (('total', Series.totals), ('per_day', Series.per_day), ('rolling', Series.rolling)):
+        now, before = measure(current), measure(previous)
+        result[name] = (now, before)
+    now, before = result['total']
+    result['delta'] = now - before
+    result['change'] = np.divide(result['delta'] * 100, np.abs(before), out=np.full(len(before), np.nan), where=before != 0)
+    return result
@@ -0,0 +1,87 @@
+import sqlite3, threading, datetime, json, time
+
+# Allowed values of the five cron fields: minute, hour, day of month, month & day of week (0 or 7 = Sunday)
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+CRON_ALIASES = {'@hourly': '0 * * * *', '@daily': '0 0 * * *', '@weekly': '0 0 * * 0', '@monthly': '0 0 1 * *'}
+
+def parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        part, _, step = part.partition('/')
+        if part == '*': start, end = low, high
+        elif '-' in part: start, end = map(int, part.split('-'))
+        else: start = end = int(part)
+        # '5/15' means every 15 starting at 5
+        if step and part != '*' and '-' not in part: end = high
+        values.update(range(start, end + 1, int(step or 1)))
+    if not values or min(values) < low or max(values) > high:
+        raise ValueError(f'Cron field "{field}" must be within {low}-{high}')
+    return values
+
+# Standard 5 field cron spec (e.g. '0 9 * * 1' for Mondays at 9:00), evaluated in the bot's local time
+class CronSpec:
+    def __init__(self, spec):
+        self.spec = spec
+        fields = CRON_ALIASES.get(spec, spec).split()
+        if len(fields) != 5: raise ValueError(f'Cron spec "{spec}" needs 5 fields: minute hour day month weekday')
+        self.minutes, self.hours, self.days, self.months, weekdays = (parse_cron_field(field, *limits) for field, limits in zip(fields, CRON_FIELDS))
+        self.weekdays = {weekday % 7 for weekday in weekdays}
+        self.any_day, self.any_weekday = fields[2] == '*', fields[4] == '*'
+
+    def matches_day(self, date):
+        day, weekday = date.day in self.days, (date.weekday() + 1) % 7 in self.weekdays
+        # Like cron, when both the day of month and day of week are restricted either one matching is enough
+        if self.any_day or self.any_weekday: return day and weekday
+        return day or weekday
+
+    # First minute after `after` the spec matches
+    def next_run(self, after):
+        moment = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        for _ in range(366 * 8):
+            if moment.month in self.months and self.matches_day(moment.date()):
+                for hour in sorted(hour for hour in self.hours if hour >= moment.hour):
+                    minutes = [minute for minute in sorted(self.minutes) if hour > moment.hour or minute >= moment.minute]
+                    if minutes: return moment.replace(hour=hour, minute=minutes[0])
+            moment = (moment + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+        raise ValueError(f'Cron spec "{self.spec}" never matches')
+
+DIGEST_NAMES = {'yesterday': 'Yesterday', 'week': 'Week to date', 'month': 'Month to date'}
+
+# (start, end) dates a digest covers when it is posted on `day`
+def digest_range(digest, day):
+    if digest == 'yesterday':
+        yesterday = day - datetime.timedelta(days=1)
+        return yesterday.isoformat(), yesterday.isoformat()
+    if digest == 'week':
+        return (day - datetime.timedelta(days=day.weekday())).isoformat(), day.isoformat()
+    if digest == 'month':
+        return day.replace(day=1).isoformat(), day.isoformat()
+    raise ValueError(f'Unknown digest "{digest}", expected yesterday, week or month')
+
+# Digests computed ahead of their posting time, persisted so a restart in between doesn't lose them.
+# Each one is a list of ('embed', embed dict) or ('text', message) parts
+class DigestStore:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS digests (channel INTEGER, run_at TEXT, digest TEXT, parts TEXT, computed_at REAL, PRIMARY KEY (channel, run_at, digest))')
+
+    def save(self, channel, run_at, digest, parts):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?)', (channel, run_at, digest, json.dumps(parts), time.time()))
+
+    # The stored parts, removed from the store, or None if the digest wasn't precomputed
+    def take(self, channel, run_at, digest):
+        with self.lock, self.db:
+            row = self.db.execute('SELECT parts FROM digests WHERE channel = ? AND run_at = ? AND digest = ?', (channel, run_at, digest)).fetchone()
+            self.db.execute('DELETE FROM digests WHERE channel = ? AND run_at = ? AND digest = ?', (channel, run_at, digest))
+        return json.loads(row[0]) if row else None
+
+    # Digests whose posting time passed while the bot was offline are never sent
+    def prune(self, before):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM digests WHERE run_at < ?', (before,))
+
+    def close(self):
+        with self.lock: self.db.close()
@@ -0,0 +1,79 @@
+import argparse, asyncio, csv, datetime, gzip, json, os
+
+# Parquet needs pyarrow, which isn't installed by default (pip install pyarrow)
+try:
+    import pyarrow, pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+# Rows kept in memory before they become one Parquet row group
+PARQUET_ROW_GROUP = 50000
+
+def export_filename(by, start, end, format):
+    # CSV & JSONL are gzipped, Parquet compresses its own columns
+    return f'{by}_{start}_{end}.{format}' + ('' if format == 'parquet' else '.gz')
+
+# Writes rows to `path` as they arrive, so an export never holds more than a batch (or a Parquet row group) in memory.
+# `columns` are the column names, `numeric` the ones holding metric values
+class ExportWriter:
+    def __init__(self, path, format, columns, numeric=()):
+        if format not in EXPORT_FORMATS: raise ValueError(f"Unknown export format '{format}', expected one of {', '.join(EXPORT_FORMATS)}")
+        if format == 'parquet' and pyarrow is None: raise ValueError('Parquet exports need pyarrow, install it with: pip install pyarrow')
+        self.path, self.format, self.columns = path, format, list(columns)
+        self.rows = 0
+        self.pending = []
+        if format == 'parquet':
+            self.schema = pyarrow.schema([(column, pyarrow.float64() if column in numeric else pyarrow.string()) for column in self.columns])
+            self.file = pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+        else:
+            self.file = gzip.open(path, 'wt', newline='', encoding='utf-8')
+            if format == 'csv':
+                self.csv = csv.writer(self.file)
+                self.csv.writerow(self.columns)
+
+    def write(self, rows):
+        if self.format == 'csv':
+            self.csv.writerows(rows)
+        elif self.format == 'jsonl':
+            self.file.writelines(json.dumps(dict(zip(self.columns, row))) + '\n' for row in rows)
+        else:
+            self.pending.extend(rows)
+            if len(self.pending) >= PARQUET_ROW_GROUP: self.flush()
+        self.rows += len(rows)
+
+    def flush(self):
+        if not self.pending: return
+        columns = list(zip(*self.pending))
+        arrays = [pyarrow.array([None if value is None else (float(value) if field.type == pyarrow.float64() else str(value)) for value in values], field.type)
+                  for field, values in zip(self.schema, columns)]
+        self.file.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+        self.pending = []
+
+    def close(self):
+        if self.format == 'parquet': self.flush()
+        self.file.close()
+
+# python exports.py video 2023-01-01 2024-12-31 --format parquet --output finance.parquet
+def main():
+    parser = argparse.ArgumentParser(description='Export daily YouTube Analytics rows per video or country')
+    parser.add_argument('by', choices=('video', 'country'), help='dimension each day is broken down by')
+    parser.add_argument('start', help='first day (YYYY-MM-DD)')
+    parser.add_argument('end', nargs='?', default=datetime.date.today().isoformat(), help='last day (YYYY-MM-DD), defaults to today')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--output', help='file to write, defaults to <by>_<start>_<end>.<format>[.gz]')
+    parser.add_argument('--channel', help='channel from CHANNELS_CONFIG to export, defaults to the one in .env')
+    args = parser.parse_args()
+
+    # Imported here: YouTube_API imports this module, and it reads .env & its credentials settings on import, which only the
+    # command line needs. The channel is chosen once it is loaded
+    import YouTube_API
+    YouTube_API.print_dev_mode()
+    if args.channel: YouTube_API.TENANT.set(args.channel)
+    path = args.output or export_filename(args.by, args.start, args.end, args.format)
+    rows = asyncio.run(YouTube_API.export_analytics(args.by, args.start, args.end, args.format, path))
+    print(f'{rows:,} rows written to {path} ({os.path.getsize(path) / 1024 / 1024:.2f} MB)')
+
+if __name__ == '__main__':
+    main()
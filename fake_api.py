@@ -0,0 +1,215 @@
+import argparse, datetime, email.parser, hashlib, json, os, random, re, threading, time
+from collections                    import Counter
+from http.server                    import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse                   import parse_qsl, urlsplit
+
+API_SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'API_Service')
+DISCOVERY_FILES = {'youtubeAnalytics': 'Analytics-Service.json', 'youtube': 'YouTube-Data-API.json'}
+
+# Values of the dimensions that have a fixed set, the others are numbered (video1, video2, ...)
+DIMENSION_VALUES = {
+    'country': ('US', 'GB', 'CA', 'DE', 'IN', 'BR', 'FR', 'AU', 'JP', 'MX', 'ES', 'IT', 'NL', 'PL', 'SE', 'KR', 'PH', 'ID', 'TR', 'RU'),
+    'ageGroup': ('age13-17', 'age18-24', 'age25-34', 'age35-44', 'age45-54', 'age55-64', 'age65-'),
+    'gender': ('female', 'male', 'user_specified'),
+    'adType': ('auctionBumperInstream', 'auctionDisplay', 'auctionInstream', 'auctionTrueviewInstream', 'reservedInstream'),
+    'operatingSystem': ('ANDROID', 'IOS', 'WINDOWS', 'MACINTOSH', 'LINUX', 'CHROMECAST', 'SMART_TV', 'PLAYSTATION', 'XBOX'),
+    'insightTrafficSourceType': ('YT_SEARCH', 'SUGGESTED', 'BROWSE', 'EXT_URL', 'PLAYLIST', 'NOTIFICATION', 'SUBSCRIBER', 'SHORTS'),
+    'sharingService': ('WHATS_APP', 'COPY_PASTE', 'FACEBOOK', 'TWITTER', 'REDDIT', 'EMAIL', 'TELEGRAM', 'DISCORD'),
+}
+
+# Methods of the discovery documents as (HTTP method, path regex, method description), paths as requested from the server
+def load_routes(directory=API_SERVICE_DIR):
+    routes = []
+    for api, filename in DISCOVERY_FILES.items():
+        with open(os.path.join(directory, filename)) as f:
+            document = json.load(f)
+        resources = list(document.get('resources', {}).values())
+        while resources:
+            resource = resources.pop()
+            resources.extend(resource.get('resources', {}).values())
+            for method in resource.get('methods', {}).values():
+                path = re.sub(r'\{\+?(\w+)\}', r'(?P<\1>[^?]+)', method.get('flatPath', method['path']))
+                routes.append((method['httpMethod'], re.compile(f'/{api}/{document["servicePath"]}{path}$'), method))
+    return routes
+
+# A copy of the discovery documents whose root URLs point at `root` (e.g. http://127.0.0.1:8090/), so services built from them
+# send every request (and batch) to the fake API
+def write_discovery(directory, root, source=API_SERVICE_DIR):
+    os.makedirs(directory, exist_ok=True)
+    for api, filename in DISCOVERY_FILES.items():
+        with open(os.path.join(source, filename)) as f:
+            document = json.load(f)
+        document['rootUrl'] = f'{root}{api}/'
+        document['baseUrl'] = document['rootUrl'] + document['servicePath']
+        with open(os.path.join(directory, filename), 'w') as f:
+            json.dump(document, f)
+
+def days_between(start, end):
+    start, end = datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)
+    return [(start + datetime.timedelta(days=day)).isoformat() for day in range((end - start).days + 1)]
+
+# Synthetic Analytics report: every combination of the requested dimensions up to `rows` rows (days are the range's days),
+# seeded by the query so the same query always returns the same numbers
+def analytics_report(params, rows):
+    dimensions = [name for name in params.get('dimensions', '').split(',') if name]
+    metrics = [name for name in params.get('metrics', 'views').split(',') if name]
+    generator = random.Random(hashlib.md5(json.dumps(sorted(params.items())).encode()).digest())
+    if not dimensions:
+        count = 1
+    elif dimensions == ['day']:
+        count = len(days_between(params['startDate'], params['endDate']))
+    else:
+        count = rows
+    first = int(params.get('startIndex', 1)) - 1
+    count = max(0, min(count - first, int(params.get('maxResults', count))))
+
+    days = days_between(params['startDate'], params['endDate']) if 'day' in dimensions else ()
+    table = []
+    for index in range(first, first + count):
+        row = []
+        for dimension in dimensions:
+            if dimension == 'day': row.append(days[index % len(days)])
+            elif dimension in DIMENSION_VALUES: row.append(DIMENSION_VALUES[dimension][index % len(DIMENSION_VALUES[dimension])])
+            else: row.append(f'{dimension}{index}')
+        # Larger values first, like the reports sorted by a metric
+        row.extend(round(generator.uniform(0.5, 1) * 1000 / (index + 1) * (1 if metric not in ('cpm', 'playbackBasedCpm') else 0.01), 2) for metric in metrics)
+        table.append(row)
+    headers = [{'name': name, 'columnType': 'DIMENSION', 'dataType': 'STRING'} for name in dimensions]
+    headers += [{'name': name, 'columnType': 'METRIC', 'dataType': 'FLOAT'} for name in metrics]
+    return {'kind': 'youtubeAnalytics#resultTable', 'columnHeaders': headers, 'rows': table}
+
+# Data API list: one item per requested id (or the channel itself for mine=true), each with a title
+def data_list(method, params):
+    ids = [id for id in params.get('id', '').split(',') if id] or (['UCbenchmark'] if params.get('mine') else [])
+    kind = method['id'].split('.')[1]
+    return {'kind': f'youtube#{kind}ListResponse', 'pageInfo': {'totalResults': len(ids), 'resultsPerPage': len(ids)},
+            'items': [{'kind': f'youtube#{kind}', 'id': id, 'etag': hashlib.md5(id.encode()).hexdigest(), 'snippet': {'title': f'{kind.title()} {id}'}} for id in ids]}
+
+def error_body(status, message):
+    return {'error': {'code': status, 'message': message, 'errors': [{'message': message, 'domain': 'global', 'reason': 'badRequest' if status == 400 else 'notFound'}]}}
+
+# Stand-in for the YouTube Analytics & Data APIs, routed by the bundled discovery documents. Every request (and every part of
+# a batch) waits `latency` ± `jitter` seconds, reports with dimensions have `rows` rows. Counts calls per method & round trips
+class FakeYouTube(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, rows=50, latency=0.1, jitter=0.0, directory=API_SERVICE_DIR):
+        super().__init__(address, FakeHandler)
+        self.rows, self.latency, self.jitter = rows, latency, jitter
+        self.routes = load_routes(directory)
+        self.calls = Counter()
+        self.round_trips = 0
+        self.lock = threading.Lock()
+
+    @property
+    def root(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}/'
+
+    def wait(self):
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    # (status, headers, body) of one API request
+    def respond(self, http_method, uri, headers):
+        parts = urlsplit(uri)
+        for route_method, pattern, method in self.routes:
+            match = pattern.match(parts.path)
+            if route_method != http_method or not match: continue
+            params = {**dict(parse_qsl(parts.query)), **match.groupdict()}
+            with self.lock: self.calls[method['id']] += 1
+            missing = [name for name, parameter in method.get('parameters', {}).items() if parameter.get('required') and name not in params]
+            if missing: return 400, {}, error_body(400, f"Required parameter: {', '.join(missing)}")
+
+            if method['id'] == 'youtubeAnalytics.reports.query':
+                return 200, {}, analytics_report(params, self.rows)
+            if method['id'].startswith('youtube.') and method['id'].endswith('.list'):
+                body = data_list(method, params)
+                etag = hashlib.md5(json.dumps(body, sort_keys=True).encode()).hexdigest()
+                if headers.get('if-none-match') == etag: return 304, {'ETag': etag}, None
+                return 200, {'ETag': etag}, {**body, 'etag': etag}
+            return 200, {}, {'kind': method['id']}
+        return 404, {}, error_body(404, f'{http_method} {parts.path} is not a method of the bundled discovery documents')
+
+    def stats(self):
+        with self.lock: return {'calls': dict(self.calls), 'round_trips': self.round_trips}
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.round_trips = 0
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status, headers, body, content_type='application/json'):
+        payload = b'' if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode())
+        self.send_response(status)
+        for name, value in {'Content-Type': content_type, **headers}.items(): self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_GET(self):
+        if self.path == '/_fake/stats': return self.send(200, {}, self.server.stats())
+        self.answer('GET')
+
+    def do_POST(self):
+        if self.path == '/_fake/reset':
+            self.body()
+            self.server.reset()
+            return self.send(200, {}, self.server.stats())
+        if self.path.endswith('/batch'): return self.batch()
+        self.body()
+        self.answer('POST')
+
+    def answer(self, method):
+        with self.server.lock: self.server.round_trips += 1
+        self.server.wait()
+        status, headers, body = self.server.respond(method, self.path, {key.lower(): value for key, value in self.headers.items()})
+        self.send(status, headers, body)
+
+    # A multipart/mixed batch: one round trip & one wait, each part answered like a request of its own
+    def batch(self):
+        with self.server.lock: self.server.round_trips += 1
+        self.server.wait()
+        message = email.parser.Parser().parsestr(f"Content-Type: {self.headers['Content-Type']}\r\n\r\n" + self.body().decode())
+        boundary = f'batch_{random.getrandbits(64):016x}'
+        parts = []
+        for part in message.get_payload():
+            request_line, rest = part.get_payload().split('\n', 1)
+            method, uri, _ = request_line.split(' ', 2)
+            headers = {key.lower(): value for key, value in email.parser.Parser().parsestr(rest, headersonly=True).items()}
+            status, response_headers, body = self.server.respond(method, uri, headers)
+            lines = [f'HTTP/1.1 {status} {"OK" if status == 200 else "Not Modified" if status == 304 else "Error"}', 'Content-Type: application/json',
+                     *(f'{name}: {value}' for name, value in response_headers.items())]
+            content = '' if body is None else json.dumps(body)
+            parts.append(f'--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{part["Content-ID"][1:]}\r\n\r\n' + '\r\n'.join(lines) + f'\r\n\r\n{content}\r\n')
+        self.send(200, {}, (''.join(parts) + f'--{boundary}--\r\n').encode(), f'multipart/mixed; boundary={boundary}')
+
+# Serves until interrupted, `ready` (a multiprocessing connection) is sent the port once the server listens
+def serve(host='127.0.0.1', port=0, rows=50, latency=0.1, jitter=0.0, ready=None):
+    server = FakeYouTube((host, port), rows, latency, jitter)
+    if ready is not None: ready.send(server.server_address[1])
+    try: server.serve_forever()
+    except KeyboardInterrupt: pass
+    finally: server.server_close()
+
+# python fake_api.py --port 8090 --rows 200 --latency 0.15
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the YouTube Analytics & Data APIs, built from the discovery documents in API_Service/')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--rows', type=int, default=50, help='rows of each report with dimensions')
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds every request (or batch) takes')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random seconds added to or taken from the latency')
+    args = parser.parse_args()
+    print(f'Fake YouTube APIs on http://{args.host}:{args.port}/, point a copy of the discovery documents at it with write_discovery()')
+    serve(args.host, args.port, args.rows, args.latency, args.jitter)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import httplib2, requests, time
+
+from requests.adapters              import HTTPAdapter
+from urllib.parse                   import urlsplit
+from metrics                        import REGISTRY, SIZE_BUCKETS
+
+# Every HTTP round trip to Google (token refreshes, API requests & batches) by host
+HTTP_SECONDS = REGISTRY.histogram('google_http_request_seconds', 'HTTP round trips to Google by host and status', ('host', 'status'))
+HTTP_RESPONSE_BYTES = REGISTRY.histogram('google_http_response_bytes', 'Decoded response body sizes by host', ('host',), SIZE_BUCKETS)
+HTTP_ERRORS = REGISTRY.counter('google_http_errors_total', 'HTTP round trips that failed without a response, by host and exception', ('host', 'error'))
+
+# One keep-alive connection pool (urllib3, via requests) shared by every worker thread and the OAuth token refresh.
+# Each host gets at most `pool_size` connections, requests beyond that wait for a free one instead of opening more
+def create_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # requests decompresses gzip/deflate responses transparently
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    return session
+
+# Headers describing the raw (compressed) body, which is already decoded by the time httplib2 callers see it
+DECODED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+# httplib2.Http compatible facade over the shared session, so googleapiclient & the credential wrappers can use the pool.
+# Credential wrappers patch `request` on the instance they wrap, so every service gets its own (cheap) facade
+class PooledHttp:
+    def __init__(self, session, timeout=None):
+        self.session = session
+        self.timeout = timeout
+        self.connections = {}
+        self.follow_redirects = True
+        self.redirect_codes = frozenset((300, 301, 302, 303, 307, 308))
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        host, began = urlsplit(uri).hostname, time.perf_counter()
+        try:
+            response = self.session.request(method, uri, data=body, headers=headers, timeout=self.timeout, allow_redirects=self.follow_redirects and redirections > 0)
+        except Exception as e:
+            HTTP_ERRORS.inc(host=host, error=e.__class__.__name__)
+            raise
+        HTTP_SECONDS.observe(time.perf_counter() - began, host=host, status=response.status_code)
+        HTTP_RESPONSE_BYTES.observe(len(response.content), host=host)
+        info = {key.lower(): value for key, value in response.headers.items() if key.lower() not in DECODED_HEADERS}
+        info['status'] = str(response.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason
+        return resp, response.content
+
+    def close(self):
+        pass
+
+# Connections opened (each one a TCP + TLS handshake) and requests sent per host
+def pool_stats(session):
+    stats = {}
+    for adapter in dict.fromkeys(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        with pools.lock:
+            keys = list(pools.keys())
+        for key in keys:
+            pool = pools.get(key)
+            if pool is None: continue
+            host = stats.setdefault(pool.host, {'connections': 0, 'requests': 0})
+            host['connections'] += pool.num_connections
+            host['requests'] += pool.num_requests
+    return stats
@@ -1,5 +1,6 @@
-from flask import Flask
+from flask import Flask, Response
 from threading import Thread
+from metrics import REGISTRY
 
 app = Flask('')
 
@@ -7,6 +8,11 @@ app = Flask('')
 def home():
     return "I'm alivvveee! This is a Discord bot made by @Prem-ium on GitHub."
 
+# Prometheus scrape endpoint: API, HTTP, token refresh, command & button latency, errors, payload sizes and in-flight gauges
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 def run():
     app.run(host = '0.0.0.0', port = 8080)
 
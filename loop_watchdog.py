@@ -0,0 +1,70 @@
+import asyncio, sys, threading, time, traceback
+from collections                    import deque
+
+# A time the event loop couldn't run anything: how long, the task (command) that was running & where it was stuck
+class Stall:
+    def __init__(self, began, task, stack):
+        self.began, self.task, self.stack = began, task, stack
+        self.seconds = None
+        self.at = time.time()
+
+    def describe(self, frames=6):
+        return f"Event loop blocked for {self.seconds:.2f}s by {self.task}:\n" + ''.join(self.stack[-frames:])
+
+# Measures how late the event loop runs a heartbeat scheduled every `interval` seconds. A thread watches the heartbeat,
+# when it is more than `threshold` seconds late the loop is blocked by synchronous work and the loop thread's stack is
+# captured while it still is
+class LoopWatchdog:
+    def __init__(self, threshold=0.25, interval=0.1, history=600, on_lag=None, on_stall=None):
+        self.threshold, self.interval = threshold, interval
+        self.on_lag, self.on_stall = on_lag, on_stall
+        self.lags = deque(maxlen=history)
+        self.stalls = deque(maxlen=20)
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self.stall = None
+        self.beat = time.monotonic()
+        self.lock = threading.Lock()
+        self.loop = self.thread_id = None
+
+    def start(self):
+        self.loop, self.thread_id = asyncio.get_running_loop(), threading.get_ident()
+        self.beat = time.monotonic()
+        threading.Thread(target=self.monitor, name='loop-watchdog', daemon=True).start()
+        return asyncio.create_task(self.heartbeat(), name='loop-watchdog')
+
+    async def heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - expected)
+            with self.lock:
+                self.beat = time.monotonic()
+                self.lags.append(lag)
+                self.max_lag = max(self.max_lag, lag)
+                stall, self.stall = self.stall, None
+            if self.on_lag: self.on_lag(lag)
+            if stall is not None:
+                stall.seconds = lag
+                self.stalls.append(stall)
+                self.stall_count += 1
+                if self.on_stall: self.on_stall(stall)
+
+    # Runs in its own thread, so it keeps going while the loop is blocked
+    def monitor(self):
+        while True:
+            time.sleep(self.interval / 2)
+            with self.lock:
+                blocked = time.monotonic() - self.beat - self.interval
+                if blocked < self.threshold or self.stall is not None: continue
+                frame = sys._current_frames().get(self.thread_id)
+                task = asyncio.current_task(self.loop)
+                self.stall = Stall(self.beat + self.interval, task.get_name() if task else 'a callback outside any task', traceback.format_stack(frame) if frame else [])
+
+    def percentile(self, q):
+        lags = sorted(self.lags)
+        return lags[min(len(lags) - 1, int(q * len(lags)))] if lags else 0.0
+
+    def stats(self):
+        return {'lag_ms': round(1000 * (self.lags[-1] if self.lags else 0), 1), 'lag_p50_ms': round(1000 * self.percentile(0.5), 1),
+                'lag_p99_ms': round(1000 * self.percentile(0.99), 1), 'lag_max_ms': round(1000 * self.max_lag, 1), 'stalls': self.stall_count}
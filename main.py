@@ -30,13 +30,23 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import os, datetime, traceback, calendar, asyncio
+import os, datetime, traceback, calendar, asyncio, time, json, tempfile, io
+BOOT_STARTED = time.perf_counter()
 from calendar                       import monthrange
 from dotenv                         import load_dotenv
 import discord
 from discord.ext                    import commands
 
 from YouTube_API                    import *
+from digests                        import CronSpec, DigestStore, DIGEST_NAMES, digest_range
+from exports                        import EXPORT_FORMATS, export_filename
+from charts                         import CHART_STYLES
+from compare                        import COMPARE_PRESETS, preset_periods, preceding_period
+from metrics                        import REGISTRY
+from loop_watchdog                  import LoopWatchdog
+
+# Seconds spent in each startup step, reported once the bot is ready
+STARTUP_TIMINGS = {'import': time.perf_counter() - BOOT_STARTED}
 
 # Load the .env file & assign the variables
 load_dotenv()
@@ -52,9 +62,66 @@ DISCORD_CHANNEL = os.environ.get("DISCORD_CHANNEL", None)
 if DISCORD_CHANNEL:
     DISCORD_CHANNEL = int(DISCORD_CHANNEL)
 
-if (os.environ.get("KEEP_ALIVE", "False").lower() == "true"):
-    from keep_alive                 import keep_alive
-    keep_alive()
+# Maximum number of reports `!everything` fetches at the same time
+REPORT_CONCURRENCY = int(os.environ.get("REPORT_CONCURRENCY", 4))
+
+# Fetch every report of a button view in the background as soon as it is opened, and how many of those fetches run at once
+VIEW_PREFETCH = (os.environ.get("VIEW_PREFETCH", "False").lower() == "true")
+VIEW_PREFETCH_CONCURRENCY = int(os.environ.get("VIEW_PREFETCH_CONCURRENCY", REPORT_CONCURRENCY))
+PREFETCH_LANE = asyncio.Semaphore(VIEW_PREFETCH_CONCURRENCY)
+
+# Seconds between analytics store syncs
+STORE_SYNC_INTERVAL = int(os.environ.get("STORE_SYNC_INTERVAL", 6 * 60 * 60))
+
+# Seconds between background revalidations of cached video/playlist titles
+METADATA_REFRESH_INTERVAL = int(os.environ.get("METADATA_REFRESH_INTERVAL", 60 * 60))
+
+# Watch the daily metrics for unusual days & alert DISCORD_CHANNEL, and the seconds between polls
+ANOMALY_ALERTS = (os.environ.get("ANOMALY_ALERTS", "False").lower() == "true")
+ANOMALY_INTERVAL = int(os.environ.get("ANOMALY_INTERVAL", 60 * 60))
+
+# Command & button instrumentation, exposed on the keep alive server's /metrics
+COMMAND_SECONDS = REGISTRY.histogram('bot_command_seconds', 'Bot commands and view buttons by name and outcome', ('command', 'outcome'))
+COMMANDS_IN_FLIGHT = REGISTRY.gauge('bot_commands_in_flight', 'Bot commands and view buttons running', ('command',))
+
+# Discord user ids allowed to run admin commands (!profile), besides the bot's owner
+ADMIN_IDS = {int(id) for id in os.environ.get("ADMIN_IDS", "").split(',') if id.strip()}
+
+# One profile at a time, allocation tracing covers the whole process
+PROFILE_LOCK = asyncio.Lock()
+
+# Seconds the event loop may be blocked before the watchdog captures what is blocking it
+WATCHDOG_THRESHOLD = float(os.environ.get("WATCHDOG_THRESHOLD", 0.25))
+
+LOOP_LAG_SECONDS = REGISTRY.histogram('event_loop_lag_seconds', 'How late the event loop ran a heartbeat scheduled every 100ms')
+LOOP_STALLS = REGISTRY.counter('event_loop_stalls_total', 'Times the event loop was blocked past WATCHDOG_THRESHOLD, by the task (command) blocking it', ('task',))
+
+def report_stall(stall):
+    LOOP_STALLS.inc(task=stall.task)
+    print(stall.describe(frames=12))
+
+WATCHDOG = LoopWatchdog(WATCHDOG_THRESHOLD, on_lag=LOOP_LAG_SECONDS.observe, on_stall=report_stall)
+
+# Digests posted on a schedule, e.g. [{"channel": 123, "cron": "0 9 * * *", "digest": "yesterday", "reports": ["stats", "top_revenue"]}]
+try:
+    DIGESTS = json.loads(os.environ.get("DIGESTS", "[]"))
+except json.JSONDecodeError:
+    raise Exception("DIGESTS in .env is not a valid JSON string.")
+
+# Seconds before its posting time that a digest is computed
+DIGEST_LEAD = int(os.environ.get("DIGEST_LEAD", 30 * 60))
+
+# Send a report's embed & text, or the message run_report returned instead when it failed
+async def send_report(ctx, stats):
+    if not isinstance(stats, ReportResult):
+        await ctx.send(stats[:2000])
+        return
+    try:    await ctx.send(embed=stats[0])
+    except: pass
+    finally: await ctx.send(stats[1])
+
+async def is_admin(ctx):
+    return ctx.author.id in ADMIN_IDS or await ctx.bot.is_owner(ctx.author)
 
 # Change dates to API format
 async def update_dates (startDate, endDate):
@@ -86,66 +153,131 @@ async def update_dates (startDate, endDate):
             endDate = datetime.datetime.strptime(endDate, '%m/%d').strftime(f'{currentYear}/%m/%d').replace('/', '-')
     return startDate, endDate
 
+# Time every button of a view as '<prefix>:<label>'
+def instrument_buttons(view, prefix):
+    for item in view.children:
+        if not isinstance(item, discord.ui.Button): continue
+        async def callback(interaction, callback=item.callback, name=f'{prefix}:{item.label}'):
+            with COMMANDS_IN_FLIGHT.track(command=name), COMMAND_SECONDS.time(command=name):
+                await callback(interaction)
+        item.callback = callback
+
 class SimpleView(discord.ui.View):     
     startDate: datetime = datetime.datetime.now().strftime("%Y-%m-01")
     endDate: datetime = datetime.datetime.now().strftime("%Y-%m-%d")
 
+    # Reports behind the buttons by label, shared by prefetching and clicks
+    REPORTS = {
+        'Analytics':             lambda view: get_stats(start=view.startDate, end=view.endDate),
+        'Top Revenue Videos':    lambda view: top_revenue(results=10, start=view.startDate, end=view.endDate),
+        'Search Keyword Terms':  lambda view: get_traffic_source(results=10, start=view.startDate, end=view.endDate),
+        'Playlist Stats':        lambda view: get_playlist_stats(results=5, start=view.startDate, end=view.endDate),
+        'Geographic':            lambda view: get_detailed_georeport(results=5, startDate=view.startDate, endDate=view.endDate),
+        'OS Stats':              lambda view: get_operating_stats(results=5, start=view.startDate, end=view.endDate),
+        'Traffic Source':        lambda view: get_traffic_source(results=5, start=view.startDate, end=view.endDate),
+        'Shares':                lambda view: get_shares(results=5, start=view.startDate, end=view.endDate),
+        'Top Earning Countries': lambda view: top_countries_by_revenue(results=5, startDate=view.startDate, endDate=view.endDate),
+    }
+
     def __init__(self, startDate=datetime.datetime.now().strftime("%m/01/%y"), endDate=datetime.datetime.now().strftime("%m/%d/%y"), timeout=None):
         super().__init__(timeout=timeout)
+        self.tenant = TENANT.get()
+        self.prefetched = {}
+        instrument_buttons(self, 'button')
         async def initialize_dates():
             self.startDate, self.endDate = await update_dates(startDate, endDate)
+            self.prefetch()
         
         asyncio.ensure_future(initialize_dates())
+
+    # Start fetching every report for the current dates, replacing what was prefetched for the previous ones
+    def prefetch(self):
+        for task in self.prefetched.values(): task.cancel()
+        self.prefetched = {}
+        if not VIEW_PREFETCH: return
+        self.prefetched = {name: asyncio.ensure_future(self.prefetch_report(name)) for name in self.REPORTS}
+
+    # Speculative, so it runs as background work: it yields to commands and is deferred when quota is low.
+    # Returns the report & when it was fetched
+    async def prefetch_report(self, name):
+        background_job(f'prefetch:{name}')
+        async with PREFETCH_LANE:
+            set_deadline()
+            try: result = await self.REPORTS[name](self)
+            except Exception as e: result = f'{e.__class__.__name__}: {e}'
+            return result, time.monotonic()
+
+    # Serve a click from its prefetched report when that is ready & no older than the query cache would keep it (views don't
+    # time out, so one over the current month would otherwise show the day it was opened). A prefetch still running is
+    # cancelled, the click sends its own requests rather than joining the prefetch's ones queued in the background lane
+    async def fetch_report(self, name):
+        task = self.prefetched.get(name)
+        if task is not None and task.done() and not task.cancelled() and TENANT.get() == self.tenant:
+            result, fetched = task.result()
+            if isinstance(result, ReportResult) and time.monotonic() - fetched < QUERY_CACHE.ttl_for({'endDate': self.endDate}): return result
+        elif task is not None: task.cancel()
+        return await self.REPORTS[name](self)
+
+    async def on_timeout(self):
+        for task in self.prefetched.values(): task.cancel()
+        self.prefetched = {}
     
+    # Meter the button's API usage under its label, for the YouTube channel mapped to where it was clicked
+    async def interaction_check(self, interaction: discord.Interaction):
+        custom_id = (interaction.data or {}).get('custom_id')
+        label = next((item.label for item in self.children if getattr(item, 'custom_id', None) == custom_id), 'button')
+        set_command(f'button:{label}')
+        TENANT.set(CHANNELS.resolve(interaction.guild_id, interaction.channel_id))
+        set_deadline()
+        return True
+
     ##TODO: Add a way to resend buttons without making bot edit the message & destroy old stats
     async def update_buttons(self, interaction: discord.Interaction, embed: discord.Embed, response_str: str):
         await interaction.response.edit_message(content=response_str, embed=embed, view=self)
 
     @discord.ui.button(label='Analytics', style=discord.ButtonStyle.blurple)
     async def channel_stats(self, interaction: discord.Interaction, button: discord.ui.Button):
-        embed, response_str = await get_stats(start=self.startDate, end=self.endDate)
+        embed, response_str = await self.fetch_report('Analytics')
         await self.update_buttons(interaction, embed, response_str)
 
     @discord.ui.button(label="Top Revenue Videos", style=discord.ButtonStyle.blurple)
     async def top_earners(self, interaction: discord.Interaction, button: discord.ui.Button):
-        embed, response_str = await top_revenue(results=10, start=self.startDate, end=self.endDate)
+        embed, response_str = await self.fetch_report('Top Revenue Videos')
         await self.update_buttons(interaction, embed, response_str)
 
     @discord.ui.button(label="Search Keyword Terms", style=discord.ButtonStyle.blurple)
     async def search_stats(self, interaction: discord.Interaction, button: discord.ui.Button):
-        embed, response_str = await get_traffic_source(results=10, start=self.startDate, end=self.endDate)
+        embed, response_str = await self.fetch_report('Search Keyword Terms')
         await self.update_buttons(interaction, embed, response_str)
 
     @discord.ui.button(label='Playlist Stats', style=discord.ButtonStyle.blurple)
     async def playlist_stats(self, interaction: discord.Interaction, button: discord.ui.Button):
-        embed, response_str = await get_playlist_stats(results=5, start=self.startDate, end=self.endDate)
+        embed, response_str = await self.fetch_report('Playlist Stats')
         await self.update_buttons(interaction, embed, response_str)
     
     @discord.ui.button(label='Geographic', style=discord.ButtonStyle.blurple)
     async def geo_stats(self, interaction: discord.Interaction, button: discord.ui.Button):
-        embed, response_str = await get_detailed_georeport(results=5, startDate=self.startDate, endDate=self.endDate)
+        embed, response_str = await self.fetch_report('Geographic')
         await self.update_buttons(interaction, embed, response_str)
-        embed, response_str = await top_countries_by_revenue(results=5, start=self.startDate, end=self.endDate)
-        await interaction.response.edit_message(content=response_str, embed=embed, view=self)
 
     @discord.ui.button(label='OS Stats', style=discord.ButtonStyle.blurple)
     async def os_stats(self, interaction: discord.Interaction, button: discord.ui.Button):
-        embed, response_str = await get_operating_stats(results=5, start=self.startDate, end=self.endDate)
+        embed, response_str = await self.fetch_report('OS Stats')
         await self.update_buttons(interaction, embed, response_str)
     
     @discord.ui.button(label='Traffic Source', style=discord.ButtonStyle.blurple)
     async def traffic_source(self, interaction: discord.Interaction, button: discord.ui.Button):
-        embed, response_str = await get_traffic_source(results=5, start=self.startDate, end=self.endDate)
+        embed, response_str = await self.fetch_report('Traffic Source')
         await self.update_buttons(interaction, embed, response_str)
     
     @discord.ui.button(label='Shares', style=discord.ButtonStyle.blurple)
     async def shares(self, interaction: discord.Interaction, button: discord.ui.Button):
-        embed, response_str = await get_shares(results=5, start=self.startDate, end=self.endDate)
+        embed, response_str = await self.fetch_report('Shares')
         await self.update_buttons(interaction, embed, response_str)
     
     @discord.ui.button(label='Top Earning Countries', style=discord.ButtonStyle.blurple)
     async def highest_earning_countries(self, interaction: discord.Interaction, button: discord.ui.Button):
-        embed, response_str = await top_countries_by_revenue(results=5, startDate=self.startDate, endDate=self.endDate)
+        embed, response_str = await self.fetch_report('Top Earning Countries')
         await self.update_buttons(interaction, embed, response_str)
 
     @discord.ui.button(label='Refresh Token', style=discord.ButtonStyle.success)
@@ -157,31 +289,258 @@ class SimpleView(discord.ui.View):
     @discord.ui.button(label="Refresh Dates", style=discord.ButtonStyle.blurple)
     async def refresh_dates(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.startDate, self.endDate = await update_dates(startDate=datetime.datetime.now().strftime("%m/01/%y"), endDate=datetime.datetime.now().strftime("%m/%d/%y"))
+        self.prefetch()
         await interaction.response.send_message(f"Dates have been refreshed to {self.startDate} - {self.endDate}")
 
     @discord.ui.button(label='Ping!', style=discord.ButtonStyle.grey)
     async def got_ping(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.send_message('Pong!')
 
+# Pages through a ranked report with Previous / Next buttons. Each page is fetched (via the API's startIndex) the first time it is opened
+# & kept for going back, so a long report costs one small query per page actually viewed instead of one large query up front
+class ReportPager(discord.ui.View):
+    def __init__(self, name, startDate, endDate, timeout=600):
+        super().__init__(timeout=timeout)
+        self.name = name
+        self.startDate, self.endDate = startDate, endDate
+        self.tenant = TENANT.get()
+        self.page = 0
+        self.pages = {}
+        instrument_buttons(self, f'pages:{name}')
+
+    # The page's ReportResult, or the error message when it couldn't be fetched (not kept, so opening it again retries)
+    async def load(self, page):
+        if page not in self.pages:
+            result = await run_report(self.name, self.startDate, self.endDate, page=page)
+            if not isinstance(result, ReportResult): return result
+            self.pages[page] = result
+        self.page = page
+        return self.pages[page]
+
+    def render(self, result):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = not result.has_next
+        embed = result.embed
+        embed.set_footer(text=f'Page {self.page + 1}')
+        return embed
+
+    # Pages are metered under the report & fetched for the YouTube channel the report was opened for
+    async def interaction_check(self, interaction: discord.Interaction):
+        set_command(f'pages:{self.name}')
+        TENANT.set(self.tenant)
+        set_deadline()
+        return True
+
+    async def turn(self, interaction: discord.Interaction, page):
+        result = await self.load(page)
+        if not isinstance(result, ReportResult):
+            await interaction.response.send_message(result[:2000], ephemeral=True)
+            return
+        await interaction.response.edit_message(embed=self.render(result), view=self)
+
+    @discord.ui.button(label='Previous', style=discord.ButtonStyle.blurple, disabled=True)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.turn(interaction, max(0, self.page - 1))
+
+    @discord.ui.button(label='Next', style=discord.ButtonStyle.blurple)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.turn(interaction, self.page + 1)
+
+# Reports a digest can include, run over the digest's date range
+DIGEST_REPORTS = {
+    'stats':        lambda start, end: get_stats(start, end),
+    'top_revenue':  lambda start, end: top_revenue(10, start, end),
+    'geo_revenue':  lambda start, end: top_countries_by_revenue(10, start, end),
+    'geo_report':   lambda start, end: get_detailed_georeport(5, start, end),
+    'adtype':       lambda start, end: get_ad_preformance(start, end),
+    'demographics': lambda start, end: get_demographics(start, end),
+    'shares':       lambda start, end: get_shares(5, start, end),
+    'search':       lambda start, end: get_traffic_source(10, start, end),
+    'os':           lambda start, end: get_operating_stats(10, start, end),
+    'playlist':     lambda start, end: get_playlist_stats(5, start, end),
+}
+
+# Reports !pages can page through, those ranked by a dimension
+PAGED_REPORTS = [name for name, spec in REPORTS.items() if spec.paged]
+
+DIGEST_SCHEDULES = []
+for schedule in DIGESTS:
+    schedule = {'reports': ['stats'], **schedule, 'cron': CronSpec(schedule['cron'])}
+    if schedule['digest'] not in DIGEST_NAMES: raise Exception(f"Unknown digest '{schedule['digest']}' in DIGESTS, expected one of {', '.join(DIGEST_NAMES)}.")
+    unknown = [name for name in schedule['reports'] if name not in DIGEST_REPORTS]
+    if unknown: raise Exception(f"Unknown digest reports {unknown} in DIGESTS, expected some of {', '.join(DIGEST_REPORTS)}.")
+    DIGEST_SCHEDULES.append(schedule)
+
+DIGEST_STORE = Lazy(lambda: DigestStore(ANALYTICS_DB))
+
+# Run a digest's reports, the parts are JSON serializable so they can be stored until the digest is posted
+async def compute_digest(reports, start, end):
+    results = await asyncio.gather(*[DIGEST_REPORTS[name](start, end) for name in reports], return_exceptions=True)
+    parts = []
+    for name, result in zip(reports, results):
+        if isinstance(result, ReportResult): parts.append(('embed', result[0].to_dict()))
+        else: parts.append(('text', f'Error in {name}:\n{result}'[:2000]))
+    return parts
+
+async def sleep_until(moment):
+    await asyncio.sleep(max(0, (moment - datetime.datetime.now()).total_seconds()))
+
+async def timed_step(name, coroutine):
+    began = time.perf_counter()
+    try: return await coroutine
+    finally: STARTUP_TIMINGS[name] = time.perf_counter() - began
+
+async def startup_refresh():
+    try: print(await refresh_token())
+    except FileNotFoundError as e: print(f'{e.__class__.__name__, e}')
+
 if __name__ == "__main__":
-    # Refresh Token & Retrieve Channel ID at Launch 
-    try: refresh_token()
-    except FileNotFoundError as e: print(f'{e.__class__.__name__, e}{get_service()}')
+    # Only in the bot's own process, chart workers import this module again
+    print_dev_mode()
+    if (os.environ.get("KEEP_ALIVE", "False").lower() == "true"):
+        from keep_alive                 import keep_alive
+        keep_alive()
 
-    CHANNEL_ID = YOUTUBE_DATA.channels().list(part="id",mine=True).execute()['items'][0]['id']
     discord_intents = discord.Intents.all()
     bot = commands.Bot(command_prefix='!', intents=discord_intents)
     bot.remove_command('help')
 
-    if DISCORD_CHANNEL:
-        @bot.event
-        async def on_ready():
-            await bot.get_channel(DISCORD_CHANNEL).send(embed=discord.Embed(
+    # Refresh Token & Retrieve Channel ID at Launch (concurrently, they don't depend on each other), then start background jobs
+    @bot.event
+    async def setup_hook():
+        global CHANNEL_ID
+        set_command('startup')
+        WATCHDOG.start()
+        loop = asyncio.get_running_loop()
+        _, _, CHANNEL_ID = await asyncio.gather(
+            timed_step('refresh_token', startup_refresh()),
+            timed_step('build_services', asyncio.gather(*[loop.run_in_executor(API_EXECUTOR, base_service, api) for api in (ANALYTICS_API, DATA_API)])),
+            timed_step('channel_id', get_channel_id()),
+        )
+
+        asyncio.create_task(token_refresh_loop())
+        if ANALYTICS_STORE is not None: asyncio.create_task(store_sync_loop())
+        asyncio.create_task(metadata_refresh_loop())
+        for schedule in DIGEST_SCHEDULES: asyncio.create_task(digest_loop(schedule))
+        if ANOMALY_ALERTS and DISCORD_CHANNEL: asyncio.create_task(anomaly_loop())
+
+    # Keep the analytics store of every channel up to date, the first run backfills each channel's lifetime
+    async def store_sync_loop():
+        background_job('store_sync')
+        while True:
+            for tenant in list(CHANNELS.tenants):
+                TENANT.set(tenant)
+                try:
+                    queries = await sync_analytics_store()
+                    print(f'Analytics store of {tenant} synced ({queries} queries)\t{datetime.datetime.now().strftime("%m/%d %H:%M:%S")}')
+                except QuotaDeferred as e: print(e)
+                except Exception: print(f'Analytics store sync of {tenant} failed:\n{traceback.format_exc()}')
+            await asyncio.sleep(STORE_SYNC_INTERVAL)
+
+    # Poll every channel's newest complete days & post an alert for each unusual one
+    async def anomaly_loop():
+        background_job('anomaly_monitor')
+        await bot.wait_until_ready()
+        channel = bot.get_channel(DISCORD_CHANNEL)
+        while True:
+            for tenant in list(CHANNELS.tenants):
+                TENANT.set(tenant)
+                try:
+                    anomalies = await poll_anomalies()
+                    for day in sorted({anomaly.day for anomaly in anomalies}):
+                        await channel.send(embed=anomaly_embed(day, [anomaly for anomaly in anomalies if anomaly.day == day]))
+                except QuotaDeferred as e: print(e)
+                except Exception: print(f'Anomaly poll of {tenant} failed:\n{traceback.format_exc()}')
+            await asyncio.sleep(ANOMALY_INTERVAL)
+
+    # Revalidate cached video/playlist titles before they expire
+    async def metadata_refresh_loop():
+        background_job('metadata_refresh')
+        while True:
+            try:
+                refreshed = await refresh_expiring_metadata(margin=METADATA_REFRESH_INTERVAL)
+                if refreshed: print(f'Refreshed {refreshed} cached metadata sets\t{datetime.datetime.now().strftime("%m/%d %H:%M:%S")}')
+            except QuotaDeferred as e: print(e)
+            except Exception: print(f'Metadata refresh failed:\n{traceback.format_exc()}')
+            await asyncio.sleep(METADATA_REFRESH_INTERVAL)
+
+    # Compute each digest DIGEST_LEAD seconds ahead in the background lane (which also warms the caches the commands use),
+    # so posting it on schedule is just a send
+    async def digest_loop(schedule):
+        background_job(f"digest:{schedule['digest']}")
+        await bot.wait_until_ready()
+        channel = bot.get_channel(schedule['channel'])
+        if channel is None:
+            print(f"Digest channel {schedule['channel']} not found, {schedule['digest']} digest disabled")
+            return
+        TENANT.set(CHANNELS.resolve(channel.guild.id if getattr(channel, 'guild', None) else None, channel.id))
+        await asyncio.to_thread(DIGEST_STORE.prune, datetime.datetime.now().isoformat())
+
+        while True:
+            run_at = schedule['cron'].next_run(datetime.datetime.now())
+            start, end = digest_range(schedule['digest'], run_at.date())
+            await sleep_until(run_at - datetime.timedelta(seconds=DIGEST_LEAD))
+            try:
+                parts = await compute_digest(schedule['reports'], start, end)
+                # Digests with failed reports (e.g. deferred for quota) are computed again when posted
+                if all(kind == 'embed' for kind, _ in parts):
+                    await asyncio.to_thread(DIGEST_STORE.save, channel.id, run_at.isoformat(), schedule['digest'], parts)
+            except Exception: print(f"Precomputing {schedule['digest']} digest failed:\n{traceback.format_exc()}")
+
+            await sleep_until(run_at)
+            try:
+                parts = await asyncio.to_thread(DIGEST_STORE.take, channel.id, run_at.isoformat(), schedule['digest'])
+                if parts is None:
+                    BACKGROUND.set(False)
+                    set_deadline()
+                    try: parts = await compute_digest(schedule['reports'], start, end)
+                    finally:
+                        BACKGROUND.set(True)
+                        DEADLINE.set(None)
+
+                await channel.send(f"**{DIGEST_NAMES[schedule['digest']]} digest** ({start} - {end})")
+                for kind, value in parts:
+                    if kind == 'embed': await channel.send(embed=discord.Embed.from_dict(value))
+                    else:               await channel.send(value)
+                print(f"{schedule['digest']} digest sent to {channel.id}\t{datetime.datetime.now().strftime('%m/%d %H:%M:%S')}")
+            except Exception: print(f"Sending {schedule['digest']} digest failed:\n{traceback.format_exc()}")
+
+    # Meter every command's API usage under its name, run it for the YouTube channel mapped to this server/channel
+    # and give it COMMAND_DEADLINE seconds to finish
+    @bot.before_invoke
+    async def track_command(ctx):
+        set_command(ctx.command.name)
+        TENANT.set(CHANNELS.resolve(ctx.guild.id if ctx.guild else None, ctx.channel.id))
+        set_deadline()
+        ctx.began = time.perf_counter()
+        COMMANDS_IN_FLIGHT.inc(command=ctx.command.name)
+
+    # Commands catch their own errors to reply with them, only ones that escaped count as failed
+    @bot.after_invoke
+    async def time_command(ctx):
+        COMMANDS_IN_FLIGHT.dec(command=ctx.command.name)
+        COMMAND_SECONDS.observe(time.perf_counter() - ctx.began, command=ctx.command.name, outcome='error' if ctx.command_failed else 'ok')
+
+    @bot.event
+    async def on_ready():
+        # on_ready fires again after reconnects, only the first one is part of the cold start
+        if 'ready' in STARTUP_TIMINGS: return
+        STARTUP_TIMINGS['ready'] = time.perf_counter() - BOOT_STARTED
+        cold_start = f"Cold start: {STARTUP_TIMINGS['ready']:.2f}s (" + ', '.join(f'{name} {seconds:.2f}s' for name, seconds in STARTUP_TIMINGS.items() if name != 'ready') + ')'
+        print(cold_start)
+
+        if DISCORD_CHANNEL:
+            embed = discord.Embed(
                 title="YouTube Analytics Bot Online",
                 description="The bot is ready to provide YouTube analytics at your command!",
                 color=discord.Color.green()
-            ))
-            await bot.get_channel(DISCORD_CHANNEL).send(view=SimpleView())
+            )
+            embed.set_footer(text=cold_start)
+            channel = bot.get_channel(DISCORD_CHANNEL)
+            # The view prefetches for the YouTube channel its clicks will be for
+            TENANT.set(CHANNELS.resolve(channel.guild.id if getattr(channel, 'guild', None) else None, channel.id))
+            await channel.send(embed=embed)
+            await channel.send(view=SimpleView())
 
     # Help command
     @bot.command()
@@ -200,7 +559,15 @@ if __name__ == "__main__":
             {"command": "`!search`",      "parameters": "`[startDate] [endDate] [# of results]`",   "description": "Return top search terms by views",                              "example": "!search 01/01 12/1 5\n"},
             {"command": "`!os`",          "parameters": "`[startDate] [endDate] [# of results]`",   "description": "Return top operating systems by views",                         "example": "!os 01/01 12/1 5\n"},
             {"command": "`!playlist`",    "parameters": "`[startDate] [endDate] [# of results]`",   "description": "Return playlist stats",                                         "example": "!playlist 01/01 12/1\n"},
+            {"command": "`!pages`",       "parameters": "`[report] [startDate] [endDate]`",         "description": f"Page through a whole report ({', '.join(PAGED_REPORTS)})",     "example": "!pages geo_report 01/01 12/1\n"},
+            {"command": "`!compare`",     "parameters": "`[week/month/year/week_yoy/month_yoy]` or `[startDate] [endDate] [previousStart] [previousEnd]`", "description": "Compare every metric with a previous period", "example": "!compare month -- !compare 10/01 10/18 09/01 09/18\n"},
+            {"command": "`!trend`",       "parameters": "`[startDate] [endDate] [line/bar/area]`",  "description": "Chart of daily views, revenue and CPM",                         "example": "!trend 01/01 12/1 bar\n"},
+            {"command": "`!export`",      "parameters": "`[video/country] [startDate] [endDate] [csv/jsonl/parquet]`", "description": "Daily rows per video or country as a compressed file", "example": "!export video 01/01 12/1 csv\n"},
             {"command": "`!everything`",  "parameters": "`[startDate] [endDate]`",                  "description": "Return all available data",                                     "example": "!everything 01/01 12/1\n\n"},
+            {"command": "`!profile`",     "parameters": "`[report] [startDate] [endDate] [results]`", "description": "Profile one report run (admins only)",                          "example": "!profile get_detailed_georeport 01/01 01/31 10"},
+            {"command": "`!health`",      "parameters": "N/A",                                      "description": "Show event loop lag and what blocked it recently",              "example": "!health"},
+            {"command": "`!cache`",       "parameters": "N/A",                                      "description": "Show query cache hit/miss statistics",                          "example": "!cache"},
+            {"command": "`!quota`",       "parameters": "N/A",                                      "description": "Show today's API quota usage by command",                       "example": "!quota"},
             {"command": "`!refresh`",     "parameters": "N/A",                                      "description": "Refresh the API token",                                         "example": "!refresh"},
             {"command": "`!switch`",      "parameters": "N/A",                                      "description": "Toggle between dev and user mode (temporary)",                  "example": "!switch"},
             {"command": "`!restart`",     "parameters": "N/A",                                      "description": "Restart the bot",                                               "example": "!restart"},
@@ -236,9 +603,7 @@ if __name__ == "__main__":
         try:
             # Get the stats for the specified date range
             stats = await get_stats(startDate, endDate)        
-            try:    await ctx.send(embed=stats[0])
-            except: pass
-            finally: await ctx.send(stats[1])
+            await send_report(ctx, stats)
 
             print(f'\n{startDate} - {endDate} stats sent')
         except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
@@ -247,10 +612,8 @@ if __name__ == "__main__":
     @bot.command(aliases=['lifetime', 'alltime', 'allTime'])
     async def lifetime_method(ctx):
         try:
-            stats = await get_stats('2005-02-14', datetime.datetime.now().strftime("%Y-%m-%d"))
-            try:    await ctx.send(embed=stats[0])
-            except: pass
-            finally: await ctx.send(stats[1])
+            stats = await get_stats(LIFETIME_START, datetime.datetime.now().strftime("%Y-%m-%d"))
+            await send_report(ctx, stats)
         except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
 
     # Last month's stats
@@ -263,9 +626,7 @@ if __name__ == "__main__":
         endDate = endDate.replace(day=calendar.monthrange(endDate.year, endDate.month)[1])
         try:
             stats = await get_stats(startDate.strftime("%Y-%m-%d"), endDate.strftime("%Y-%m-%d"))
-            try:    await ctx.send(embed=stats[0])
-            except: pass
-            finally: await ctx.send(stats[1])
+            await send_report(ctx, stats)
             print(f'\nLast month ({startDate} - {endDate}) stats sent\n')
         except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
 
@@ -281,9 +642,7 @@ if __name__ == "__main__":
 
         try:
             stats = await get_stats(startDate, endDate)
-            try:    await ctx.send(embed=stats[0])
-            except: pass
-            finally: await ctx.send(stats[1])
+            await send_report(ctx, stats)
             print(f'\nLast month ({startDate} - {endDate}) stats sent\n')
         except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
 
@@ -294,9 +653,7 @@ if __name__ == "__main__":
         try:
             # Get the stats for the specified date range
             stats = await top_revenue(results, startDate, endDate)      
-            try:    await ctx.send(embed=stats[0])
-            except: pass
-            finally: await ctx.send(stats[1])
+            await send_report(ctx, stats)
             print(f'\n{startDate} - {endDate} top {results} sent')
         except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
 
@@ -306,9 +663,7 @@ if __name__ == "__main__":
         startDate, endDate = await update_dates(startDate, endDate)        
         try:
             stats = await top_countries_by_revenue(results, startDate, endDate)
-            try:    await ctx.send(embed=stats[0])
-            except: pass
-            finally: await ctx.send(stats[1])
+            await send_report(ctx, stats)
             print(f'\nLast month ({startDate} - {endDate}) geo-revenue report sent\n')
         except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
 
@@ -318,9 +673,7 @@ if __name__ == "__main__":
         startDate, endDate = await update_dates(startDate, endDate)
         try:
             stats = await get_detailed_georeport(results, startDate, endDate)
-            try:    await ctx.send(embed=stats[0])
-            except: pass
-            finally: await ctx.send(stats[1])
+            await send_report(ctx, stats)
             print(f'\n{startDate} - {endDate} earnings by country sent')
         except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
 
@@ -330,9 +683,7 @@ if __name__ == "__main__":
         startDate, endDate = await update_dates(startDate, endDate)
         try:
             stats = await get_ad_preformance(startDate, endDate)
-            try:    await ctx.send(embed=stats[0])
-            except: pass
-            finally: await ctx.send(stats[1])
+            await send_report(ctx, stats)
             print(f'\n{startDate} - {endDate} ad preformance sent')
         except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
 
@@ -342,9 +693,7 @@ if __name__ == "__main__":
         startDate, endDate = await update_dates(startDate, endDate)
         try:
             stats = await get_demographics(startDate, endDate)
-            try:    await ctx.send(embed=stats[0])
-            except: pass
-            finally: await ctx.send(stats[1])
+            await send_report(ctx, stats)
 
             print(f'\n{startDate} - {endDate} demographics sent')
         except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
@@ -354,9 +703,7 @@ if __name__ == "__main__":
         startDate, endDate = await update_dates(startDate, endDate)
         try:
             stats = await get_shares(results, startDate, endDate)
-            try:    await ctx.send(embed=stats[0])
-            except: pass
-            finally: await ctx.send(stats[1])
+            await send_report(ctx, stats)
 
             print(f'\n{startDate} - {endDate} shares result sent')
         except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
@@ -367,9 +714,7 @@ if __name__ == "__main__":
         startDate, endDate = await update_dates(startDate, endDate)
         try:
             stats = await get_traffic_source(results, startDate, endDate)
-            try:    await ctx.send(embed=stats[0])
-            except: pass
-            finally: await ctx.send(stats[1])
+            await send_report(ctx, stats)
             print(f'\n{startDate} - {endDate} search terms result sent')
         except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
             
@@ -379,9 +724,7 @@ if __name__ == "__main__":
         startDate, endDate = await update_dates(startDate, endDate)
         try:
             stats = await get_operating_stats(results, startDate, endDate)
-            try:    await ctx.send(embed=stats[0])
-            except: pass
-            finally: await ctx.send(stats[1])
+            await send_report(ctx, stats)
             print(f'\n{startDate} - {endDate} operating systems result sent')
         except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
 
@@ -391,12 +734,143 @@ if __name__ == "__main__":
         startDate, endDate = await update_dates(startDate, endDate)
         try:
             stats = await get_playlist_stats(results, startDate, endDate)
-            try:    await ctx.send(embed=stats[0])
-            except: pass
-            finally: await ctx.send(stats[1])
+            await send_report(ctx, stats)
             print(f'\n{startDate} - {endDate} playlist stats result sent')
         except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
 
+    # Any ranked report in full, a page at a time with Previous / Next buttons
+    @bot.command(aliases=['pages', 'paginate'])
+    async def paged_report(ctx, report='top_revenue', startDate=datetime.datetime.now().strftime("%m/01/%y"), endDate=datetime.datetime.now().strftime("%m/%d/%y")):
+        if report not in PAGED_REPORTS:
+            await ctx.send(f"Unknown report '{report}', expected one of {', '.join(PAGED_REPORTS)}.")
+            return
+        startDate, endDate = await update_dates(startDate, endDate)
+        try:
+            view = ReportPager(report, startDate, endDate)
+            result = await view.load(0)
+            if not isinstance(result, ReportResult):
+                await ctx.send(result[:2000])
+                return
+            await ctx.send(embed=view.render(result), view=view)
+            print(f'\n{startDate} - {endDate} {report} pages sent')
+        except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}'[:2000])
+
+    # Period over period comparison: a preset (this month vs last month by default), or two date ranges.
+    # Without the previous range a range is compared with the one of the same length before it
+    @bot.command(aliases=['compare', 'vs'])
+    async def compare_periods(ctx, period='month', endDate=None, previousStart=None, previousEnd=None):
+        try:
+            if period in COMPARE_PRESETS:
+                current, previous = [(start.isoformat(), end.isoformat()) for start, end in preset_periods(period, datetime.date.today())]
+            elif endDate is None:
+                await ctx.send(f"Usage: !compare [{'/'.join(COMPARE_PRESETS)}] or !compare startDate endDate [previousStart previousEnd]")
+                return
+            else:
+                current = await update_dates(period, endDate)
+                if previousStart and previousEnd: previous = await update_dates(previousStart, previousEnd)
+                else: previous = tuple(day.isoformat() for day in preceding_period(*map(datetime.date.fromisoformat, current)))
+            comparison = await get_comparison(current, previous)
+            if isinstance(comparison, str):
+                await ctx.send(comparison[:2000])
+                return
+            await ctx.send(embed=comparison[0])
+            print(f'\n{current[0]} - {current[1]} vs {previous[0]} - {previous[1]} comparison sent')
+        except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}'[:2000])
+
+    # Chart of daily views, revenue & CPM, defaults to current month
+    @bot.command(aliases=['trend', 'chart', 'graph'])
+    async def trend_chart(ctx, startDate=datetime.datetime.now().strftime("%m/01/%y"), endDate=datetime.datetime.now().strftime("%m/%d/%y"), style='line'):
+        if style not in CHART_STYLES:
+            await ctx.send(f"Unknown chart style '{style}', expected one of {', '.join(CHART_STYLES)}.")
+            return
+        startDate, endDate = await update_dates(startDate, endDate)
+        try:
+            chart = await get_trend(startDate, endDate, style)
+            if isinstance(chart, str):
+                await ctx.send(chart[:2000])
+                return
+            embed, png = chart
+            await ctx.send(embed=embed, file=discord.File(io.BytesIO(png), filename='trend.png'))
+            print(f'\n{startDate} - {endDate} {style} trend chart sent')
+        except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}'[:2000])
+
+    # Daily rows per video (or country) for a date range as a compressed file, e.g. for finance. Larger ranges than Discord can take
+    # are exported with the CLI instead: python exports.py video 2023-01-01 2024-12-31
+    @bot.command(aliases=['export', 'exportData', 'export_data'])
+    async def export_rep(ctx, by='video', startDate=datetime.datetime.now().strftime("%m/01/%y"), endDate=datetime.datetime.now().strftime("%m/%d/%y"), format='csv'):
+        if by not in EXPORT_METRICS or format not in EXPORT_FORMATS:
+            await ctx.send(f"Usage: !export [{'/'.join(EXPORT_METRICS)}] [startDate] [endDate] [{'/'.join(EXPORT_FORMATS)}]")
+            return
+        startDate, endDate = await update_dates(startDate, endDate)
+        await ctx.send(f'Exporting daily {by} rows for {startDate} - {endDate}, this can take a while...')
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, export_filename(by, startDate, endDate, format))
+                rows = await export_analytics(by, startDate, endDate, format, path)
+                size, limit = os.path.getsize(path), ctx.guild.filesize_limit if ctx.guild else 10 * 1024 * 1024
+                if size > limit:
+                    await ctx.send(f'The export ({size / 1024 / 1024:.1f} MB) is over the {limit / 1024 / 1024:.0f} MB upload limit, export a shorter range or use: python exports.py {by} {startDate} {endDate} --format {format}')
+                    return
+                await ctx.send(f'{rows:,} rows', file=discord.File(path))
+            print(f'\n{startDate} - {endDate} {by} export sent')
+        except (QuotaDeferred, ValueError) as e:  await ctx.send(f'Export stopped: {e}')
+        except (HttpError, DeadlineExceeded, *NETWORK_ERRORS) as e:  await ctx.send(describe_api_error(e))
+        except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}'[:2000])
+
+    # Profile one run of a report: where its time went (API wait, parsing, rendering), the hottest functions & allocations
+    @bot.command(aliases=['profile'])
+    async def profile_rep(ctx, report=None, startDate=datetime.datetime.now().strftime("%m/01/%y"), endDate=datetime.datetime.now().strftime("%m/%d/%y"), results=10):
+        if not await is_admin(ctx):
+            await ctx.send('Only admins can profile reports.')
+            return
+        startDate, endDate = await update_dates(startDate, endDate)
+        names = [function.__name__ for function, _ in all_reports(startDate, endDate)]
+        if report not in names or not str(results).isdigit():
+            await ctx.send(f"Usage: !profile [{'/'.join(names)}] [startDate] [endDate] [results]")
+            return
+        reports = {function.__name__: (function, args) for function, args in all_reports(startDate, endDate, int(results))}
+        try:
+            async with PROFILE_LOCK:
+                result, profile = await profile_report(*reports[report])
+            embed = discord.Embed(title=f'Profile of {report}', description=f'{startDate} - {endDate}', color=0x00ff00 if isinstance(result, ReportResult) else 0xff0000)
+            embed.add_field(name='Wall time', value=f'{profile.seconds * 1000:,.1f} ms', inline=True)
+            for name, seconds, count in profile.breakdown():
+                embed.add_field(name=name, value=f'{seconds * 1000:,.1f} ms' + (f' ({count} calls)' if count else ''), inline=True)
+            embed.add_field(name='Peak memory', value=f'{profile.peak / 1024:,.1f} KB', inline=True)
+            if not isinstance(result, ReportResult): embed.add_field(name='Report failed', value=str(result)[:1024], inline=False)
+            await ctx.send(embed=embed, file=discord.File(io.BytesIO(profile.report().encode()), filename=f"profile_{report}_{datetime.datetime.now():%Y%m%d_%H%M%S}.txt"))
+            print(f'\n{startDate} - {endDate} {report} profile sent')
+        except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}'[:2000])
+
+    # Event loop health: scheduling lag & the most recent times something blocked it
+    @bot.command(aliases=['health', 'lag'])
+    async def health_rep(ctx):
+        stats = WATCHDOG.stats()
+        embed = discord.Embed(title="Event Loop Health", color=0x00ff00 if not WATCHDOG.stalls or time.time() - WATCHDOG.stalls[-1].at > 3600 else 0xff0000)
+        for name, value in {'Lag': f"{stats['lag_ms']:,} ms", 'Lag p50': f"{stats['lag_p50_ms']:,} ms", 'Lag p99': f"{stats['lag_p99_ms']:,} ms",
+                            'Max lag': f"{stats['lag_max_ms']:,} ms", f"Stalls (> {WATCHDOG_THRESHOLD:g}s)": f"{stats['stalls']:,}", 'Tasks': f'{len(asyncio.all_tasks()):,}'}.items():
+            embed.add_field(name=name, value=value, inline=True)
+        for stall in list(WATCHDOG.stalls)[-3:][::-1]:
+            when = datetime.datetime.fromtimestamp(stall.at).strftime('%m/%d %H:%M:%S')
+            embed.add_field(name=f'{when}: {stall.seconds:.2f}s in {stall.task}'[:256], value=f"```{''.join(stall.stack[-4:])[-1000:]}```", inline=False)
+        await ctx.send(embed=embed)
+
+    # Query Cache Statistics
+    @bot.command(aliases=['cache', 'cacheStats', 'cache_stats'])
+    async def cache_rep(ctx):
+        try:
+            stats = await get_cache_stats()
+            await ctx.send(embed=stats[0])
+        except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
+
+    # API Quota Usage
+    @bot.command(aliases=['quota', 'quotaUsage', 'quota_usage'])
+    async def quota_rep(ctx):
+        try:
+            stats = await get_quota_report()
+            await ctx.send(embed=stats[0])
+        except Exception as e:  await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
+
     # Refresh Token
     @bot.command(aliases=['refresh', 'refresh_token', 'refreshToken'])
     async def refresh_API_token(ctx, token=None):
@@ -419,28 +893,32 @@ if __name__ == "__main__":
     async def all(ctx, startDate=datetime.datetime.now().strftime("%m/01/%y"), endDate=datetime.datetime.now().strftime("%m/%d/%y"), results=10):
         startDate, endDate = await update_dates(startDate, endDate)
 
-        stat_functions = [
-            (get_stats, (startDate, endDate)),
-            (top_revenue, (results, startDate, endDate)),
-            (top_countries_by_revenue, (results, startDate, endDate)),
-            (get_ad_preformance, (startDate, endDate)),
-            (get_detailed_georeport, (results, startDate, endDate)),
-            (get_demographics, (startDate, endDate)),
-            (get_shares, (results, startDate, endDate)),
-            (get_traffic_source, (results, startDate, endDate)),
-            (get_operating_stats, (results, startDate, endDate)),
-            (get_playlist_stats, (results, startDate, endDate)),
-        ]
+        stat_functions = all_reports(startDate, endDate, results)
+
+        # Fan the reports out concurrently, but send them in their original order as soon as each one is ready
+        semaphore = asyncio.Semaphore(REPORT_CONCURRENCY)
+        async def run_limited(stat_function, args):
+            async with semaphore:
+                return await stat_function(*args)
 
+        tasks = [asyncio.ensure_future(run_limited(stat_function, args)) for stat_function, args in stat_functions]
         try:
-            for stat_function, args in stat_functions:
-                result = await stat_function(*args)
-                result = result[0] 
-                await ctx.send(embed=result)
+            for (stat_function, args), task in zip(stat_functions, tasks):
+                try:
+                    result = await task
+                    if isinstance(result, ReportResult):
+                        await ctx.send(embed=result[0])
+                        continue
+                    error = result
+                except Exception as e:
+                    error = f'{e.__class__.__name__}: {e}'
+                await ctx.send(f'Error in {stat_function.__name__}:\n{error}'[:2000])
 
             print(f'\n{startDate} - {endDate} everything sent')
         except Exception as e:
-            await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}')
+            await ctx.send(f'Error:\n {e}\n{traceback.format_exc()}'[:2000])
+        finally:
+            for task in tasks: task.cancel()
     
     # Restart Bot Command
     @bot.command(name='restart')
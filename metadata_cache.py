@@ -0,0 +1,79 @@
+import sqlite3, threading, json, time
+
+# Persistent cache of video/playlist snippets, kept in memory and written through to SQLite
+class MetadataCache:
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS metadata (kind TEXT, id TEXT, etag TEXT, snippet TEXT, fetched_at REAL, PRIMARY KEY (kind, id))')
+            # ETag of the last list response for a set of ids, sent back as If-None-Match when the same set is revalidated
+            self.db.execute('CREATE TABLE IF NOT EXISTS metadata_etags (kind TEXT, ids TEXT, etag TEXT, fetched_at REAL, PRIMARY KEY (kind, ids))')
+            self.entries = {(kind, id): {'etag': etag, 'snippet': json.loads(snippet), 'fetched_at': fetched_at}
+                            for kind, id, etag, snippet, fetched_at in self.db.execute('SELECT kind, id, etag, snippet, fetched_at FROM metadata')}
+        self.hits = 0
+        self.revalidated = 0
+        self.fetched = 0
+
+    @staticmethod
+    def ids_key(ids):
+        return ','.join(sorted(ids))
+
+    # Split ids into fresh snippets, stale (cached but expired) ids and ids never fetched
+    def lookup(self, kind, ids, max_age=None):
+        max_age = self.ttl if max_age is None else max_age
+        now = time.time()
+        fresh, stale, missing = {}, [], []
+        for id in dict.fromkeys(ids):
+            entry = self.entries.get((kind, id))
+            if entry is None: missing.append(id)
+            elif now - entry['fetched_at'] > max_age: stale.append(id)
+            else: fresh[id] = entry['snippet']
+        self.hits += len(fresh)
+        return fresh, stale, missing
+
+    def snippets(self, kind, ids):
+        return {id: self.entries[(kind, id)]['snippet'] for id in ids if (kind, id) in self.entries}
+
+    # Id sets fetched together that are expired, or will be within `margin` seconds
+    def expiring_sets(self, kind, margin=0):
+        cutoff = time.time() - self.ttl + margin
+        with self.lock:
+            rows = self.db.execute('SELECT ids FROM metadata_etags WHERE kind = ? AND fetched_at < ?', (kind, cutoff)).fetchall()
+        return [row[0].split(',') for row in rows]
+
+    def list_etag(self, kind, ids):
+        with self.lock:
+            row = self.db.execute('SELECT etag FROM metadata_etags WHERE kind = ? AND ids = ?', (kind, self.ids_key(ids))).fetchone()
+        return row[0] if row else None
+
+    # Store a list response for `ids`
+    def save(self, kind, ids, response):
+        now = time.time()
+        records = []
+        for item in response.get('items', []):
+            self.entries[(kind, item['id'])] = {'etag': item.get('etag'), 'snippet': item['snippet'], 'fetched_at': now}
+            records.append((kind, item['id'], item.get('etag'), json.dumps(item['snippet']), now))
+        self.fetched += len(records)
+
+        with self.lock, self.db:
+            self.db.executemany('INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?)', records)
+            if response.get('etag'):
+                self.db.execute('INSERT OR REPLACE INTO metadata_etags VALUES (?, ?, ?, ?)', (kind, self.ids_key(ids), response['etag'], now))
+
+    # The server answered 304 Not Modified, so the cached snippets are valid for another ttl
+    def touch(self, kind, ids):
+        now = time.time()
+        for id in ids:
+            if (kind, id) in self.entries: self.entries[(kind, id)]['fetched_at'] = now
+        self.revalidated += len(ids)
+        with self.lock, self.db:
+            self.db.executemany('UPDATE metadata SET fetched_at = ? WHERE kind = ? AND id = ?', [(now, kind, id) for id in ids])
+            self.db.execute('UPDATE metadata_etags SET fetched_at = ? WHERE kind = ? AND ids = ?', (now, kind, self.ids_key(ids)))
+
+    def stats(self):
+        return {'cached': len(self.entries), 'hits': self.hits, 'revalidated': self.revalidated, 'fetched': self.fetched}
+
+    def close(self):
+        with self.lock: self.db.close()
@@ -0,0 +1,118 @@
+import contextvars, cProfile, functools, io, pstats, time, tracemalloc
+from collections                    import Counter
+from contextlib                     import contextmanager
+
+# Phases of the invocation being profiled (None otherwise, so code outside a profile only pays for a context variable lookup)
+PHASES = contextvars.ContextVar('PHASES', default=None)
+
+PHASE_NAMES = {'api': 'API wait', 'parse': 'Parsing', 'render': 'Rendering'}
+
+# Wall time & entries of each phase. Concurrent entries of a phase (e.g. two requests in flight) are counted, but only timed
+# once, so a phase never adds up to more than the time that passed
+class Phases:
+    def __init__(self):
+        self.seconds = Counter()
+        self.counts = Counter()
+        self.active = set()
+
+@contextmanager
+def phase(name):
+    phases = PHASES.get()
+    if phases is None:
+        yield
+        return
+    phases.counts[name] += 1
+    if name in phases.active:
+        yield
+        return
+    phases.active.add(name)
+    began = time.perf_counter()
+    try: yield
+    finally:
+        phases.active.discard(name)
+        phases.seconds[name] += time.perf_counter() - began
+
+# Times every call of a coroutine function as `name` while profiling
+def in_phase(name):
+    def decorate(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            if PHASES.get() is None: return await function(*args, **kwargs)
+            with phase(name): return await function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Runs a coroutine with the profiler enabled only while one of its steps runs. Other commands running on the event loop
+# in between (and the API worker threads) aren't profiled or slowed down
+class ProfiledCoroutine:
+    def __init__(self, coroutine, profiler):
+        self.coroutine, self.profiler = coroutine, profiler
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+    def send(self, value):
+        self.profiler.enable()
+        try: return self.coroutine.send(value)
+        finally: self.profiler.disable()
+
+    def throw(self, *args):
+        self.profiler.enable()
+        try: return self.coroutine.throw(*args)
+        finally: self.profiler.disable()
+
+    def close(self):
+        self.coroutine.close()
+
+# What a profiled invocation spent its time & memory on
+class Profile:
+    def __init__(self, title, seconds, phases, profiler, snapshot, peak):
+        self.title, self.seconds, self.phases = title, seconds, phases
+        self.profiler, self.snapshot, self.peak = profiler, snapshot, peak
+
+    # (name, seconds, entries) of each phase, then whatever the rest of the time went to
+    def breakdown(self):
+        rows = [(label, self.phases.seconds[name], self.phases.counts[name]) for name, label in PHASE_NAMES.items()]
+        return rows + [('Other', max(0.0, self.seconds - sum(seconds for _, seconds, _ in rows)), None)]
+
+    def cpu_seconds(self):
+        return pstats.Stats(self.profiler).total_tt
+
+    def report(self, functions=40, allocations=15):
+        lines = [self.title, '', f'Wall time: {self.seconds * 1000:,.1f} ms, of which {self.cpu_seconds() * 1000:,.1f} ms ran on the event loop', '']
+        for name, seconds, count in self.breakdown():
+            share = 100 * seconds / self.seconds if self.seconds else 0
+            lines.append(f"  {name:<10} {seconds * 1000:>10,.1f} ms {share:>5.1f}%" + (f'  ({count} calls)' if count else ''))
+        lines += ['', f'Peak traced memory: {self.peak / 1024:,.1f} KB, largest allocations still held:']
+        for stat in self.snapshot.statistics('lineno')[:allocations]:
+            lines.append(f'  {stat.size / 1024:>10,.1f} KB {stat.count:>7,} blocks  {stat.traceback[0]}')
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).strip_dirs().sort_stats('cumulative').print_stats(functions)
+        lines += ['', f'Top {functions} functions by cumulative time on the event loop:', stream.getvalue()]
+        return '\n'.join(lines)
+
+# Run one invocation under cProfile & tracemalloc, timing its phases. Tracemalloc sees every thread, so it is only on
+# for the invocation (unless something else already started it)
+async def profile_call(coroutine, title):
+    profiler = cProfile.Profile()
+    phases = Phases()
+    token = PHASES.set(phases)
+    tracing = tracemalloc.is_tracing()
+    if not tracing: tracemalloc.start()
+    tracemalloc.reset_peak()
+    began = time.perf_counter()
+    try:
+        result = await ProfiledCoroutine(coroutine, profiler)
+    finally:
+        seconds = time.perf_counter() - began
+        peak = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        if not tracing: tracemalloc.stop()
+        PHASES.reset(token)
+    return result, Profile(title, seconds, phases, profiler, snapshot, peak)
@@ -0,0 +1,76 @@
+import json, time, datetime
+from collections                    import OrderedDict
+
+# In-process LRU cache of API responses, bounded by the total size of the stored (JSON encoded) responses
+class QueryCache:
+    def __init__(self, max_bytes, short_ttl, long_ttl, finalization_lag):
+        self.max_bytes = max_bytes
+        self.short_ttl = short_ttl
+        self.long_ttl = long_ttl
+        self.finalization_lag = finalization_lag
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Normalized cache key, e.g. ' views, likes' and 'views,likes' or maxResults 10 and '10' map to the same entry
+    @staticmethod
+    def make_key(api, method, params):
+        normalized = {}
+        for key, value in params.items():
+            if value is None: continue
+            if isinstance(value, str): value = ','.join(part.strip() for part in value.split(','))
+            normalized[key] = str(value)
+        return json.dumps([api, method, sorted(normalized.items())])
+
+    # Finalized ranges never change and can be cached for a long time, ranges including recent days only briefly
+    def ttl_for(self, params):
+        try:
+            end = datetime.datetime.strptime(params['endDate'], '%Y-%m-%d').date()
+        except (KeyError, TypeError, ValueError):
+            return self.short_ttl
+        finalized = datetime.date.today() - datetime.timedelta(days=self.finalization_lag)
+        return self.long_ttl if end < finalized else self.short_ttl
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None: self.discard(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        # Responses are stored encoded so callers always get their own copy to modify
+        return json.loads(entry[1])
+
+    def set(self, key, response, ttl):
+        if ttl <= 0: return
+        payload = json.dumps(response)
+        if len(payload) > self.max_bytes: return
+        self.discard(key)
+        self.entries[key] = (time.monotonic() + ttl, payload)
+        self.size += len(payload)
+        while self.size > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self.discard(oldest)
+            self.evictions += 1
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None: self.size -= len(entry[1])
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'size_kb': round(self.size / 1024, 1),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(100 * self.hits / lookups, 1) if lookups else 0.0,
+            'evictions': self.evictions,
+        }
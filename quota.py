@@ -0,0 +1,87 @@
+import sqlite3, threading, datetime
+
+try:
+    from zoneinfo                   import ZoneInfo
+    QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+except Exception:
+    QUOTA_TIMEZONE = datetime.timezone(datetime.timedelta(hours=-8))
+
+# Raised instead of sending background work once the remaining daily quota falls below the reserve
+class QuotaDeferred(Exception):
+    pass
+
+# Daily quota meter per tenant (YouTube channel) and API, persisted so usage survives restarts. Google resets quotas at midnight Pacific Time
+class QuotaMeter:
+    def __init__(self, path, budgets, costs, reserve, tenant_budgets=None):
+        self.budgets = budgets
+        self.tenant_budgets = tenant_budgets or {}
+        self.costs = costs
+        self.reserve = reserve
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            # Usage recorded before channels were metered separately belongs to the default channel
+            columns = {row[1] for row in self.db.execute('PRAGMA table_info(quota_usage)')}
+            if columns and 'tenant' not in columns:
+                self.db.execute('ALTER TABLE quota_usage RENAME TO quota_usage_single')
+            self.db.execute('CREATE TABLE IF NOT EXISTS quota_usage (tenant TEXT, day TEXT, command TEXT, api TEXT, method TEXT, calls INTEGER, units INTEGER, PRIMARY KEY (tenant, day, command, api, method))')
+            if columns and 'tenant' not in columns:
+                self.db.execute("INSERT INTO quota_usage SELECT 'default', * FROM quota_usage_single")
+                self.db.execute('DROP TABLE quota_usage_single')
+        self.load(self.today())
+
+    @staticmethod
+    def today():
+        return datetime.datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+    def load(self, day):
+        self.day = day
+        with self.lock:
+            rows = self.db.execute('SELECT tenant, api, SUM(units) FROM quota_usage WHERE day = ? GROUP BY tenant, api', (day,)).fetchall()
+        self.totals = {(tenant, api): units for tenant, api, units in rows}
+
+    def cost(self, api, method):
+        return self.costs.get(f'{api}.{method}', self.costs.get(api, 1))
+
+    def budget(self, tenant, api):
+        return self.tenant_budgets.get(tenant, {}).get(api, self.budgets.get(api, 0))
+
+    # Whether the quota day changed since its usage was loaded
+    def stale(self):
+        return self.day != self.today()
+
+    def refresh(self):
+        if self.stale(): self.load(self.today())
+
+    def used(self, tenant, api):
+        self.refresh()
+        return self.totals.get((tenant, api), 0)
+
+    def remaining(self, tenant, api):
+        return self.budget(tenant, api) - self.used(tenant, api)
+
+    # Interactive work is always allowed, background work only while more than the reserve is left
+    def allow(self, tenant, api, background):
+        budget = self.budget(tenant, api)
+        if not budget or not background: return True
+        return self.remaining(tenant, api) > budget * self.reserve
+
+    def record(self, tenant, api, method, command, calls=1):
+        units = self.cost(api, method) * calls
+        day = self.today()
+        with self.lock, self.db:
+            if self.day != day:
+                self.day, self.totals = day, {}
+            self.totals[(tenant, api)] = self.totals.get((tenant, api), 0) + units
+            self.db.execute('INSERT INTO quota_usage VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (tenant, day, command, api, method) DO UPDATE SET calls = calls + excluded.calls, units = units + excluded.units',
+                            (tenant, day, command, api, method, calls, units))
+        return units
+
+    # Today's (calls, units) per command and API for a tenant, highest usage first
+    def usage_by_command(self, tenant):
+        with self.lock:
+            return self.db.execute('SELECT command, api, SUM(calls), SUM(units) FROM quota_usage WHERE tenant = ? AND day = ? GROUP BY command, api ORDER BY SUM(units) DESC',
+                                   (tenant, self.today())).fetchall()
+
+    def close(self):
+        with self.lock: self.db.close()
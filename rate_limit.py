@@ -0,0 +1,66 @@
+import asyncio, json, random, socket, time
+import requests
+
+from googleapiclient.errors         import HttpError
+
+# Error reasons Google uses for throttling, these slow the rate limiter down
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+
+# Raised when a command runs out of time before its API requests could be sent or retried
+class DeadlineExceeded(Exception):
+    pass
+
+# Google's error reason (e.g. 'rateLimitExceeded', 'quotaExceeded'), the HTTP status or the exception name
+def error_reason(error):
+    if isinstance(error, HttpError):
+        try:
+            return json.loads(error.content)['error']['errors'][0]['reason']
+        except (ValueError, KeyError, IndexError, TypeError):
+            return str(error.resp.status)
+    return error.__class__.__name__
+
+def is_throttled(error):
+    return isinstance(error, HttpError) and (error.resp.status == 429 or error_reason(error) in RATE_LIMIT_REASONS)
+
+# Dropped connections & timeouts, as raised by the sockets or by requests (the shared connection pool's transport)
+NETWORK_ERRORS = (ConnectionError, TimeoutError, socket.timeout,
+                  requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError)
+
+# Only throttling, server errors and dropped connections are worth retrying, a 403 quotaExceeded or 400 never succeeds
+def is_transient(error):
+    if isinstance(error, HttpError):
+        return error.resp.status in TRANSIENT_STATUSES or is_throttled(error)
+    return isinstance(error, NETWORK_ERRORS)
+
+# Exponential backoff with full jitter
+def backoff(attempt, base=0.5, cap=16.0):
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+# Token bucket that halves its rate when the API throttles us and slowly recovers on successes
+class TokenBucket:
+    def __init__(self, rate, burst, min_rate=0.5):
+        self.max_rate = self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    async def acquire(self, deadline=None):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                raise DeadlineExceeded('Timed out waiting for the API rate limit')
+            await asyncio.sleep(wait)
+
+    def throttled(self):
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def succeeded(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
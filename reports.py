@@ -0,0 +1,251 @@
+import functools
+import discord
+
+STATS_METRICS = 'views,estimatedMinutesWatched,subscribersGained,subscribersLost,estimatedRevenue,cpm,monetizedPlaybacks,playbackBasedCpm,adImpressions,likes,dislikes,averageViewDuration,shares,averageViewPercentage,subscribersGained,subscribersLost'
+
+# Discord limits: fields per embed, characters per embed / field name / field value & characters per message
+EMBED_FIELDS = 25
+EMBED_CHARACTERS = 6000
+FIELD_NAME_CHARACTERS = 256
+FIELD_VALUE_CHARACTERS = 1024
+MESSAGE_CHARACTERS = 2000
+
+# Shown instead of a card report's fields when the range has no rows (e.g. a channel with no data yet)
+NO_DATA = 'No data for this date range.'
+
+# How a column's values are shown, dimensions default to 'text' & metrics to 'number'
+FORMATS = {
+    'number':  lambda value: f'{round(value, 2):,}',
+    'money':   lambda value: f'${round(value, 2):,}',
+    'percent': lambda value: f'{round(value, 2):,}%',
+    'text':    lambda value: str(value),
+    'name':    lambda value: str(value).replace('_', ' '),
+    'age':     lambda value: str(value).replace('age', ''),
+}
+
+# '2024-01-05', '2024-02-01' -> '01/05', '02/01' (the year is kept when the dates are in different years)
+def format_range(start, end):
+    if start[:4] == end[:4]: return start[5:].replace('-', '/'), end[5:].replace('-', '/')
+    return f'{start[5:]}-{start[:4]}'.replace('-', '/'), f'{end[5:]}-{end[:4]}'.replace('-', '/')
+
+# Compact typed result of a report query: column names, their Python types and the rows as tuples
+class RowSet:
+    __slots__ = ('columns', 'types', 'rows')
+    DATA_TYPES = {'INTEGER': int, 'FLOAT': float, 'STRING': str}
+
+    def __init__(self, columns, types, rows):
+        self.columns, self.types, self.rows = columns, types, rows
+
+    @classmethod
+    def from_response(cls, response):
+        headers = response.get('columnHeaders', [])
+        rows = response.get('rows', [])
+        columns = tuple(header['name'] for header in headers)
+        types = tuple(cls.DATA_TYPES.get(header.get('dataType')) or (type(rows[0][i]) if rows else str) for i, header in enumerate(headers))
+        return cls(columns, types, [tuple(kind(value) if kind is int else value for kind, value in zip(types, row)) for row in rows])
+
+    def records(self):
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+# Declarative description of a report: the query it runs and how its rows are laid out.
+# Templates are str.format strings over the formatted columns, `label` (the first dimension, or its title when `lookup`
+# names a metadata kind) and `rank`; `{results}` & `{range}` are available in titles
+class ReportSpec:
+    def __init__(self, name, title, metrics, dimensions=None, filters=None, sort=None, limit=False, results=None, store=False,
+                 formats=None, derived=None, lookup=None, min_value=None, fields=None, field=None, line=None, total=None):
+        self.name = name
+        self.title = title
+        self.metrics = metrics
+        self.dimensions = dimensions
+        self.filters = filters
+        self.sort = sort
+        self.limit = limit
+        self.results = results
+        # Channel totals that can be answered from the local analytics store
+        self.store = store
+        self.formats = formats or {}
+        # Extra values computed from each row's raw values
+        self.derived = derived or {}
+        self.lookup = lookup
+        # (column, minimum) rows below the minimum are left out
+        self.min_value = min_value
+        # Single row 'card' layout: (name, template) fields, None starts a new group
+        self.fields = fields
+        # Row per field layout: (name, value) templates for the embed and a template for the text line,
+        # a None value lists every metric
+        self.field = field
+        self.line = line
+        # (column, name) a total of the column shown after the rows
+        self.total = total
+
+    # Ranked reports (with a result limit) can be paged through with startIndex (1-based)
+    @property
+    def paged(self):
+        return self.limit
+
+    def query(self, start, end, results=None, start_index=None):
+        params = {'ids': 'channel==MINE', 'startDate': start, 'endDate': end, 'metrics': self.metrics, 'dimensions': self.dimensions,
+                  'filters': self.filters, 'sort': self.sort, 'maxResults': (results or self.results) if self.limit else None,
+                  'startIndex': start_index if self.limit else None}
+        return {key: value for key, value in params.items() if value is not None}
+
+    def format(self, column, value):
+        default = 'text' if self.dimensions and column in self.dimensions.split(',') else 'number'
+        return FORMATS[self.formats.get(column, default)](value)
+
+# Cut text to `limit` characters at a line break
+def truncate(text, limit):
+    if len(text) <= limit: return text
+    cut = text.rfind('\n', 0, limit - 2)
+    return text[:cut if cut > 0 else limit - 2] + '\n…'
+
+# A report's rows, rendered into an embed or text only when (and the first time) that output is used.
+# Indexes & unpacks like the (embed, response_str) tuples the report functions used to return.
+# `offset` is the number of rows before this page, `has_next` whether the API has more
+class ReportResult:
+    def __init__(self, spec, rows, start, end, results=None, labels=None, offset=None, has_next=False):
+        self.spec = spec
+        self.rows = rows
+        self.start, self.end = format_range(start, end)
+        self.results = results or spec.results
+        self.labels = labels or {}
+        self.offset = offset
+        self.has_next = has_next
+        # A page is titled by the ranks it shows, e.g. 'Top 11-20 Earning Videos'
+        if offset is not None: self.results = f'{offset + 1}-{offset + len(rows.rows)}'
+
+    # Formatted values of every row, shared by the renderers
+    @functools.cached_property
+    def values(self):
+        spec, formatted = self.spec, []
+        for rank, (row, record) in enumerate(zip(self.rows.rows, self.rows.records()), 1):
+            if spec.min_value and round(record[spec.min_value[0]], 2) < spec.min_value[1]: continue
+            record.update({name: function(record) for name, function in spec.derived.items()})
+            values = {column: spec.format(column, value) for column, value in record.items()}
+            if spec.dimensions: values['label'] = self.labels.get(row[0], values[self.rows.columns[0]])
+            values['rank'] = rank + (self.offset or 0)
+            formatted.append(values)
+        return formatted
+
+    def title(self, separator):
+        return self.spec.title.format(results=self.results, range=f'{self.start}{separator}{self.end}')
+
+    def metric_lines(self, values, indent=''):
+        return '\n'.join(f'{indent}{metric}:\t{values[metric]}' for metric in self.spec.metrics.split(','))
+
+    def total(self):
+        column, name = self.spec.total
+        return name.format(results=self.results), self.spec.format(column, sum(row[self.rows.columns.index(column)] for row in self.rows.rows))
+
+    @functools.cached_property
+    def embed(self):
+        spec = self.spec
+        embed = discord.Embed(title=self.title(' - '), color=0x00ff00)
+        if spec.fields:
+            if not self.values:
+                embed.description = NO_DATA
+                return embed
+            values = self.values[0]
+            for field in spec.fields:
+                if field is None: embed.add_field(name="\u200b", value="\u200b", inline=False)
+                else:             embed.add_field(name=field[0], value=field[1].format(**values), inline=True)
+            return embed
+
+        # Rows that don't fit in the embed are left out (and counted in the footer), the total still fits after them
+        reserved = 2 if spec.total else 0
+        name, value = spec.field
+        shown = 0
+        for values in self.values:
+            field_name = truncate(name.format(**values), FIELD_NAME_CHARACTERS)
+            field_value = truncate(value.format(**values) if value else self.metric_lines(values), FIELD_VALUE_CHARACTERS)
+            if len(embed.fields) + reserved >= EMBED_FIELDS or len(embed) + len(field_name) + len(field_value) > EMBED_CHARACTERS - 200: break
+            embed.add_field(name=field_name, value=field_value, inline=False)
+            shown += 1
+        if spec.total:
+            name, value = self.total()
+            embed.add_field(name="\u200b", value="\u200b", inline=False)
+            embed.add_field(name=name, value=value, inline=False)
+        if shown < len(self.values):
+            embed.set_footer(text=f'{shown} of {len(self.values)} rows shown, !pages {spec.name} shows them all')
+        return embed
+
+    @functools.cached_property
+    def text(self):
+        spec = self.spec
+        text = self.title('\t-\t') + '\n\n'
+        if spec.fields:
+            if not self.values: return text + NO_DATA
+            values = self.values[0]
+            return truncate(text + ''.join('\n' if field is None else f'{field[0]}:\t{field[1].format(**values)}\n' for field in spec.fields), MESSAGE_CHARACTERS)
+
+        for values in self.values:
+            text += (spec.line.format(**values) if spec.line else values['label'] + ':\n' + self.metric_lines(values, '\t') + '\n') + '\n'
+        if spec.total:
+            text += '\n\n{}: {}'.format(*self.total())
+        return truncate(text, MESSAGE_CHARACTERS)
+
+    def __getitem__(self, index):
+        return self.text if index in (1, -1) else self.embed
+
+    def __iter__(self):
+        yield self.embed
+        yield self.text
+
+REPORTS = {spec.name: spec for spec in (
+    ReportSpec('stats', 'YouTube Analytics Report ({range})', STATS_METRICS, store=True,
+               formats={'estimatedRevenue': 'money', 'cpm': 'money', 'playbackBasedCpm': 'money', 'ratings': 'percent', 'averageViewPercentage': 'percent'},
+               derived={'ratings':        lambda row: 100 * row['likes'] / (row['likes'] + row['dislikes']) if row['likes'] + row['dislikes'] else 0,
+                        'netSubscribers': lambda row: row['subscribersGained'] - row['subscribersLost']},
+               fields=[('Views', '{views}'), ('Ratings', '{ratings}'), ('Minutes Watched', '{estimatedMinutesWatched}'),
+                       ('Average View Duration', '{averageViewDuration}s ({averageViewPercentage})'), ('Net Subscribers', '{netSubscribers}'), ('Shares', '{shares}'),
+                       None,
+                       ('Estimated Revenue', '{estimatedRevenue}'), ('CPM', '{cpm}'), ('Monetized Playbacks (±2.0%)', '{monetizedPlaybacks}'),
+                       ('Playback CPM', '{playbackBasedCpm}'), ('Ad Impressions', '{adImpressions}')]),
+
+    ReportSpec('top_revenue', 'Top {results} Earning Videos ({range})', 'estimatedRevenue', 'video', sort='-estimatedRevenue', limit=True, results=10,
+               formats={'estimatedRevenue': 'money'}, lookup='videos',
+               field=('{rank}) {label}:\t{estimatedRevenue}', '-' * 84), line='{rank}) {label} - {estimatedRevenue}',
+               total=('estimatedRevenue', 'Top {results} Total Earnings')),
+
+    ReportSpec('geo_revenue', 'Top {results} Countries by Revenue ({range})', 'estimatedRevenue', 'country', sort='-estimatedRevenue', limit=True, results=10,
+               formats={'estimatedRevenue': 'money'},
+               field=('{label}:\t\t{estimatedRevenue}', '{estimatedRevenue}'), line='{label}:\t\t{estimatedRevenue}'),
+
+    ReportSpec('adtype', 'Ad Preformance ({range})', 'grossRevenue,adImpressions,cpm', 'adType', sort='-grossRevenue',
+               formats={'grossRevenue': 'money', 'cpm': 'money'},
+               field=('{label}:\t\t{grossRevenue}', 'Gross Revenue:\t{grossRevenue}\tCPM:\t{cpm}\tImpressions:\t{adImpressions}'),
+               line='Ad Type:\t{label}\n\tGross Revenue:\t{grossRevenue}\tCPM:\t{cpm}\tImpressions:\t{adImpressions}\n'),
+
+    ReportSpec('geo_report', 'Top {results} Countries by Revenue ({range})',
+               'views,estimatedRevenue,estimatedAdRevenue,estimatedRedPartnerRevenue,grossRevenue,adImpressions,cpm,playbackBasedCpm,monetizedPlaybacks',
+               'country', sort='-estimatedRevenue', limit=True, results=5,
+               field=('{label}:', None)),
+
+    ReportSpec('demographics', 'Gender Viewership Demographics ({range})', 'viewerPercentage', 'ageGroup,gender', sort='-viewerPercentage',
+               formats={'viewerPercentage': 'percent', 'ageGroup': 'age'}, min_value=('viewerPercentage', 1),
+               field=('{viewerPercentage} Views come from {gender} with age of {ageGroup}', '{viewerPercentage}'),
+               line='{viewerPercentage} Views come from {gender} with age of {ageGroup}'),
+
+    ReportSpec('shares', 'Top Sharing Services ({range})', 'shares', 'sharingService', sort='-shares', limit=True, results=5,
+               formats={'sharingService': 'name'},
+               field=('{label}:', '{shares}'), line='{label}:\t{shares}'),
+
+    ReportSpec('search', 'Top Search Traffic Terms ({range})', 'views', 'insightTrafficSourceDetail', filters='insightTrafficSourceType==YT_SEARCH',
+               sort='-views', limit=True, results=10, formats={'insightTrafficSourceDetail': 'name'},
+               field=('{label}:', '{views}'), line='{label}:\t{views}'),
+
+    ReportSpec('os', 'Top Operating System ({range})', 'views,estimatedMinutesWatched', 'operatingSystem', sort='-views,estimatedMinutesWatched',
+               limit=True, results=10,
+               field=('{label}:', 'Views:\t\t{views}\nEstimated Watchtime:\t\t{estimatedMinutesWatched}'),
+               line='\t{label}:\n\t\tViews:\t\t{views}\n\t\tEstimated Watchtime:\t\t{estimatedMinutesWatched}'),
+
+    ReportSpec('playlist', 'Playlist Stats ({range})', 'estimatedMinutesWatched,views,playlistStarts,averageTimeInPlaylist', 'playlist', filters='isCurated==1',
+               sort='-views', limit=True, results=5, lookup='playlists',
+               field=('{label}:', 'Views: {views}\nPlaylist Starts: {playlistStarts}\nAverage Time Spent in Playlist: {averageTimeInPlaylist}\nEstimated Minutes Watched: {estimatedMinutesWatched}'),
+               line='{label}:\nViews: {views}\nPlaylist Starts: {playlistStarts}\nAverage Time Spent in Playlist: {averageTimeInPlaylist}\nEstimated Minutes Watched: {estimatedMinutesWatched}\n'),
+
+    # Daily series behind the !trend chart
+    ReportSpec('trend', 'Daily Trend ({range})', 'views,estimatedRevenue,cpm', 'day', sort='day',
+               formats={'estimatedRevenue': 'money', 'cpm': 'money'},
+               field=('{label}:', None)),
+)}
@@ -0,0 +1,26 @@
+import asyncio, copy
+
+# Coalesces concurrent calls with the same key into one in-flight task, every caller gets its own copy of the result
+class SingleFlight:
+    def __init__(self):
+        self.calls = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key, factory):
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.calls[key] = task
+            self.started += 1
+            # Forget the call once it settles, so a failure is shared by its waiters but never by later calls
+            task.add_done_callback(lambda done: self.calls.pop(key, None) if self.calls.get(key) is done else None)
+        else:
+            self.coalesced += 1
+
+        # Shielded so one cancelled caller doesn't cancel the request for everyone else waiting on it
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result)
+
+    def stats(self):
+        return {'in_flight': len(self.calls), 'started': self.started, 'coalesced': self.coalesced}
@@ -0,0 +1,10 @@
+import json, os, sys, tempfile
+
+# YouTube_API reads its settings on import: point it at throwaway stores & credentials that never need a refresh
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DIRECTORY = tempfile.mkdtemp()
+secret = {'client_id': 'test', 'client_secret': 'test', 'refresh_token': 'test', 'token': 'test', 'expiry': '2999-01-01T00:00:00Z'}
+os.environ.update({'YOUTUBE_API_KEY': 'test', 'DEV_MODE': 'true', 'CLIENT_SECRET': json.dumps({'installed': secret}), 'BUNDLED_DISCOVERY': 'true',
+                   'ANALYTICS_DB': os.path.join(DIRECTORY, 'analytics.db'), 'CHANNELS_CONFIG': os.path.join(DIRECTORY, 'channels.json')})
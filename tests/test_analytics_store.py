@@ -0,0 +1,20 @@
+import asyncio
+
+import YouTube_API
+
+def test_sync_does_not_wait_behind_another_sync(monkeypatch):
+    async def main():
+        backfill = asyncio.Event()
+        async def execute_api_request(api, method, **params):
+            if params['startDate'] == '2020-01-01': await backfill.wait()
+            return {'columnHeaders': [{'name': 'day'}], 'rows': []}
+        monkeypatch.setattr(YouTube_API, 'execute_api_request', execute_api_request)
+
+        slow = asyncio.create_task(YouTube_API.sync_analytics_store('2020-01-01', '2020-01-31'))
+        await asyncio.sleep(0.1)
+        # The backfill's fetch is still running, a sync of another range goes through anyway
+        assert await asyncio.wait_for(YouTube_API.sync_analytics_store('2021-01-01', '2021-01-31'), 5) == 1
+        assert not slow.done()
+        backfill.set()
+        assert await slow == 1
+    asyncio.run(main())
@@ -0,0 +1,15 @@
+import json, os
+
+from channels                       import ChannelRegistry, DEFAULT_TENANT
+
+def test_lone_channel_uses_every_worker(tmp_path):
+    registry = ChannelRegistry.from_file(str(tmp_path / 'missing.json'), 4, None, 8)
+    assert registry.tenant(DEFAULT_TENANT).semaphore._value == 8
+
+def test_channels_share_the_workers(tmp_path):
+    path = os.path.join(tmp_path, 'channels.json')
+    with open(path, 'w') as f:
+        json.dump({'second': {'credentials': 'second.json'}, 'third': {'credentials': 'third.json', 'concurrency': 2}}, f)
+    registry = ChannelRegistry.from_file(path, 4, None, 8)
+    assert [registry.tenant(name).semaphore._value for name in (DEFAULT_TENANT, 'second', 'third')] == [4, 4, 2]
+    assert ChannelRegistry.from_file(path, 4, 6, 8).tenant('second').semaphore._value == 6
@@ -0,0 +1,25 @@
+import asyncio
+
+import YouTube_API
+
+def test_command_does_not_join_background_request(monkeypatch):
+    async def main():
+        sent, release = [], asyncio.Event()
+        async def send_with_retries(api, function, method, kwargs, headers):
+            sent.append(YouTube_API.BACKGROUND.get())
+            await release.wait()
+            return {'rows': []}
+        monkeypatch.setattr(YouTube_API, 'send_with_retries', send_with_retries)
+        params = {'ids': 'channel==MINE', 'startDate': '2024-01-01', 'endDate': '2024-01-31', 'metrics': 'views'}
+
+        async def request(background):
+            if background: YouTube_API.background_job('prefetch')
+            return await YouTube_API.execute_api_request(YouTube_API.ANALYTICS_API, 'reports.query', cache=False, **params)
+
+        requests = [asyncio.create_task(request(background)) for background in (True, False, False)]
+        await asyncio.sleep(0.1)
+        # The background request & one shared by both commands
+        assert sorted(sent) == [False, True]
+        release.set()
+        await asyncio.gather(*requests)
+    asyncio.run(main())
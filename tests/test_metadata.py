@@ -0,0 +1,15 @@
+import asyncio
+import httplib2
+from googleapiclient.errors         import HttpError
+
+import YouTube_API
+
+def test_single_request_not_modified_is_not_an_error(monkeypatch):
+    async def send_with_retries(api, function, method, kwargs, headers):
+        raise HttpError(httplib2.Response({'status': 304}), b'')
+    monkeypatch.setattr(YouTube_API, 'send_with_retries', send_with_retries)
+    errors = dict(YouTube_API.API_ERRORS.values)
+
+    results = asyncio.run(YouTube_API.execute_batch_request(YouTube_API.DATA_API, 'videos.list', [({'part': 'snippet', 'id': 'a'}, {'If-None-Match': 'etag'})]))
+    assert YouTube_API.is_not_modified(results[0])
+    assert YouTube_API.API_ERRORS.values == errors
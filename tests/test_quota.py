@@ -0,0 +1,15 @@
+import asyncio, threading
+
+import YouTube_API
+
+def test_rollover_loads_off_the_event_loop(monkeypatch):
+    quota = YouTube_API.QUOTA
+    quota.refresh()
+    loads = []
+    load = quota.load
+    monkeypatch.setattr(quota.target, 'load', lambda day: loads.append(threading.current_thread()) or load(day))
+    monkeypatch.setattr(quota.target, 'day', '2000-01-01')
+
+    asyncio.run(YouTube_API.check_quota(YouTube_API.ANALYTICS_API, 'reports.query'))
+    assert loads and loads[0] is not threading.main_thread()
+    assert not quota.stale()
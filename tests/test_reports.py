@@ -0,0 +1,15 @@
+from reports                        import NO_DATA, REPORTS, ReportResult, RowSet
+
+def test_card_report_without_rows():
+    rows = RowSet.from_response({'columnHeaders': [{'name': metric} for metric in REPORTS['stats'].metrics.split(',')]})
+    result = ReportResult(REPORTS['stats'], rows, '2024-01-01', '2024-01-31')
+    assert result.embed.description == NO_DATA
+    assert not result.embed.fields
+    assert result.text.endswith(NO_DATA)
+
+def test_card_report():
+    metrics = REPORTS['stats'].metrics.split(',')
+    response = {'columnHeaders': [{'name': metric, 'dataType': 'FLOAT'} for metric in metrics], 'rows': [[10.0] * len(metrics)]}
+    result = ReportResult(REPORTS['stats'], RowSet.from_response(response), '2024-01-01', '2024-01-31')
+    assert result.embed.fields[0].name == 'Views'
+    assert 'Net Subscribers:\t0' in result.text
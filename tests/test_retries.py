@@ -0,0 +1,24 @@
+import asyncio
+import requests
+
+import YouTube_API
+from rate_limit                     import is_transient
+
+def test_network_errors_are_transient():
+    for error in (requests.exceptions.ConnectionError('reset'), requests.exceptions.ReadTimeout('slow'),
+                  requests.exceptions.ChunkedEncodingError('cut'), ConnectionResetError(), TimeoutError()):
+        assert is_transient(error)
+    assert not is_transient(ValueError('bad'))
+
+def test_dropped_connection_is_retried(monkeypatch):
+    attempts = []
+    async def run_in_pool(function, *args):
+        attempts.append(args)
+        if len(attempts) == 1: raise requests.exceptions.ConnectionError('Connection aborted.')
+        return {'rows': []}
+    monkeypatch.setattr(YouTube_API, 'run_in_pool', run_in_pool)
+    monkeypatch.setattr(YouTube_API, 'backoff', lambda attempt: 0)
+
+    response = asyncio.run(YouTube_API.send_with_retries(YouTube_API.ANALYTICS_API, YouTube_API.run_metered_request, 'reports.query', {}, None))
+    assert response == {'rows': []}
+    assert len(attempts) == 2